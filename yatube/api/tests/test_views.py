@@ -0,0 +1,131 @@
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post, User
+
+
+class ApiViewsTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='api_user')
+        self.group = Group.objects.create(
+            title='Группа для API',
+            slug='api-slug',
+            description='Описание группы для API',
+        )
+        Post.objects.bulk_create([
+            Post(author=self.user, text=f'Пост для API {i}', group=self.group)
+            for i in range(settings.POSTS_PER_PAGE + 3)
+        ])
+        self.post = Post.objects.first()
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий для API'
+        )
+        cache.clear()
+        self.guest_client = Client()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_feeds(self):
+        """Проверяем ленты и переход по курсору"""
+        urls = [
+            reverse('api:index'),
+            reverse('api:group_list', kwargs={'slug': self.group.slug}),
+            reverse('api:profile', kwargs={'username': self.user.username}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.guest_client.get(url).json()
+                self.assertEqual(
+                    len(data['results']), settings.POSTS_PER_PAGE
+                )
+                self.assertEqual(data['results'][0]['id'], self.post.pk)
+                self.assertIsNone(data['previous'])
+                data = self.guest_client.get(data['next']).json()
+                self.assertEqual(len(data['results']), 3)
+                self.assertIsNone(data['next'])
+
+    def test_post_detail(self):
+        """Проверяем пост с комментариями"""
+        data = self.guest_client.get(
+            reverse('api:post_detail', kwargs={'post_id': self.post.pk})
+        ).json()
+        self.assertEqual(data['author'], self.user.username)
+        self.assertEqual(data['group'], self.group.slug)
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']],
+            ['Комментарий для API'],
+        )
+
+    def test_not_modified(self):
+        """Повторный запрос с ETag получает 304 без запросов к базе"""
+        url = reverse('api:index')
+        response = self.guest_client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(len(queries), 0)
+
+    def test_changes_reset_etag(self):
+        """Новый пост и новый комментарий меняют ETag"""
+        detail_url = reverse(
+            'api:post_detail', kwargs={'post_id': self.post.pk}
+        )
+        urls_changes = {
+            reverse('api:index'): lambda: Post.objects.create(
+                author=self.user, text='Новый пост'
+            ),
+            detail_url: lambda: Comment.objects.create(
+                post=self.post, author=self.user, text='Еще один'
+            ),
+        }
+        for url, change in urls_changes.items():
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)['ETag']
+                change()
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_profile_etag_per_author(self):
+        """
+        ETag профиля меняет пост его автора, а не пост другого автора,
+        и новый автор сразу виден по своему адресу
+        """
+        url = reverse('api:profile', kwargs={'username': self.user.username})
+        etag = self.guest_client.get(url)['ETag']
+        other = User.objects.create_user(username='api_other')
+        Post.objects.create(author=other, text='Пост другого автора')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        Post.objects.create(author=self.user, text='Пост автора')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        newcomer_url = reverse(
+            'api:profile', kwargs={'username': 'api_newcomer'}
+        )
+        self.assertEqual(
+            self.guest_client.get(newcomer_url).status_code,
+            HTTPStatus.NOT_FOUND,
+        )
+        User.objects.create_user(username='api_newcomer')
+        self.assertEqual(
+            self.guest_client.get(newcomer_url).status_code, HTTPStatus.OK
+        )
+
+    def test_read_only(self):
+        """API не принимает запросы на запись"""
+        response = self.guest_client.post(reverse('api:index'))
+        self.assertEqual(
+            response.status_code, HTTPStatus.METHOD_NOT_ALLOWED
+        )
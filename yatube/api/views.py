@@ -0,0 +1,103 @@
+"""
+JSON API лент только для чтения.
+
+ETag и Last-Modified считаются по счетчикам поколений из
+posts.caching, поэтому повторный запрос с If-None-Match или
+If-Modified-Since получает 304, не обращаясь к базе.
+"""
+from django.conf import settings
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_safe
+
+from posts import caching
+from posts.models import Group, Post, User
+from posts.utils import KeysetPaginator, paginate_comments
+
+JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+
+def conditional(scopes):
+    """Ответы API не зависят от пользователя"""
+    def decorator(view):
+        return require_safe(caching.conditional(scopes, per_user=False)(view))
+    return decorator
+
+
+def serialize_post(post):
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'pub_date': post.pub_date.isoformat(),
+        'author': post.author.username,
+        'group': post.group.slug if post.group else None,
+        'image': post.image.url if post.image else None,
+    }
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.pk,
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+        'author': comment.author.username,
+    }
+
+
+def _page_url(request, name, cursor):
+    if cursor is None:
+        return None
+    return request.build_absolute_uri(f'{request.path}?{name}={cursor}')
+
+
+def feed_response(request, post_list):
+    """Страница ленты с курсорами соседних страниц"""
+    page = KeysetPaginator(
+        post_list.select_related('author', 'group'),
+        settings.POSTS_PER_PAGE,
+    ).page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return JsonResponse(
+        {
+            'results': [serialize_post(post) for post in page],
+            'next': _page_url(request, 'after', page.next_cursor),
+            'previous': _page_url(request, 'before', page.previous_cursor),
+        },
+        json_dumps_params=JSON_PARAMS,
+    )
+
+
+@conditional(lambda: [caching.INDEX_SCOPE])
+def index(request):
+    return feed_response(request, Post.objects.all())
+
+
+@conditional(lambda slug: [caching.group_scope(slug)])
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(request, group.posts.all())
+
+
+@conditional(lambda username: [caching.author_scope(username)])
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return feed_response(request, author.posts.all())
+
+
+@conditional(lambda post_id: [caching.post_scope(post_id)])
+def post_detail(request, post_id):
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id
+    )
+    comments = paginate_comments(
+        post.comments.select_related('author'),
+        request.GET.get('comments_after'),
+    )
+    data = serialize_post(post)
+    data['comments'] = [serialize_comment(comment) for comment in comments]
+    data['comments_next'] = _page_url(
+        request, 'comments_after', comments.next_cursor
+    )
+    return JsonResponse(data, json_dumps_params=JSON_PARAMS)
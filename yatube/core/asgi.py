@@ -0,0 +1,161 @@
+"""
+ASGI-обертка над WSGI-приложением Django.
+
+Django 2.2 не умеет ни ASGI, ни асинхронных view, поэтому запрос
+целиком выполняется синхронно в пуле потоков. Тело запроса читает цикл
+событий сервера, так что медленная загрузка держит только сокет. Тело
+больше FILE_UPLOAD_MAX_MEMORY_SIZE по пути записывается во временный
+файл, как и в WSGI-сервере. Ответ поток пула отдает кусками по мере
+того, как их выдает Django: потоковые ответы не собираются в памяти,
+а поток ждет, пока сервер примет очередной кусок.
+"""
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+# Ответ отдается клиенту кусками такого размера
+CHUNK_SIZE = 64 * 1024
+
+
+def _latin1(value):
+    """WSGI передает байты строками latin-1"""
+    return value.decode('latin1')
+
+
+def make_environ(scope, body):
+    """WSGI environ для HTTP-запроса scope с телом в файле body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    path = scope.get('raw_path') or scope['path'].encode()
+    root_path = scope.get('root_path', '').encode()
+    if path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': _latin1(root_path),
+        'PATH_INFO': _latin1(path.split(b'?', 1)[0]),
+        'QUERY_STRING': _latin1(scope.get('query_string', b'')),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': str(client[0]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = _latin1(name).upper().replace('-', '_')
+        value = _latin1(value)
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        if name in environ:
+            value = f'{environ[name]},{value}'
+        environ[name] = value
+    return environ
+
+
+class ASGIHandler:
+    """
+    ASGI-приложение, которое выполняет application в пуле из
+    max_workers потоков. Тело запроса больше spool_size байт
+    хранится во временном файле
+    """
+
+    def __init__(self, application, max_workers=None, spool_size=None):
+        self.application = application
+        self.executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix='asgi'
+        )
+        self.spool_size = spool_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Тип соединения {scope["type"]} не поддержан')
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+        with body:
+            await loop.run_in_executor(
+                self.executor, self.run, make_environ(scope, body),
+                send, loop,
+            )
+
+    async def read_body(self, receive):
+        """Файл с телом запроса или None, если клиент отключился"""
+        body = tempfile.SpooledTemporaryFile(
+            max_size=self.spool_size or settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                body.seek(0)
+                return body
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def run(self, environ, send, loop):
+        """
+        Выполняет WSGI-приложение в потоке пула и отправляет ответ
+        через цикл событий loop по мере чтения. close() ответа
+        отправляет request_finished, и соединения с базой
+        закрываются в том же потоке
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin1'), value.encode('latin1'))
+                for name, value in headers
+            ]
+
+        def send_message(message):
+            # Ждем отправки: так медленный клиент не копит ответ в памяти
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def send_start():
+            if not response.get('started'):
+                response['started'] = True
+                send_message({
+                    'type': 'http.response.start',
+                    'status': response['status'],
+                    'headers': response['headers'],
+                })
+
+        result = self.application(environ, start_response)
+        try:
+            for chunk in result:
+                send_start()
+                for start in range(0, len(chunk), CHUNK_SIZE):
+                    send_message({
+                        'type': 'http.response.body',
+                        'body': chunk[start:start + CHUNK_SIZE],
+                        'more_body': True,
+                    })
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        send_start()
+        send_message({'type': 'http.response.body'})
@@ -0,0 +1,17 @@
+"""
+SQLite с настраиваемым началом транзакций.
+
+transaction.atomic открывает транзакцию через BEGIN DEFERRED, и она
+сначала берет блокировку чтения. Если затем в ней пишут, а базу уже
+заняла другая запись, SQLite сразу отвечает "database is locked", не
+дожидаясь timeout: на таблицах с триггерами FTS5 так падает почти
+каждая одновременная запись. TRANSACTION_MODE = 'IMMEDIATE' берет
+блокировку записи в самом BEGIN, и тогда вторая запись ждет очереди.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict.get('TRANSACTION_MODE')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
@@ -0,0 +1,255 @@
+"""
+Кэш в файле SQLite, общий для всех процессов на одной машине.
+
+В отличие от LocMemCache записи видят все воркеры gunicorn, а значит
+и сброс кэша доходит до каждого. Целые числа хранятся как есть, поэтому
+incr выполняется одним UPDATE внутри транзакции. При переполнении
+вытесняются записи, к которым дольше всего не обращались (LRU).
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+'''
+
+# Время последнего обращения обновляется не чаще раза в секунду,
+# чтобы чтение не превращалось в запись
+ACCESS_RESOLUTION = 1.0
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5.0)
+        self._cull_every = int(options.get('CULL_EVERY', 100))
+        self._local = threading.local()
+        self._sets = 0
+
+    def _connection(self):
+        """Отдельное соединение на каждый поток каждого процесса"""
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    def _write(self, statements):
+        """Выполняет statements (sql, params) одной транзакцией"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            cursors = [
+                connection.execute(sql, params) for sql, params in statements
+            ]
+            rowcounts = [cursor.rowcount for cursor in cursors]
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return rowcounts
+
+    @staticmethod
+    def _dump(value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _fetch(self, keys):
+        """{key: value} живых записей, обновляет время обращения"""
+        now = time.time()
+        found = {}
+        stale = []
+        for offset in range(0, len(keys), 500):
+            chunk = keys[offset:offset + 500]
+            rows = self._connection().execute(
+                'SELECT key, value, accessed FROM cache '
+                'WHERE key IN ({}) AND (expires IS NULL OR expires > ?)'
+                .format(', '.join('?' * len(chunk))),
+                (*chunk, now),
+            )
+            for key, value, accessed in rows:
+                found[key] = self._load(value)
+                if accessed < now - ACCESS_RESOLUTION:
+                    stale.append(key)
+        if stale:
+            self._write([
+                ('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+                for key in stale
+            ])
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys_map = {self.make_key(key, version=version): key for key in keys}
+        for key in keys_map:
+            self.validate_key(key)
+        found = self._fetch(list(keys_map))
+        return {keys_map[key]: value for key, value in found.items()}
+
+    def _set_statement(self, key, value, timeout, now):
+        return (
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)',
+            (key, self._dump(value), self.get_backend_timeout(timeout), now),
+        )
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write([self._set_statement(key, value, timeout, time.time())])
+        self._maybe_cull()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        statements = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            statements.append(self._set_statement(key, value, timeout, now))
+        if statements:
+            self._write(statements)
+            self._maybe_cull()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        rowcounts = self._write([
+            ('DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now)),
+            (
+                'INSERT OR IGNORE INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)',
+                (key, self._dump(value), expires, now),
+            ),
+        ])
+        added = bool(rowcounts[1])
+        if added:
+            self._maybe_cull()
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            updated = connection.execute(
+                'UPDATE cache SET value = value + ?, accessed = ? '
+                "WHERE key = ? AND typeof(value) = 'integer' "
+                'AND (expires IS NULL OR expires > ?)',
+                (delta, now, key, now),
+            ).rowcount
+            value = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, now),
+            ).fetchone()
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        if value is None:
+            raise ValueError("Key '%s' not found" % key)
+        if not updated:
+            # Как в LocMemCache и DatabaseCache, где value + delta
+            # для нечисла падает с TypeError
+            raise TypeError("Value of key '%s' is not an integer" % key)
+        return value[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        return bool(self._write([(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now),
+        )])[0])
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write([('DELETE FROM cache WHERE key = ?', (key,))])
+
+    def delete_many(self, keys, version=None):
+        statements = []
+        for key in keys:
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            statements.append(('DELETE FROM cache WHERE key = ?', (key,)))
+        if statements:
+            self._write(statements)
+
+    def clear(self):
+        self._write([('DELETE FROM cache', ())])
+
+    def _maybe_cull(self):
+        """
+        Раз в CULL_EVERY записей удаляет просроченные записи и,
+        если записей больше MAX_ENTRIES, самые давно читанные
+        """
+        self._sets += 1
+        if self._sets % self._cull_every:
+            return
+        now = time.time()
+        self._write([
+            ('DELETE FROM cache WHERE expires <= ?', (now,)),
+            (
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY accessed LIMIT max(0, '
+                '(SELECT COUNT(*) FROM cache) - ?))',
+                (self._max_entries,),
+            ),
+        ])
+
+    def close(self, **kwargs):
+        """Соединения живут дольше запроса: их открытие дороже чтения"""
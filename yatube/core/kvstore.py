@@ -0,0 +1,140 @@
+"""
+Хранилище метаданных миниатюр sorl в файле SQLite.
+
+Стандартное хранилище sorl читает каждую запись через кэш Django,
+а при промахе идет в базу: с LocMemCache кэш пуст в каждом новом
+воркере, и каждый тег {% thumbnail %} становится запросом к базе.
+Здесь записи лежат в отдельном файле, общем для всех процессов,
+и рядом с ключом хранится ключ исходной картинки. Поэтому страница
+может одним запросом загрузить записи всех своих картинок
+(preloaded), и теги внутри блока не обращаются к файлу вовсе.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import KVStoreBase, del_prefix
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS kvstore (
+    key TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS kvstore_source ON kvstore (source);
+'''
+
+# Не больше параметров в одном запросе, чем позволяет SQLite
+CHUNK_SIZE = 500
+
+
+class SQLiteKVStore(KVStoreBase):
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    def _connection(self):
+        """Отдельное соединение на каждый поток каждого процесса"""
+        path = settings.THUMBNAIL_KVSTORE_PATH
+        key = (os.getpid(), path)
+        if getattr(self._local, 'key', None) != key:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                path,
+                timeout=settings.THUMBNAIL_KVSTORE_BUSY_TIMEOUT,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.key = key
+        return self._local.connection
+
+    def _preloaded(self):
+        return getattr(self._local, 'preloaded', None)
+
+    @contextmanager
+    def preloaded(self, sources):
+        """
+        Загружает записи картинок с ключами sources и их миниатюр одним
+        запросом на CHUNK_SIZE картинок. Внутри блока get берет их из памяти
+        """
+        sources = list(set(sources))
+        found = {}
+        for offset in range(0, len(sources), CHUNK_SIZE):
+            chunk = sources[offset:offset + CHUNK_SIZE]
+            found.update(self._connection().execute(
+                'SELECT key, value FROM kvstore WHERE source IN ({})'
+                .format(', '.join('?' * len(chunk))),
+                chunk,
+            ))
+        previous = self._preloaded()
+        self._local.preloaded = found
+        try:
+            yield
+        finally:
+            self._local.preloaded = previous
+
+    def set(self, image_file, source=None):
+        # Записи миниатюры и списка миниатюр относятся к ее источнику
+        self._local.source = (source or image_file).key
+        try:
+            super().set(image_file, source)
+        finally:
+            self._local.source = None
+
+    def _get_raw(self, key):
+        preloaded = self._preloaded()
+        if preloaded is not None and key in preloaded:
+            return preloaded[key]
+        row = self._connection().execute(
+            'SELECT value FROM kvstore WHERE key = ?', (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_raw(self, key, value):
+        source = getattr(self._local, 'source', None) or del_prefix(key)
+        self._connection().execute(
+            'INSERT OR REPLACE INTO kvstore (key, source, value) '
+            'VALUES (?, ?, ?)',
+            (key, source, value),
+        )
+        preloaded = self._preloaded()
+        if preloaded is not None:
+            preloaded[key] = value
+
+    def _delete_raw(self, *keys):
+        self._connection().executemany(
+            'DELETE FROM kvstore WHERE key = ?', [(key,) for key in keys]
+        )
+        preloaded = self._preloaded()
+        if preloaded is not None:
+            for key in keys:
+                preloaded.pop(key, None)
+
+    def _find_keys_raw(self, prefix):
+        rows = self._connection().execute(
+            'SELECT key FROM kvstore WHERE substr(key, 1, ?) = ?',
+            (len(prefix), prefix),
+        )
+        return [key for key, in rows]
+
+
+def preloaded(files):
+    """
+    Блок, в котором записи sorl картинок files и их миниатюр уже
+    загружены. С другими хранилищами sorl ничего не делает
+    """
+    if not hasattr(default.kvstore, 'preloaded'):
+        return nullcontext()
+    return default.kvstore.preloaded(
+        ImageFile(file).key for file in files if file
+    )
@@ -0,0 +1,117 @@
+import json
+import multiprocessing
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'core.cache.SQLiteCache',
+}
+LOCATIONS = {
+    'locmem': lambda directory: 'bench',
+    'file': lambda directory: directory,
+    'sqlite': lambda directory: f'{directory}/cache.sqlite3',
+}
+COUNTER = 'bench:counter'
+
+
+def run_worker(backend, location, ops, keys, seed):
+    """
+    Нагрузка одного процесса: чтение с заполнением при промахе,
+    запись и атомарное увеличение общего счетчика
+    """
+    cache = import_string(BACKENDS[backend])(
+        location, {'OPTIONS': {'MAX_ENTRIES': keys * 2}}
+    )
+    generator = random.Random(seed)
+    gets = hits = incrs = 0
+    started = time.perf_counter()
+    for _ in range(ops):
+        key = f'bench:{generator.randrange(keys)}'
+        dice = generator.random()
+        if dice < 0.8:
+            gets += 1
+            if cache.get(key) is None:
+                cache.set(key, key * 8, 300)
+            else:
+                hits += 1
+        elif dice < 0.95:
+            cache.set(key, key * 8, 300)
+        else:
+            cache.add(COUNTER, 0, None)
+            cache.incr(COUNTER)
+            incrs += 1
+    return {
+        'elapsed': time.perf_counter() - started,
+        'gets': gets,
+        'hits': hits,
+        'incrs': incrs,
+        'counter': cache.get(COUNTER),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает бэкенды кэша под нагрузкой из нескольких процессов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--ops', type=int, default=5000,
+                            help='Операций на процесс')
+        parser.add_argument('--keys', type=int, default=1000,
+                            help='Размер пространства ключей')
+        parser.add_argument('--backends', default=','.join(BACKENDS),
+                            help='Через запятую: ' + ', '.join(BACKENDS))
+        parser.add_argument('--json', help='Файл для результатов')
+
+    def bench(self, backend, options):
+        context = multiprocessing.get_context('fork')
+        with tempfile.TemporaryDirectory() as directory:
+            location = LOCATIONS[backend](directory)
+            jobs = [
+                (backend, location, options['ops'], options['keys'], seed)
+                for seed in range(options['processes'])
+            ]
+            with context.Pool(options['processes']) as pool:
+                results = pool.starmap(run_worker, jobs)
+        elapsed = max(result['elapsed'] for result in results)
+        gets = sum(result['gets'] for result in results)
+        return {
+            'backend': backend,
+            'processes': options['processes'],
+            'ops_per_second': round(
+                options['ops'] * options['processes'] / elapsed
+            ),
+            'hit_rate': round(
+                sum(result['hits'] for result in results) / (gets or 1), 3
+            ),
+            'increments': sum(result['incrs'] for result in results),
+            'counter_seen': max(
+                result['counter'] or 0 for result in results
+            ),
+        }
+
+    def handle(self, *args, **options):
+        results = [
+            self.bench(backend, options)
+            for backend in options['backends'].split(',')
+        ]
+        self.stdout.write(
+            f'{"backend":<8} {"ops/s":>10} {"hit rate":>9} '
+            f'{"incr":>7} {"counter":>8}'
+        )
+        for result in results:
+            self.stdout.write(
+                f'{result["backend"]:<8} {result["ops_per_second"]:>10} '
+                f'{result["hit_rate"]:>9} {result["increments"]:>7} '
+                f'{result["counter_seen"]:>8}'
+            )
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump(results, file, indent=2)
@@ -0,0 +1,158 @@
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import (OperationalError, close_old_connections, connections,
+                       transaction)
+
+from posts.models import Post, User
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def run_worker(alias, role, duration, posts, seed):
+    """
+    Нагрузка одного процесса: запросы страниц ленты или новые посты.
+    Каждая операция обрамлена как запрос: соединение закрывается после
+    нее, если профиль не держит его открытым
+    """
+    generator = random.Random(seed)
+    timings = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        close_old_connections()
+        started = time.perf_counter()
+        try:
+            if role == 'read':
+                offset = generator.randrange(max(1, posts - 10))
+                list(
+                    Post.objects.using(alias).for_feed()[offset:offset + 10]
+                )
+            else:
+                with transaction.atomic(using=alias):
+                    Post.objects.using(alias).create(
+                        author_id=1, text=f'Пост из замера {seed}'
+                    )
+        except OperationalError:
+            errors += 1
+            continue
+        timings.append(time.perf_counter() - started)
+    close_old_connections()
+    return {'role': role, 'timings': timings, 'errors': errors}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает профили базы SQLite под одновременным чтением '
+        'и записью из нескольких процессов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5,
+                            help='Секунд нагрузки на профиль')
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument(
+            '--profiles', default=','.join(settings.DATABASE_PROFILES),
+            help='Через запятую: ' + ', '.join(settings.DATABASE_PROFILES),
+        )
+        parser.add_argument('--json', help='Файл для результатов')
+
+    def use_database(self, alias, name, profile=None):
+        """Подключает базу name под именем alias с настройками profile"""
+        connections.close_all()
+        connections.databases[alias] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': name,
+            **settings.DATABASE_PROFILES.get(profile, {}),
+        }
+        connections.ensure_defaults(alias)
+        connections.prepare_test_settings(alias)
+
+    def prepare(self, name, posts):
+        """Схема и посты, общие для всех профилей"""
+        self.use_database('bench', name)
+        call_command('migrate', database='bench', verbosity=0)
+        author = User.objects.db_manager('bench').create_user('bench_author')
+        Post.objects.using('bench').bulk_create([
+            Post(author=author, text=f'Пост {number}')
+            for number in range(posts)
+        ])
+        connections.close_all()
+
+    def bench(self, template, profile, options):
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'bench.sqlite3')
+            shutil.copy(template, name)
+            alias = f'bench_{profile}'
+            self.use_database(alias, name, profile)
+            # Первое соединение переводит файл в WAL до старта процессов
+            connections[alias].ensure_connection()
+            connections.close_all()
+            jobs = [
+                (alias, role, options['duration'], options['posts'], seed)
+                for role, count in (
+                    ('read', options['readers']),
+                    ('write', options['writers']),
+                )
+                for seed in range(count)
+            ]
+            context = multiprocessing.get_context('fork')
+            with context.Pool(len(jobs)) as pool:
+                results = pool.starmap(run_worker, jobs)
+        summary = {'profile': profile}
+        for role in ('read', 'write'):
+            timings = [
+                timing * 1000
+                for result in results if result['role'] == role
+                for timing in result['timings']
+            ]
+            summary[role] = {
+                'ops_per_second': round(len(timings) / options['duration']),
+                'p50_ms': round(statistics.median(timings), 2)
+                if timings else None,
+                'p95_ms': round(percentile(timings, 0.95), 2)
+                if timings else None,
+                'errors': sum(
+                    result['errors'] for result in results
+                    if result['role'] == role
+                ),
+            }
+        return summary
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            template = os.path.join(directory, 'template.sqlite3')
+            self.prepare(template, options['posts'])
+            results = [
+                self.bench(template, profile, options)
+                for profile in options['profiles'].split(',')
+            ]
+        self.stdout.write(
+            f'{"profile":<11} {"role":<6} {"ops/s":>7} {"p50, ms":>8} '
+            f'{"p95, ms":>8} {"errors":>7}'
+        )
+        for result in results:
+            for role in ('read', 'write'):
+                row = result[role]
+                self.stdout.write(
+                    f'{result["profile"]:<11} {role:<6} '
+                    f'{row["ops_per_second"]:>7} {str(row["p50_ms"]):>8} '
+                    f'{str(row["p95_ms"]):>8} {row["errors"]:>7}'
+                )
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump(results, file, indent=2)
@@ -0,0 +1,89 @@
+import glob
+import json
+import statistics
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.slow_queries import normalize
+
+SORT_KEYS = {'total': 'total_ms', 'count': 'count', 'max': 'max_ms'}
+
+
+class Command(BaseCommand):
+    help = 'Сводит журнал медленных запросов по форме запроса'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            help='Файлы журнала (по умолчанию SLOW_QUERY_LOG_FILE '
+                 'вместе с ротированными копиями)',
+        )
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument(
+            '--sort',
+            choices=SORT_KEYS,
+            default='total',
+        )
+        parser.add_argument('--json', help='Файл для сводки')
+
+    def paths(self, options):
+        if options['paths']:
+            return options['paths']
+        if not settings.SLOW_QUERY_LOG_FILE:
+            raise CommandError('Не задан SLOW_QUERY_LOG_FILE')
+        return sorted(glob.glob(f'{settings.SLOW_QUERY_LOG_FILE}*'))
+
+    def records(self, paths):
+        for path in paths:
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+    def aggregate(self, records):
+        shapes = {}
+        for record in records:
+            shape = shapes.setdefault(normalize(record['sql']), {
+                'durations': [],
+                'views': set(),
+                'example': record,
+            })
+            shape['durations'].append(record['duration_ms'])
+            if record['view']:
+                shape['views'].add(record['view'])
+            if record['duration_ms'] > shape['example']['duration_ms']:
+                shape['example'] = record
+        return [
+            {
+                'query': query,
+                'count': len(shape['durations']),
+                'total_ms': round(sum(shape['durations']), 2),
+                'median_ms': round(statistics.median(shape['durations']), 2),
+                'max_ms': max(shape['durations']),
+                'views': sorted(shape['views']),
+                'slowest': shape['example'],
+            }
+            for query, shape in shapes.items()
+        ]
+
+    def handle(self, *args, **options):
+        summary = self.aggregate(self.records(self.paths(options)))
+        key = SORT_KEYS[options['sort']]
+        summary.sort(key=lambda row: row[key], reverse=True)
+        summary = summary[:options['limit']]
+        for row in summary:
+            self.stdout.write(
+                f'{row["count"]} раз, всего {row["total_ms"]} мс, '
+                f'медиана {row["median_ms"]} мс, максимум {row["max_ms"]} мс'
+            )
+            self.stdout.write(f'  views: {", ".join(row["views"]) or "-"}')
+            self.stdout.write(f'  {row["query"]}')
+            for line in row['slowest']['plan'] or ():
+                self.stdout.write(f'    {line}')
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump(summary, file, indent=2, ensure_ascii=False)
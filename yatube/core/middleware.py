@@ -0,0 +1,133 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import profiling, routers
+from .slow_queries import SlowQueryLogger
+
+logger = logging.getLogger('yatube.profiling')
+
+# Части запроса в порядке вывода в Server-Timing
+PARTS = ('sql', 'template', 'context', 'thumbnail')
+
+
+class ProfilingMiddleware:
+    """
+    Для доли запросов PROFILING_SAMPLE_RATE замеряет SQL, шаблоны,
+    контекст-процессоры и миниатюры, отдает замер в заголовке
+    Server-Timing и пишет его в лог yatube.profiling
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        profiling.install()
+
+    def __call__(self, request):
+        rate = settings.PROFILING_SAMPLE_RATE
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+        started = time.perf_counter()
+        with profiling.collect() as collector:
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        size = None if response.streaming else len(response.content)
+        response['Server-Timing'] = self.server_timing(
+            collector, total, size
+        )
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'size': size,
+            'queries': collector.counts.get('sql', 0),
+            **{
+                f'{part}_ms': round(duration * 1000, 2)
+                for part, duration in collector.durations.items()
+            },
+        }))
+        return response
+
+    def server_timing(self, collector, total, size):
+        metrics = []
+        for part in PARTS:
+            if part not in collector.durations:
+                continue
+            metric = f'{part};dur={collector.durations[part] * 1000:.2f}'
+            if part == 'sql':
+                metric += f';desc="{collector.counts[part]} queries"'
+            metrics.append(metric)
+        metrics.append(f'total;dur={total * 1000:.2f}')
+        if size is not None:
+            metrics.append(f'size;desc="{size} bytes"')
+        return ', '.join(metrics)
+
+
+class SlowQueryLogMiddleware:
+    """
+    Пишет в лог yatube.slow_queries запросы к базе дольше
+    SLOW_QUERY_THRESHOLD_MS; None выключает журнал
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if threshold is None:
+            return self.get_response(request)
+        wrapper = SlowQueryLogger(request, threshold)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            return self.get_response(request)
+
+
+class ReplicaMiddleware:
+    """
+    Отдает чтение view из REPLICA_VIEWS случайной реплике. Клиент,
+    который только что писал, REPLICA_PIN_SECONDS читает из основной
+    базы: реплика могла еще не получить его пост или комментарий.
+    Запись замечается по INSERT, UPDATE и DELETE в основной базе
+    """
+    pin_cookie = 'primary_db'
+    write_statements = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with routers.request_state() as state:
+            primary = connections[DEFAULT_DB_ALIAS]
+            with primary.execute_wrapper(self.detect_write):
+                response = self.get_response(request)
+        if state.wrote:
+            response.set_cookie(
+                self.pin_cookie,
+                '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def detect_write(self, execute, sql, params, many, context):
+        if sql.lstrip()[:7].upper().startswith(self.write_statements):
+            routers.current().wrote = True
+        return execute(sql, params, many, context)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            settings.REPLICA_DATABASES
+            and request.method in ('GET', 'HEAD')
+            and self.pin_cookie not in request.COOKIES
+            and request.resolver_match.view_name in settings.REPLICA_VIEWS
+        ):
+            routers.current().replica = random.choice(
+                settings.REPLICA_DATABASES
+            )
@@ -0,0 +1,78 @@
+"""
+Параллельное выполнение независимых запросов к базе.
+
+Каждый поток пула работает со своим соединением, поэтому запросы
+идут к базе одновременно. Внутри транзакции соседние потоки не видят
+ее изменений, и тогда функции выполняются по очереди в текущем потоке.
+Задача пула получает состояние запроса: выбранную реплику, сборщик
+профилирования и обертки execute_wrapper соединений текущего потока.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+
+from . import profiling, routers
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                settings.PARALLEL_QUERY_WORKERS,
+                thread_name_prefix='queries',
+            )
+    return _executor
+
+
+def _bind(function):
+    """function, которая выполнится с состоянием запроса текущего потока"""
+    state = routers.current()
+    collector = profiling.current()
+    wrappers = {
+        alias: list(connections[alias].execute_wrappers)
+        for alias in connections
+    }
+
+    def call():
+        with ExitStack() as stack:
+            stack.enter_context(routers.bound(state))
+            stack.enter_context(profiling.bound(collector))
+            for alias, alias_wrappers in wrappers.items():
+                for wrapper in alias_wrappers:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(wrapper)
+                    )
+            return function()
+    return call
+
+
+def _call(function):
+    try:
+        return function()
+    finally:
+        close_old_connections()
+
+
+def run(*functions):
+    """
+    Список результатов functions. Если PARALLEL_QUERIES включен,
+    первая функция выполняется в текущем потоке, остальные в пуле
+    """
+    if (
+        not settings.PARALLEL_QUERIES
+        or len(functions) < 2
+        or connection.in_atomic_block
+    ):
+        return [function() for function in functions]
+    futures = [
+        _pool().submit(_call, _bind(function)) for function in functions[1:]
+    ]
+    first = functions[0]()
+    return [first, *(future.result() for future in futures)]
@@ -0,0 +1,142 @@
+"""
+Замер времени частей обработки запроса: SQL, шаблоны, контекст-процессоры
+и миниатюры sorl.
+
+Замеряемые функции обернуты один раз при старте, но пишут время только
+в сборщик текущего потока, пока его включил ProfilingMiddleware.
+Без сборщика обертка стоит одной проверки атрибута.
+"""
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.db import connections
+from django.template.base import Template
+from django.template.context import RequestContext
+
+_local = threading.local()
+_installed = False
+
+
+class Collector:
+    """Время и число вызовов по частям одного запроса"""
+
+    def __init__(self):
+        self.durations = {}
+        self.counts = {}
+        self._depth = {}
+        # В сборщик пишут и потоки пула parallel
+        self._lock = threading.Lock()
+
+    def add(self, name, duration):
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0) + duration
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def enter(self, name):
+        """True для внешнего вызова: вложенные не считаются дважды"""
+        depth = self._depth.get(name, 0)
+        self._depth[name] = depth + 1
+        return depth == 0
+
+    def leave(self, name):
+        self._depth[name] -= 1
+
+
+def current():
+    return getattr(_local, 'collector', None)
+
+
+def timed(name, function):
+    """Обертка, которая пишет время внешних вызовов function в name"""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        collector = current()
+        if collector is None:
+            return function(*args, **kwargs)
+        outer = collector.enter(name)
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if outer:
+                collector.add(name, time.perf_counter() - started)
+            collector.leave(name)
+    return wrapper
+
+
+def _timed_bind_template(bind_template):
+    """
+    Контекст-процессоры выполняются при входе в bind_template,
+    поэтому замеряется только вход
+    """
+    @wraps(bind_template)
+    @contextmanager
+    def wrapper(self, template):
+        collector = current()
+        if collector is None:
+            with bind_template(self, template) as context:
+                yield context
+            return
+        started = time.perf_counter()
+        with bind_template(self, template) as context:
+            collector.add('context', time.perf_counter() - started)
+            yield context
+    return wrapper
+
+
+def install():
+    """Оборачивает замеряемые функции, повторный вызов ничего не делает"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    Template.render = timed('template', Template.render)
+    RequestContext.bind_template = _timed_bind_template(
+        RequestContext.bind_template
+    )
+    try:
+        from sorl.thumbnail.base import ThumbnailBackend
+    except ImportError:
+        return
+    ThumbnailBackend.get_thumbnail = timed(
+        'thumbnail', ThumbnailBackend.get_thumbnail
+    )
+
+
+def _sql_wrapper(collector):
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            collector.add('sql', time.perf_counter() - started)
+    return wrapper
+
+
+@contextmanager
+def collect():
+    """Включает сборщик для текущего потока"""
+    collector = Collector()
+    _local.collector = collector
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(_sql_wrapper(collector))
+                )
+            yield collector
+    finally:
+        _local.collector = None
+
+
+@contextmanager
+def bound(collector):
+    """Пишет время текущего потока в сборщик collector другого потока"""
+    previous = current()
+    _local.collector = collector
+    try:
+        yield collector
+    finally:
+        _local.collector = previous
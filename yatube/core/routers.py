@@ -0,0 +1,60 @@
+"""
+Чтение из реплик базы.
+
+ReplicaMiddleware выбирает реплику на запрос к view из REPLICA_VIEWS,
+а ReplicaRouter направляет туда чтение моделей из REPLICA_APPS.
+Запись, чтение внутри транзакции и все запросы вне такого HTTP-запроса
+идут в основную базу. Реплики не мигрируют: это копии основной базы.
+"""
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_local = threading.local()
+
+
+def current():
+    return getattr(_local, 'state', None)
+
+
+@contextmanager
+def request_state():
+    """Состояние одного запроса: выбранная реплика и была ли запись"""
+    state = SimpleNamespace(replica=None, wrote=False)
+    _local.state = state
+    try:
+        yield state
+    finally:
+        _local.state = None
+
+
+@contextmanager
+def bound(state):
+    """Состояние запроса state в текущем потоке, например в потоке пула"""
+    previous = current()
+    _local.state = state
+    try:
+        yield state
+    finally:
+        _local.state = previous
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = current()
+        if (
+            state is None
+            or state.replica is None
+            or model._meta.app_label not in settings.REPLICA_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return None
+        return state.replica
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
@@ -0,0 +1,102 @@
+"""
+Журнал медленных SQL-запросов.
+
+SlowQueryLogMiddleware вешает на соединения обертку, которая пишет в лог
+yatube.slow_queries каждый запрос дольше SLOW_QUERY_THRESHOLD_MS вместе
+с view, параметрами и планом EXPLAIN. Команда slow_queries сводит лог
+по форме запроса: запросы, отличающиеся только значениями, попадают
+в одну строку.
+"""
+import json
+import logging
+import re
+import threading
+import time
+
+from django.db import DatabaseError
+
+logger = logging.getLogger('yatube.slow_queries')
+
+MAX_PARAM_LENGTH = 200
+
+_local = threading.local()
+
+NORMALIZE = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+def normalize(sql):
+    """Форма запроса: значения и списки IN заменены заглушками"""
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def _param(value):
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) > MAX_PARAM_LENGTH:
+        return text[:MAX_PARAM_LENGTH] + '…'
+    return text
+
+
+def explain(connection, sql, params):
+    """План запроса SELECT или None, если план получить не удалось"""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else (
+        'EXPLAIN '
+    )
+    _local.explaining = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [
+                ' '.join(str(column) for column in row)
+                for row in cursor.fetchall()
+            ]
+    except DatabaseError:
+        return None
+    finally:
+        _local.explaining = False
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match._func_path if match else None
+
+
+class SlowQueryLogger:
+    """Обертка execute_wrapper для запросов одного HTTP-запроса"""
+
+    def __init__(self, request, threshold_ms):
+        self.request = request
+        self.threshold = threshold_ms / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, 'explaining', False):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - started
+        if duration >= self.threshold:
+            self.log(sql, params, many, context['connection'], duration)
+        return result
+
+    def log(self, sql, params, many, connection, duration):
+        logger.warning(json.dumps({
+            'time': time.time(),
+            'duration_ms': round(duration * 1000, 2),
+            'view': view_name(self.request),
+            'path': self.request.path,
+            'database': connection.alias,
+            'sql': sql,
+            'params': None if many else [
+                _param(value) for value in params or ()
+            ],
+            'plan': None if many else explain(connection, sql, params),
+        }, ensure_ascii=False))
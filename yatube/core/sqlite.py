@@ -0,0 +1,20 @@
+"""
+Настройка соединений SQLite.
+
+PRAGMA из ключа PRAGMAS настроек базы выполняются на каждом новом
+соединении: большинство из них действуют только до его закрытия.
+"""
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('PRAGMAS')
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,42 @@
+"""
+Запуск тестов с временными хранилищем миниатюр sorl и общим кэшем.
+
+Хранилище лежит в файле рядом с проектом, а его ключи не содержат
+MEDIA_ROOT. Записи, которые тесты делают для картинок во временных
+MEDIA_ROOT, пережили бы прогон, и sorl верил бы им вместо того, чтобы
+заново создать миниатюры. Поэтому на время прогона файл хранилища
+переносится во временный каталог и удаляется вместе с ним.
+
+Там же лежит файл кэша SQLite: тесты проверяют кэш лент и ETag
+в том виде, в каком они работают с несколькими воркерами.
+"""
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.directory = tempfile.mkdtemp()
+        self.override = override_settings(
+            THUMBNAIL_KVSTORE_PATH=os.path.join(
+                self.directory, 'thumbnails.sqlite3'
+            ),
+            CACHES={
+                'default': {
+                    **settings.CACHE_BACKENDS['sqlite'],
+                    'LOCATION': os.path.join(self.directory, 'cache.sqlite3'),
+                },
+            },
+        )
+        self.override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
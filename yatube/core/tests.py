@@ -1,4 +1,34 @@
-from django.test import TestCase
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+from django.db import connection, connections, transaction
+from django.db.utils import ConnectionHandler
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from sorl.thumbnail.images import ImageFile
+
+from . import parallel, profiling, routers
+from posts.models import Post, User
+
+from .asgi import ASGIHandler
+from .cache import SQLiteCache
+from .kvstore import SQLiteKVStore
+from .slow_queries import normalize
 
 
 class ViewTestClass(TestCase):
@@ -6,3 +36,479 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+def increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = f'{self.directory}/cache.sqlite3'
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_get_set_delete(self):
+        """Проверяем чтение, запись и удаление значений"""
+        values = {'int': 42, 'str': 'строка', 'dict': {'a': [1, 2]}}
+        self.cache.set_many(values)
+        self.assertEqual(self.cache.get_many(values), values)
+        self.cache.delete('str')
+        self.assertIsNone(self.cache.get('str'))
+        self.assertEqual(self.cache.get('str', 'нет'), 'нет')
+        self.cache.clear()
+        self.assertFalse(self.cache.has_key('int'))
+
+    def test_expiration_and_add(self):
+        """Проверяем истечение срока и add поверх просроченного ключа"""
+        self.cache.set('key', 'old', 0.05)
+        self.assertFalse(self.cache.add('key', 'new'))
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_incr(self):
+        """Проверяем увеличение счетчика и ошибку для пустого ключа"""
+        with self.assertRaises(ValueError):
+            self.cache.incr('counter')
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        self.assertEqual(self.cache.decr('counter'), 5)
+
+    def test_incr_not_integer(self):
+        """Проверяем, что нечисло не выдается за отсутствующий ключ"""
+        self.cache.set('text', 'не число')
+        with self.assertRaises(TypeError):
+            self.cache.incr('text')
+        self.assertEqual(self.cache.get('text'), 'не число')
+        self.cache.set('counter', 1, 0.05)
+        time.sleep(0.1)
+        with self.assertRaises(ValueError):
+            self.cache.incr('counter')
+
+    def test_incr_shared_between_processes(self):
+        """Проверяем, что увеличения из разных процессов не теряются"""
+        self.cache.set('counter', 0, None)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=increment, args=(self.location, 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
+    def test_lru_cull(self):
+        """Проверяем вытеснение давно не читанных записей"""
+        cache = SQLiteCache(self.location, {
+            'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_EVERY': 1},
+        })
+        cache.set('old', 1)
+        for key in ('a', 'b'):
+            cache.set(key, 1)
+        time.sleep(1.1)
+        cache.get('old')
+        cache.set('c', 1)
+        self.assertTrue(cache.has_key('old'))
+        self.assertFalse(cache.has_key('a'))
+        self.assertTrue(cache.has_key('c'))
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_server_timing(self):
+        """Проверяем заголовок Server-Timing и запись в лог"""
+        with self.assertLogs('yatube.profiling') as logs:
+            response = self.client.get('/')
+        timing = response['Server-Timing']
+        for metric in ('sql;dur=', 'template;dur=', 'context;dur=',
+                       'total;dur=', 'queries', 'bytes'):
+            with self.subTest(metric=metric):
+                self.assertIn(metric, timing)
+        self.assertIn('"path": "/"', logs.output[0])
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_sampling_off(self):
+        """Без выборки запрос не замеряется"""
+        response = self.client.get('/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_normalize(self):
+        """Запросы, отличающиеся значениями, имеют одну форму"""
+        self.assertEqual(
+            normalize("SELECT * FROM t WHERE a IN (%s, %s) AND b = 'x'\n"
+                      'LIMIT 10'),
+            normalize('SELECT * FROM t WHERE a IN (%s) AND b = %s LIMIT 20'),
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_logged(self):
+        """Запросы view попадают в лог вместе с планом и сводятся командой"""
+        with self.assertLogs('yatube.slow_queries') as logs:
+            self.client.get('/')
+        records = [
+            json.loads(output.split(':', 2)[2]) for output in logs.output
+        ]
+        views = {record['view'] for record in records}
+        self.assertIn('posts.views.index', views)
+        selects = [
+            record for record in records
+            if record['sql'].startswith('SELECT')
+            and record['view'] == 'posts.views.index'
+        ]
+        self.assertTrue(selects)
+        if connection.vendor == 'sqlite':
+            self.assertTrue(all(record['plan'] for record in selects))
+        with tempfile.NamedTemporaryFile('w', suffix='.log') as log:
+            log.write('\n'.join(json.dumps(record) for record in records))
+            log.flush()
+            output = StringIO()
+            call_command('slow_queries', log.name, stdout=output)
+        self.assertIn('posts.views.index', output.getvalue())
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=None)
+    def test_slow_query_log_off(self):
+        """Без порога журнал не пишется"""
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('yatube.slow_queries'):
+                self.client.get('/')
+
+
+class ASGIHandlerTests(SimpleTestCase):
+    def request(self, path, query=b''):
+        handler = ASGIHandler(get_wsgi_application(), max_workers=2)
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': query,
+            'headers': [(b'host', b'testserver')],
+        }
+        asyncio.run(handler(scope, receive, send))
+        handler.executor.shutdown()
+        return messages
+
+    def test_wsgi_response(self):
+        """Ответ WSGI-приложения передается сообщениями ASGI"""
+        start, *body = self.request('/about/tech/', b'x=1')
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/html; charset=utf-8'),
+                      start['headers'])
+        self.assertIn('Технологии', b''.join(
+            message.get('body', b'') for message in body
+        ).decode())
+        self.assertFalse(body[-1].get('more_body'))
+
+    def test_not_found(self):
+        start, *_ = self.request('/unknown/page/')
+        self.assertEqual(start['status'], 404)
+
+    def serve(self, application, chunks=(), messages=None, **kwargs):
+        """
+        Выполняет application с телом запроса из chunks,
+        возвращает отправленные сообщения
+        """
+        handler = ASGIHandler(application, max_workers=1, **kwargs)
+        messages = [] if messages is None else messages
+        incoming = [
+            {'type': 'http.request', 'body': chunk, 'more_body': True}
+            for chunk in chunks
+        ] + [{'type': 'http.request', 'body': b''}]
+
+        async def receive():
+            return incoming.pop(0)
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/'}
+        asyncio.run(handler(scope, receive, send))
+        handler.executor.shutdown()
+        return messages
+
+    def test_large_body_spooled_to_disk(self):
+        """Большое тело запроса читается из временного файла"""
+        received = {}
+
+        def application(environ, start_response):
+            body = environ['wsgi.input']
+            received['on_disk'] = body._rolled
+            received['body'] = body.read()
+            start_response('200 OK', [])
+            return [b'']
+
+        self.serve(application, [b'x' * 10, b'y' * 10], spool_size=15)
+        self.assertTrue(received['on_disk'])
+        self.assertEqual(received['body'], b'x' * 10 + b'y' * 10)
+
+    def test_streaming_response(self):
+        """Куски потокового ответа уходят клиенту, пока ответ пишется"""
+        messages = []
+        sent_before_second = []
+
+        def application(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            yield b'first'
+            sent_before_second.extend(
+                message.get('body') for message in messages
+            )
+            yield b'second'
+
+        start, *body = self.serve(application, messages=messages)
+        self.assertEqual(start['status'], 200)
+        self.assertEqual(sent_before_second, [None, b'first'])
+        self.assertEqual(
+            [message.get('body') for message in body],
+            [b'first', b'second', None],
+        )
+
+
+class ParallelQueriesTests(TransactionTestCase):
+    def run_threads(self):
+        return parallel.run(
+            lambda: threading.current_thread().name,
+            lambda: threading.current_thread().name,
+        )
+
+    @override_settings(PARALLEL_QUERIES=True)
+    def test_run_in_pool(self):
+        """Все функции, кроме первой, выполняются в пуле"""
+        first, second = self.run_threads()
+        self.assertEqual(first, threading.current_thread().name)
+        self.assertTrue(second.startswith('queries'))
+
+    @override_settings(PARALLEL_QUERIES=True)
+    def test_atomic_block_runs_inline(self):
+        """В транзакции потоки пула не увидели бы ее изменений"""
+        with transaction.atomic():
+            first, second = self.run_threads()
+        self.assertEqual(first, second)
+
+    def test_disabled(self):
+        first, second = self.run_threads()
+        self.assertEqual(first, second)
+
+    @override_settings(PARALLEL_QUERIES=True)
+    def test_request_state_in_pool(self):
+        """Задача пула видит реплику, сборщик и обертки запросов"""
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append(threading.current_thread().name)
+            return execute(sql, params, many, context)
+
+        def task():
+            Post.objects.exists()
+            return routers.current(), profiling.current()
+
+        with routers.request_state() as state:
+            with profiling.collect() as collector:
+                with connection.execute_wrapper(record):
+                    _, (task_state, task_collector) = parallel.run(
+                        lambda: 0, task
+                    )
+        self.assertIs(task_state, state)
+        self.assertIs(task_collector, collector)
+        self.assertEqual(collector.counts['sql'], 1)
+        self.assertTrue(queries[0].startswith('queries'))
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.connections = ConnectionHandler({
+            'default': {
+                'NAME': f'{self.directory}/db.sqlite3',
+                **settings.DATABASE_PROFILES['production'],
+            },
+        })
+        self.connection = self.connections['default']
+
+    def tearDown(self):
+        self.connections.close_all()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def pragma(self, name):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        """PRAGMA профиля выполняются на новом соединении"""
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('cache_size'), -64 * 1024)
+
+    def test_immediate_transaction(self):
+        """Транзакция atomic сразу берет блокировку записи"""
+        statements = []
+        self.connection.ensure_connection()
+        self.connection.connection.set_trace_callback(statements.append)
+        # Так транзакцию начинает transaction.atomic
+        self.connection.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True
+        )
+        self.connection.rollback()
+        self.connection.set_autocommit(True)
+        self.assertIn('BEGIN IMMEDIATE', statements)
+
+
+@override_settings(REPLICA_DATABASES=['replica_test'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """Основная база в памяти, реплика в отдельном файле SQLite"""
+    databases = {'default', 'replica_test'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.replica = f'{cls.directory}/replica.sqlite3'
+        connections.databases['replica_test'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': cls.replica,
+        }
+        connections.ensure_defaults('replica_test')
+        connections.prepare_test_settings('replica_test')
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica_test'].close()
+        del connections.databases['replica_test']
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='replica_user')
+        self.replicated = Post.objects.create(
+            author=self.user, text='Пост есть в реплике'
+        )
+        self.replicate()
+
+        self.fresh = Post.objects.create(
+            author=self.user, text='Пост еще не в реплике'
+        )
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def replicate(self):
+        connections['replica_test'].close()
+        connection.ensure_connection()
+        target = sqlite3.connect(self.replica)
+        connection.connection.backup(target)
+        target.close()
+
+    def get_post(self, client, post):
+        return client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+
+    def test_reads_from_replica(self):
+        """Страница поста читает пост из реплики"""
+        self.assertEqual(
+            self.get_post(self.guest_client, self.replicated).status_code, 200
+        )
+        self.assertEqual(
+            self.get_post(self.guest_client, self.fresh).status_code, 404
+        )
+
+    def test_pinned_after_write(self):
+        """После своей записи клиент читает из основной базы"""
+        response = self.authorized_client.post(
+            reverse('posts:add_comment',
+                    kwargs={'post_id': self.replicated.pk}),
+            {'text': 'Комментарий'},
+        )
+        self.assertIn('primary_db', response.cookies)
+        self.assertEqual(
+            self.get_post(self.authorized_client, self.fresh).status_code,
+            200,
+        )
+
+    def test_other_views_use_primary(self):
+        """Поиск не в REPLICA_VIEWS и видит новый пост"""
+        with self.settings(REPLICA_VIEWS={'posts:post_detail'}):
+            response = self.guest_client.get(
+                reverse('posts:post_search'), {'q': 'еще'}
+            )
+        self.assertContains(response, self.fresh.text)
+
+
+class TestRunnerTests(SimpleTestCase):
+    def test_temporary_kvstore(self):
+        """Проверяем, что тесты не пишут в хранилище миниатюр проекта"""
+        self.assertNotEqual(
+            os.path.dirname(settings.THUMBNAIL_KVSTORE_PATH),
+            os.path.abspath(settings.BASE_DIR),
+        )
+
+
+class SQLiteKVStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        override = override_settings(
+            THUMBNAIL_KVSTORE_PATH=f'{self.directory}/thumbnails.sqlite3',
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.store = SQLiteKVStore()
+        self.source = self.image_file('posts/source.jpg', (1200, 800))
+        self.thumbnail = self.image_file('cache/thumbnail.jpg', (960, 339))
+        self.store.set(self.source)
+        self.store.set(self.thumbnail, self.source)
+
+    def image_file(self, name, size):
+        image = ImageFile(name, FileSystemStorage(location=self.directory))
+        image.set_size(size)
+        return image
+
+    def test_get_set_delete(self):
+        """Проверяем запись, чтение и удаление записей миниатюр"""
+        self.assertEqual(self.store.get(self.thumbnail).size, [960, 339])
+        self.store.delete(self.source)
+        self.assertIsNone(self.store.get(self.source))
+        self.assertIsNone(self.store.get(self.thumbnail))
+
+    def test_preloaded(self):
+        """Проверяем, что внутри preloaded записи читаются без запросов"""
+        statements = []
+        with self.store.preloaded([self.source.key]):
+            self.store._connection().set_trace_callback(statements.append)
+            self.assertEqual(self.store.get(self.source).size, [1200, 800])
+            self.assertEqual(
+                self.store.get(self.thumbnail).size, [960, 339]
+            )
+        self.store._connection().set_trace_callback(None)
+        self.assertEqual(statements, [])
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Comment, Follow, Group, Post
 
 
@@ -10,6 +11,13 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по полнотекстовому индексу вместо LIKE '%...%'"""
+        if not search_term:
+            return queryset, False
+        found = search.search_posts(search_term).order_by().values('pk')
+        return queryset.filter(pk__in=found), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Follow)
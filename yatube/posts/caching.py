@@ -0,0 +1,352 @@
+"""
+Кэш отрисованных страниц и их фрагментов.
+
+Ключи содержат счетчики поколений: увеличение счетчика разом делает
+устаревшими все ключи его области, не обходя их по одной. Начальное
+значение счетчика берется из текущего времени, чтобы после вытеснения
+счетчика из кэша не вернуться к уже использованным ключам.
+"""
+import hashlib
+import time
+import uuid
+from datetime import datetime
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+from django.utils.timezone import utc
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
+
+from core import kvstore, routers
+
+CARD_TEMPLATE = 'posts/includes/post.html'
+CARDS_SCOPE = 'post_cards'
+# Общая область всех лент: меняется вместе с группами и авторами
+FEEDS_SCOPE = 'feeds'
+INDEX_SCOPE = 'feed:index'
+
+
+def is_shared():
+    """
+    Видят ли кэш все процессы. У LocMemCache свои поколения в каждом
+    воркере, и сброс из одного воркера не доходит до остальных
+    """
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def _generation_key(scope):
+    return f'generation:{scope}'
+
+
+def get_generation(scope):
+    """Текущее поколение кэша для scope"""
+    key = _generation_key(scope)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_generations(*scopes):
+    """Текущие поколения нескольких scope за одно обращение к кэшу"""
+    keys = [_generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    return [
+        found[key] if key in found else get_generation(scope)
+        for key, scope in zip(keys, scopes)
+    ]
+
+
+def bump_generation(*scopes):
+    """Делает устаревшими все ключи scopes"""
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), None)
+    now = time.time()
+    cache.set_many({_modified_key(scope): now for scope in scopes}, None)
+
+
+def bump_generation_for_write(*scopes):
+    """
+    Делает устаревшими ключи scopes для записи в текущей транзакции:
+    сразу и еще раз после фиксации. Запрос, пришедший до фиксации,
+    собирает старые данные под промежуточным поколением, и после
+    фиксации они не отдаются. Первое увеличение нужно, когда внешняя
+    транзакция не фиксируется вовсе, как в тестах
+    """
+    bump_generation(*scopes)
+    transaction.on_commit(lambda: bump_generation(*scopes))
+
+
+def _modified_key(scope):
+    return f'modified:{scope}'
+
+
+def get_last_modified(*scopes):
+    """
+    Время последнего увеличения поколений scopes.
+    Если отметки нет в кэше, изменением считается текущий момент
+    """
+    keys = [_modified_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time(), None)
+            found[key] = cache.get(key) or time.time()
+    return datetime.fromtimestamp(max(found.values()), tz=utc)
+
+
+def group_scope(slug):
+    return f'feed:group:{slug}'
+
+
+def post_scope(pk):
+    return f'post:{pk}'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def card_key(pk, pub_date, show_author, generation):
+    return (
+        f'post_card:{generation}:{pk}:'
+        f'{pub_date.timestamp()}:{int(bool(show_author))}'
+    )
+
+
+def _card_keys(pk, pub_date, generation):
+    return [
+        card_key(pk, pub_date, show_author, generation)
+        for show_author in (False, True)
+    ]
+
+
+def render_cards(posts, show_author):
+    """
+    Возвращает html карточек постов, отрисовывая только те,
+    которых нет в кэше
+    """
+    posts = list(posts)
+    generation = get_generation(CARDS_SCOPE)
+    keys = [
+        card_key(post.pk, post.pub_date, show_author, generation)
+        for post in posts
+    ]
+    cached = cache.get_many(keys)
+    missing = {
+        key: post for key, post in zip(keys, posts) if key not in cached
+    }
+    # Миниатюры sorl всех отрисовываемых карточек читаются одним запросом
+    with kvstore.preloaded(post.image for post in missing.values()):
+        for key, post in missing.items():
+            cached[key] = missing[key] = render_to_string(
+                CARD_TEMPLATE,
+                {'post': post, 'show_author': show_author},
+            )
+    cards = [cached[key] for key in keys]
+    if missing:
+        cache.set_many(missing, _card_timeout())
+    return cards
+
+
+def _card_timeout():
+    state = routers.current()
+    # Карточка из реплики могла отстать от правки поста
+    if state is not None and state.replica is not None:
+        return settings.REPLICA_PIN_SECONDS
+    # Сброс карточки в одном процессе не дойдет до остальных
+    if not is_shared():
+        return settings.FEED_CACHE_LOCAL_TIMEOUT
+    return settings.POST_CARD_CACHE_TIMEOUT
+
+
+def invalidate_card(post):
+    """Удаляет из кэша карточки поста"""
+    generation = get_generation(CARDS_SCOPE)
+    cache.delete_many(_card_keys(post.pk, post.pub_date, generation))
+
+
+def invalidate_cards(posts, batch_size=1000):
+    """Удаляет из кэша карточки постов из queryset posts"""
+    _delete_cards(
+        posts.values_list('pk', 'pub_date').iterator(), batch_size
+    )
+
+
+def invalidate_cards_for_write(posts):
+    """
+    Удаляет из кэша карточки постов из queryset posts сразу и еще раз
+    после фиксации текущей транзакции, как bump_generation_for_write.
+    Посты выбираются сразу: к фиксации их может уже не быть в queryset
+    """
+    _delete_cards_for_write(list(posts.values_list('pk', 'pub_date')))
+
+
+def invalidate_card_for_write(post):
+    """Удаляет из кэша карточки поста, как invalidate_cards_for_write"""
+    # После удаления поста его pk станет None
+    _delete_cards_for_write([(post.pk, post.pub_date)])
+
+
+def _delete_cards_for_write(rows):
+    if rows:
+        _delete_cards(rows)
+        transaction.on_commit(lambda: _delete_cards(rows))
+
+
+def _delete_cards(rows, batch_size=1000):
+    """Удаляет карточки постов по парам (pk, pub_date)"""
+    generation = get_generation(CARDS_SCOPE)
+    keys = []
+    for pk, pub_date in rows:
+        keys.extend(_card_keys(pk, pub_date, generation))
+        if len(keys) >= batch_size:
+            cache.delete_many(keys)
+            keys = []
+    if keys:
+        cache.delete_many(keys)
+
+
+def _wait_for(key):
+    """Ждет, пока страницу key соберет другой обработчик"""
+    deadline = time.monotonic() + settings.FEED_CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(settings.FEED_CACHE_POLL_INTERVAL)
+        content = cache.get(key)
+        if content is not None:
+            return content
+    return None
+
+
+def _feed_page_key(request, scope):
+    generations = get_generations(FEEDS_SCOPE, scope)
+    viewer = request.user.pk if request.user.is_authenticated else 0
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return 'feed_page:{}:{}:{}:{}'.format(
+        scope, ':'.join(map(str, generations)), viewer, path
+    )
+
+
+def _feed_timeout():
+    # Страницу из кэша одного процесса остальные не сбросят
+    if is_shared():
+        return settings.FEED_CACHE_TIMEOUT
+    return settings.FEED_CACHE_LOCAL_TIMEOUT
+
+
+def _get_or_render(key, render):
+    """
+    Возвращает страницу из кэша или собирает ее через render().
+    Собирает только обработчик, взявший блокировку, остальные ждут
+    """
+    content = cache.get(key)
+    if content is not None:
+        return HttpResponse(content)
+    lock = f'{key}:lock'
+    token = uuid.uuid4().hex
+    if not cache.add(lock, token, settings.FEED_CACHE_LOCK_TIMEOUT):
+        content = _wait_for(key)
+        if content is not None:
+            return HttpResponse(content)
+    try:
+        response = render()
+        if response.status_code == 200:
+            cache.set(key, response.content, _feed_timeout())
+    finally:
+        # Пока шла сборка, блокировка могла истечь и достаться другому
+        if cache.get(lock) == token:
+            cache.delete(lock)
+    return response
+
+
+def _replica_may_lag(*scopes):
+    """
+    Страницу читают из реплики, а scopes изменились недавно: реплика
+    может еще не знать об изменении, и кэш или ETag закрепили бы
+    старую страницу под новым поколением
+    """
+    state = routers.current()
+    if state is None or state.replica is None:
+        return False
+    changed = get_last_modified(FEEDS_SCOPE, *scopes)
+    return (
+        datetime.now(tz=utc) - changed
+    ).total_seconds() < settings.REPLICA_PIN_SECONDS
+
+
+def cache_feed(scope):
+    """
+    Кэширует страницу ленты до изменения ее постов.
+    scope(**kwargs) возвращает область поколений для аргументов view.
+    С кэшем, которого не видят другие процессы, страница живет
+    FEED_CACHE_LOCAL_TIMEOUT секунд
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or _replica_may_lag(
+                scope(**kwargs)
+            ):
+                return view(request, *args, **kwargs)
+            response = _get_or_render(
+                _feed_page_key(request, scope(**kwargs)),
+                lambda: view(request, *args, **kwargs),
+            )
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional(scopes, per_user=True):
+    """
+    Отвечает 304 Not Modified, пока не изменились поколения scopes(**kwargs).
+    ETag и Last-Modified берутся из кэша до вызова view, поэтому
+    неизмененная страница не выполняет запросов ленты и не отрисовывается.
+    per_user добавляет в ETag пользователя: в шапке его имя, а в профиле
+    кнопка подписки. Поколения из кэша одного процесса не видят правок
+    в других воркерах, поэтому с таким кэшем view отвечает всегда
+    """
+    def etag(request, **kwargs):
+        generations = get_generations(FEEDS_SCOPE, *scopes(**kwargs))
+        parts = [*generations, request.get_full_path()]
+        if per_user:
+            parts.append(
+                request.user.pk if request.user.is_authenticated else 0
+            )
+        return hashlib.sha1(
+            '|'.join(map(str, parts)).encode()
+        ).hexdigest()
+
+    def last_modified(request, **kwargs):
+        return get_last_modified(FEEDS_SCOPE, *scopes(**kwargs))
+
+    def decorator(view):
+        conditional_view = condition(etag, last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_shared() or _replica_may_lag(*scopes(**kwargs)):
+                return view(request, *args, **kwargs)
+            response = conditional_view(request, *args, **kwargs)
+            if not (200 <= response.status_code < 300
+                    or response.status_code == 304):
+                # Ошибку не должны закреплять ни кэш клиента, ни 304
+                del response['ETag']
+                del response['Last-Modified']
+            return response
+        if per_user:
+            return vary_on_cookie(wrapper)
+        return wrapper
+    return decorator
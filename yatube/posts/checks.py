@@ -0,0 +1,68 @@
+from importlib import import_module
+
+from django.core.checks import Tags, Warning, register
+from django.db import connection
+from django.db.migrations.recorder import MigrationRecorder
+
+from . import caching
+
+# Миграции, которые создают триггеры SQLite, со списками TRIGGERS
+TRIGGER_MIGRATIONS = (
+    '0018_stats_triggers',
+    '0019_post_fts',
+    '0022_mediafile_triggers',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Поколения кэша лент работают, только если кэш общий"""
+    if caching.is_shared():
+        return []
+    return [
+        Warning(
+            'Кэш по умолчанию виден только своему процессу',
+            hint=(
+                'Сброс кэша лент не дойдет до других воркеров, поэтому '
+                'страницы кэшируются на FEED_CACHE_LOCAL_TIMEOUT секунд. '
+                'Для нескольких воркеров выберите YATUBE_CACHE_BACKEND=sqlite'
+            ),
+            id='posts.W001',
+        )
+    ]
+
+
+@register(Tags.database)
+def check_triggers(app_configs, **kwargs):
+    """
+    Триггеры примененных миграций на месте. Миграция, которая перестраивает
+    таблицу на SQLite (например, AlterField), молча удаляет ее триггеры
+    """
+    if connection.vendor != 'sqlite':
+        return []
+    applied = MigrationRecorder(connection).applied_migrations()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existing = {name for name, in cursor.fetchall()}
+    missing = []
+    for migration in TRIGGER_MIGRATIONS:
+        if ('posts', migration) not in applied:
+            continue
+        module = import_module(f'{__package__}.migrations.{migration}')
+        missing.extend(
+            name for name in module.TRIGGERS if name not in existing
+        )
+    if not missing:
+        return []
+    return [
+        Warning(
+            f'В базе нет триггеров: {", ".join(missing)}',
+            hint=(
+                'Таблицу перестроила миграция. Создайте триггеры заново '
+                'новой миграцией с RunPython из миграций '
+                f'{", ".join(TRIGGER_MIGRATIONS)} и выполните '
+                'reconcile_counters'
+            ),
+            id='posts.W002',
+        )
+    ]
@@ -0,0 +1,130 @@
+"""
+Денормализованные счетчики постов, комментариев и подписок.
+
+На SQLite их обновляют триггеры из миграции 0018_stats_triggers в той же
+транзакции, что и сами записи, поэтому счетчики верны и после bulk_create,
+и после каскадного удаления. Перестройка таблицы в миграции удаляет ее
+триггеры: об этом предупреждает проверка posts.W002. На других базах
+триггеров нет, и счетчики страниц считаются запросами COUNT. После ручных
+правок таблицы счетчиков приводит в порядок команда reconcile_counters.
+"""
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import (AuthorStats, Comment, Follow, Group, GroupStats, Post,
+                     PostStats, User)
+
+
+def is_maintained():
+    """Ведут ли счетчики триггеры базы"""
+    return connection.vendor == 'sqlite'
+
+
+def author_stats(user):
+    """Счетчики пользователя, нулевые, если строки еще нет"""
+    if not is_maintained():
+        return AuthorStats(
+            user=user,
+            posts_count=Post.objects.filter(author=user).count(),
+            followers_count=Follow.objects.filter(author=user).count(),
+            following_count=Follow.objects.filter(user=user).count(),
+        )
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        return AuthorStats(user=user)
+
+
+def group_stats(group):
+    """Счетчики группы, нулевые, если строки еще нет"""
+    if not is_maintained():
+        return GroupStats(
+            group=group,
+            posts_count=Post.objects.filter(group=group).count(),
+        )
+    try:
+        return group.stats
+    except GroupStats.DoesNotExist:
+        return GroupStats(group=group)
+
+
+def post_stats(post):
+    """Счетчики поста, нулевые, если строки еще нет"""
+    if not is_maintained():
+        return PostStats(
+            post=post,
+            comments_count=Comment.objects.filter(post=post).count(),
+        )
+    try:
+        return post.stats
+    except PostStats.DoesNotExist:
+        return PostStats(post=post)
+
+
+def _counts(queryset, field):
+    return dict(
+        queryset.order_by().values(field).annotate(count=Count('pk'))
+        .values_list(field, 'count')
+    )
+
+
+def _reconcile(model, key, ids, expected):
+    """
+    Сверяет строки model со значениями expected {поле: {id: число}},
+    возвращает число исправленных строк
+    """
+    existing = {getattr(stats, key): stats for stats in model.objects.all()}
+    fixed = 0
+    for pk in ids:
+        values = {
+            field: counts.get(pk, 0) for field, counts in expected.items()
+        }
+        stats = existing.get(pk)
+        if stats is None:
+            # Отсутствующая строка и так читается как нулевые счетчики
+            if not any(values.values()):
+                continue
+            stats = model(**{key: pk})
+        elif all(
+            getattr(stats, field) == value
+            for field, value in values.items()
+        ):
+            continue
+        for field, value in values.items():
+            setattr(stats, field, value)
+        stats.save()
+        fixed += 1
+    return fixed
+
+
+@transaction.atomic
+def reconcile():
+    """
+    Пересчитывает все счетчики по исходным таблицам,
+    возвращает {модель: число исправленных строк}
+    """
+    return {
+        'AuthorStats': _reconcile(
+            AuthorStats,
+            'user_id',
+            User.objects.values_list('pk', flat=True),
+            {
+                'posts_count': _counts(Post.objects, 'author_id'),
+                'followers_count': _counts(Follow.objects, 'author_id'),
+                'following_count': _counts(Follow.objects, 'user_id'),
+            },
+        ),
+        'GroupStats': _reconcile(
+            GroupStats,
+            'group_id',
+            Group.objects.values_list('pk', flat=True),
+            {'posts_count': _counts(Post.objects, 'group_id')},
+        ),
+        'PostStats': _reconcile(
+            PostStats,
+            'post_id',
+            set(Comment.objects.values_list('post_id', flat=True))
+            | set(PostStats.objects.values_list('post_id', flat=True)),
+            {'comments_count': _counts(Comment.objects, 'post_id')},
+        ),
+    }
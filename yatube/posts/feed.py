@@ -0,0 +1,121 @@
+"""
+Материализованная лента подписок (fan-out on write).
+
+Новый пост автора раскладывается по лентам его подписчиков, поэтому
+follow_index читает одну таблицу FeedEntry по индексу
+(user, -pub_date, -post) вместо соединения Follow и Post с сортировкой.
+Посты авторов, у которых подписчиков больше FOLLOW_FEED_FANOUT_LIMIT,
+не раскладываются, а подмешиваются при чтении (fan-out on read).
+Такие посты отмечаются в SkippedFanout: когда подписчиков у автора
+станет меньше, их все равно не окажется в FeedEntry, и лента продолжит
+подмешивать их при чтении.
+"""
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Q
+
+from .models import AuthorStats, FeedEntry, Follow, Post, SkippedFanout
+
+# Поля, по которым follow_posts сортируется и листается курсором
+KEYS = ('feed_pub_date', 'feed_post_id')
+
+
+def is_enabled():
+    return settings.FOLLOW_FEED_FANOUT
+
+
+def _entry(user_id, post):
+    return FeedEntry(
+        user_id=user_id,
+        post_id=post.pk,
+        author_id=post.author_id,
+        pub_date=post.pub_date,
+    )
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора"""
+    popular = AuthorStats.objects.filter(
+        user_id=post.author_id,
+        followers_count__gt=settings.FOLLOW_FEED_FANOUT_LIMIT,
+    )
+    if popular.exists():
+        SkippedFanout.objects.create(post=post, author_id=post.author_id)
+        return
+    followers = Follow.objects.filter(author_id=post.author_id)
+    FeedEntry.objects.bulk_create(
+        (_entry(user_id, post) for user_id
+         in followers.values_list('user_id', flat=True).iterator()),
+        batch_size=settings.FOLLOW_FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user, author):
+    """Добавляет в ленту пользователя уже опубликованные посты автора"""
+    posts = Post.objects.filter(author=author).only(
+        'pk', 'author_id', 'pub_date'
+    )
+    FeedEntry.objects.bulk_create(
+        (_entry(user.pk, post) for post in posts.iterator()),
+        batch_size=settings.FOLLOW_FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def trim(user, author):
+    """Убирает из ленты пользователя посты автора"""
+    FeedEntry.objects.filter(user=user, author=author).delete()
+
+
+def rebuild(user):
+    """Пересобирает ленту пользователя по его текущим подпискам"""
+    FeedEntry.objects.filter(user=user).delete()
+    for follow in Follow.objects.filter(user=user).select_related('author'):
+        backfill(user, follow.author)
+
+
+def _keyed(posts, pub_date, post_id):
+    return posts.annotate(
+        feed_pub_date=F(pub_date),
+        feed_post_id=F(post_id),
+    ).order_by('-feed_pub_date', '-feed_post_id')
+
+
+def follow_posts(user):
+    """
+    Возвращает посты авторов из подписки пользователя, упорядоченные
+    по KEYS. Лента из одной FeedEntry упорядочена по ее полям и читается
+    по индексу (user, -pub_date, -post) без сортировки
+    """
+    if not is_enabled():
+        return _keyed(
+            Post.objects.filter(author__following__user=user), 'pub_date', 'pk'
+        )
+    # Авторы, чьи посты есть не в FeedEntry: популярные сейчас
+    # и бывшие популярными, когда писали часть постов
+    read_authors = list(
+        Follow.objects.filter(user=user).annotate(
+            skipped=Exists(SkippedFanout.objects.filter(
+                author_id=OuterRef('author_id')
+            )),
+        ).filter(
+            Q(author__stats__followers_count__gt=(
+                settings.FOLLOW_FEED_FANOUT_LIMIT
+            ))
+            | Q(skipped=True)
+        ).values_list('author_id', flat=True)
+    )
+    if not read_authors:
+        return _keyed(
+            Post.objects.filter(feed_entries__user=user),
+            'feed_entries__pub_date',
+            'feed_entries__post_id',
+        )
+    return _keyed(
+        Post.objects.filter(
+            Q(pk__in=FeedEntry.objects.filter(user=user).values('post_id'))
+            | Q(author__in=read_authors)
+        ),
+        'pub_date',
+        'pk',
+    )
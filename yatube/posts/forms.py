@@ -1,5 +1,8 @@
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
 
+from . import uploads
 from .models import Post, Comment
 
 
@@ -18,6 +21,25 @@ class PostForm(forms.ModelForm):
             'image': 'Выберите файл',
         }
 
+    def clean_image(self):
+        """Уменьшает новую картинку и удаляет из нее метаданные"""
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        if uploads.exceeds_pixels(image):
+            raise forms.ValidationError(
+                'Изображение больше %(limit)s мегапикселей',
+                code='too_many_pixels',
+                params={'limit': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6},
+            )
+        try:
+            return uploads.normalize(image)
+        except Exception as error:
+            raise forms.ValidationError(
+                self.fields['image'].error_messages['invalid_image'],
+                code='invalid_image',
+            ) from error
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
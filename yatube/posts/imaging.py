@@ -0,0 +1,122 @@
+"""
+Обработка картинок без обращения к Django.
+
+Функции отсюда выполняются в процессах пула, поэтому модуль не
+импортирует ни настройки, ни модели: на вход байты, на выход байты.
+"""
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Параметры сохранения: AVIF и WebP при том же качестве на глаз
+# заметно легче JPEG
+SAVE_OPTIONS = {
+    'jpeg': {'format': 'JPEG', 'quality': 85, 'optimize': True},
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'avif': {'format': 'AVIF', 'quality': 60},
+}
+# Параметры пересохранения загруженных картинок
+UPLOAD_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True},
+}
+# Метаданные, которые не сохраняются вместе с загруженной картинкой
+METADATA = {'exif', 'xmp', 'XML:com.adobe.xmp', 'photoshop', 'comment'}
+# Форматы с анимацией: кадры не пересохраняются, чтобы ее не потерять
+ANIMATED_FORMATS = {'GIF', 'PNG', 'WEBP'}
+
+
+def parse_geometry(geometry):
+    """'960x339' -> (960, 339)"""
+    width, height = geometry.lower().split('x')
+    return int(width), int(height)
+
+
+def can_save(format):
+    """Умеет ли установленный Pillow сохранять format"""
+    Image.init()
+    return (
+        format in SAVE_OPTIONS
+        and SAVE_OPTIONS[format]['format'] in Image.SAVE
+    )
+
+
+def render_derivatives(source, variants):
+    """
+    Готовит из картинки source все варианты (geometry, format) за одно
+    декодирование. Каждый вариант вырезан из центра и отмасштабирован,
+    как {% thumbnail crop="center" upscale=True %}.
+    Возвращает словарь {(geometry, format): байты}
+    """
+    sizes = {geometry: parse_geometry(geometry) for geometry, _ in variants}
+    largest = max(sizes.values())
+    with Image.open(BytesIO(source)) as image:
+        # JPEG сразу декодируется в уменьшенном масштабе,
+        # достаточном для самого большого варианта
+        image.draft('RGB', largest)
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.load()
+    resized = {
+        geometry: ImageOps.fit(image, size, Image.LANCZOS)
+        for geometry, size in sizes.items()
+    }
+    results = {}
+    for geometry, format in variants:
+        result = BytesIO()
+        resized[geometry].save(result, **SAVE_OPTIONS[format])
+        results[geometry, format] = result.getvalue()
+    return results
+
+
+def _fallback_format(image):
+    """Формат для картинки, которую Pillow не умеет сохранять как есть"""
+    return 'JPEG' if image.mode in ('1', 'L', 'RGB', 'CMYK') else 'PNG'
+
+
+def normalize(source, output, max_side):
+    """
+    Уменьшает картинку из файла source до max_side по длинной стороне,
+    поворачивает по EXIF и сохраняет в файл output без метаданных.
+    Возвращает формат сохраненной картинки или None, если картинка
+    уже подходит и ее можно хранить как есть
+    """
+    with Image.open(source) as image:
+        if (image.format in ANIMATED_FORMATS
+                and getattr(image, 'is_animated', False)):
+            return None
+        scale = min(1, max_side / max(image.size))
+        if scale == 1 and not METADATA.intersection(image.info):
+            return None
+        Image.init()
+        format = image.format
+        if format not in Image.SAVE:
+            format = _fallback_format(image)
+        icc_profile = image.info.get('icc_profile')
+        size = (
+            max(1, round(image.width * scale)),
+            max(1, round(image.height * scale)),
+        )
+        # JPEG декодируется сразу в уменьшенном в 2-8 раз масштабе
+        image.draft(image.mode, size)
+        image.load()
+        if scale < 1:
+            if image.mode in ('1', 'P'):
+                image = image.convert('RGBA')
+            # Быстрое целое уменьшение, затем точная доводка до size
+            factor = min(image.width // size[0], image.height // size[1])
+            if factor >= 2:
+                image = image.reduce(factor)
+            image = image.resize(size, Image.LANCZOS)
+        image = ImageOps.exif_transpose(image)
+        if format == 'JPEG' and image.mode not in ('L', 'RGB', 'CMYK'):
+            image = image.convert('RGB')
+        image.info = {
+            key: value for key, value in image.info.items()
+            if key not in METADATA
+        }
+        options = dict(UPLOAD_OPTIONS.get(format, {}))
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        image.save(output, format, **options)
+    return format
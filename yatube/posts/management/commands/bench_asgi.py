@@ -0,0 +1,231 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import close_old_connections, connection
+from django.db.models import Count
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+
+from core.asgi import ASGIHandler, make_environ
+from posts.models import Group, Post, User
+from posts.seeding import Seeder
+
+from .bench_views import percentile
+
+# Без кэша каждая страница идет в базу
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+
+
+def make_scope(url):
+    path, _, query = url.partition('?')
+    return {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'testserver')],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 0),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность и задержку страниц через '
+        'WSGI и yatube.asgi при медленных клиентах'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=50000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--requests', type=int, default=400,
+            help='Всего запросов в каждом режиме',
+        )
+        parser.add_argument(
+            '--clients', type=int, default=64,
+            help='Одновременных клиентов',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Синхронных воркеров WSGI и потоков пула ASGI',
+        )
+        parser.add_argument(
+            '--client-delay', type=float, default=50,
+            help='Сколько миллисекунд клиент передает запрос',
+        )
+        parser.add_argument(
+            '--parallel-queries',
+            action='store_true',
+            help='Включить PARALLEL_QUERIES',
+        )
+        parser.add_argument('--json', help='Файл для результатов')
+
+    def urls(self):
+        author = User.objects.annotate(
+            count=Count('posts')
+        ).order_by('-count').first()
+        post = Post.objects.annotate(
+            count=Count('comments')
+        ).order_by('-count').first()
+        group = Group.objects.annotate(
+            count=Count('posts')
+        ).order_by('-count').first()
+        return [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': group.slug}),
+            reverse('posts:profile', kwargs={'username': author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        ]
+
+    def bench_wsgi(self, application, urls, options):
+        """
+        Синхронный воркер сам читает запрос медленного клиента
+        и все это время не берет других запросов
+        """
+        delay = options['client_delay'] / 1000
+        workers = threading.BoundedSemaphore(options['threads'])
+
+        def call(url):
+            started = time.perf_counter()
+            with workers:
+                time.sleep(delay)
+                result = application(
+                    make_environ(make_scope(url), b''),
+                    lambda status, headers, exc_info=None: None,
+                )
+                b''.join(result)
+                result.close()
+            return time.perf_counter() - started
+
+        def client(url):
+            try:
+                return call(url)
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(options['clients']) as clients:
+            return list(clients.map(client, urls))
+
+    def bench_asgi(self, application, urls, options):
+        """Запрос медленного клиента читает цикл событий, а не поток"""
+        delay = options['client_delay'] / 1000
+        handler = ASGIHandler(application, max_workers=options['threads'])
+        pending = iter(urls)
+        timings = []
+
+        async def call(url):
+            started = time.perf_counter()
+
+            async def receive():
+                await asyncio.sleep(delay)
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                pass
+
+            await handler(make_scope(url), receive, send)
+            timings.append(time.perf_counter() - started)
+
+        async def client():
+            for url in pending:
+                await call(url)
+
+        async def main():
+            await asyncio.gather(
+                *(client() for _ in range(options['clients']))
+            )
+
+        asyncio.run(main())
+        handler.executor.shutdown()
+        return timings
+
+    def summary(self, name, timings, elapsed):
+        timings = [timing * 1000 for timing in timings]
+        return {
+            'mode': name,
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+        }
+
+    def bench(self, options):
+        application = get_wsgi_application()
+        pages = self.urls()
+        urls = [
+            pages[number % len(pages)]
+            for number in range(options['requests'])
+        ]
+        results = []
+        settings = {
+            'CACHES': BENCH_CACHES,
+            'PARALLEL_QUERIES': options['parallel_queries'],
+        }
+        with override_settings(**settings):
+            for name, run in (
+                ('wsgi', self.bench_wsgi),
+                ('asgi', self.bench_asgi),
+            ):
+                started = time.perf_counter()
+                timings = run(application, urls, options)
+                results.append(self.summary(
+                    name, timings, time.perf_counter() - started
+                ))
+        return results
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            Seeder(seed=options['seed']).run(
+                users=options['users'],
+                groups=options['groups'],
+                posts=options['posts'],
+                comments=options['comments'],
+                follows=options['follows'],
+            )
+            results = self.bench(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.stdout.write(
+            f'{"mode":<6} {"req/s":>8} {"p50, ms":>9} {"p95, ms":>9}'
+        )
+        for result in results:
+            self.stdout.write(
+                f'{result["mode"]:<6} {result["rps"]:>8} '
+                f'{result["p50_ms"]:>9} {result["p95_ms"]:>9}'
+            )
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                config = {
+                    key: options[key] for key in (
+                        'users', 'groups', 'posts', 'comments', 'follows',
+                        'seed', 'requests', 'clients', 'threads',
+                        'client_delay', 'parallel_queries',
+                    )
+                }
+                json.dump(
+                    {'config': config, 'results': results}, file, indent=2
+                )
@@ -0,0 +1,165 @@
+import json
+import random
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw, ImageFilter, ImageOps
+
+from posts.imaging import can_save, parse_geometry, render_derivatives
+
+# Клиенты: ширина окна в css-пикселях и плотность пикселей экрана
+CLIENTS = (
+    ('desktop', 1280, 1),
+    ('laptop-retina', 1440, 2),
+    ('phone', 360, 2),
+    ('phone-large', 412, 3),
+    ('phone-old', 320, 1),
+)
+# Ширина карточки на широком экране, как в sizes шаблонов
+CARD_WIDTH = 960
+# Единственная миниатюра до адаптивных вариантов
+BASELINE_GEOMETRY = '960x339'
+
+
+def make_photo(generator, size):
+    """Картинка, похожая на фотографию: плавные пятна цвета и шум"""
+    width, height = size
+    image = Image.new('RGB', size)
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = generator.randrange(width), generator.randrange(height)
+        radius = generator.randrange(width // 20, width // 3)
+        draw.ellipse(
+            (x - radius, y - radius, x + radius, y + radius),
+            fill=tuple(generator.randrange(256) for _ in range(3)),
+        )
+    image = image.filter(ImageFilter.GaussianBlur(width // 60))
+    noise = Image.effect_noise(size, 24).convert('RGB')
+    image = Image.blend(image, noise, 0.08)
+    result = BytesIO()
+    image.save(result, 'JPEG', quality=92)
+    return result.getvalue()
+
+
+def render_baseline(source):
+    """Миниатюра так, как ее готовили до адаптивных вариантов"""
+    size = parse_geometry(BASELINE_GEOMETRY)
+    with Image.open(BytesIO(source)) as image:
+        image.draft('RGB', size)
+        image = ImageOps.fit(image.convert('RGB'), size, Image.LANCZOS)
+    result = BytesIO()
+    image.save(result, 'JPEG', quality=85, optimize=True)
+    return result.getvalue()
+
+
+def choose(variants, width, formats):
+    """
+    Вариант, который выберет браузер по srcset: самый узкий не уже
+    нужной ширины, в первом поддерживаемом формате
+    """
+    widths = sorted({parse_geometry(geometry)[0] for geometry, _ in variants})
+    chosen = next((item for item in widths if item >= width), widths[-1])
+    for format in formats:
+        for geometry, variant_format in variants:
+            if (variant_format == format
+                    and parse_geometry(geometry)[0] == chosen):
+                return geometry, format
+    raise ValueError(f'Нет вариантов ширины {chosen}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает объем картинок на странице ленты до и после '
+        'адаптивных вариантов и время их подготовки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=10,
+                            help='Картинок на странице ленты')
+        parser.add_argument('--width', type=int, default=2400)
+        parser.add_argument('--height', type=int, default=1600)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', help='Файл для результатов')
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        sources = [
+            make_photo(generator, (options['width'], options['height']))
+            for _ in range(options['images'])
+        ]
+        formats = [
+            format for format in settings.POST_THUMBNAIL_FORMATS
+            if can_save(format)
+        ]
+        variants = [
+            (geometry, format)
+            for geometry in settings.POST_THUMBNAIL_SIZES
+            for format in formats
+        ]
+
+        started = time.perf_counter()
+        baseline = [render_baseline(source) for source in sources]
+        baseline_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        derivatives = [
+            render_derivatives(source, variants) for source in sources
+        ]
+        single_pass_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for source in sources:
+            for variant in variants:
+                render_derivatives(source, [variant])
+        separate_seconds = time.perf_counter() - started
+
+        baseline_bytes = sum(map(len, baseline))
+        clients = []
+        for name, viewport, density in CLIENTS:
+            width = min(viewport, CARD_WIDTH) * density
+            geometry, format = choose(variants, width, formats)
+            page_bytes = sum(
+                len(rendered[geometry, format]) for rendered in derivatives
+            )
+            clients.append({
+                'client': name,
+                'variant': f'{geometry}.{format}',
+                'page_bytes': page_bytes,
+                'baseline_bytes': baseline_bytes,
+                'saved_percent': round(
+                    100 * (1 - page_bytes / baseline_bytes), 1
+                ),
+            })
+        timings = {
+            'baseline_ms_per_image': round(
+                1000 * baseline_seconds / len(sources), 1
+            ),
+            'single_pass_ms_per_image': round(
+                1000 * single_pass_seconds / len(sources), 1
+            ),
+            'separate_passes_ms_per_image': round(
+                1000 * separate_seconds / len(sources), 1
+            ),
+        }
+
+        self.stdout.write(f'Форматы: {", ".join(formats)}')
+        self.stdout.write(
+            f'{"client":<14} {"variant":<14} {"page, KB":>9} '
+            f'{"before, KB":>11} {"saved, %":>9}'
+        )
+        for row in clients:
+            self.stdout.write(
+                f'{row["client"]:<14} {row["variant"]:<14} '
+                f'{row["page_bytes"] / 1024:>9.1f} '
+                f'{row["baseline_bytes"] / 1024:>11.1f} '
+                f'{row["saved_percent"]:>9}'
+            )
+        for key, value in timings.items():
+            self.stdout.write(f'{key}: {value}')
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump(
+                    {'clients': clients, 'timings': timings}, file, indent=2
+                )
@@ -0,0 +1,181 @@
+import importlib
+import itertools
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+# Индекс создается теми же запросами, что и в базе сайта
+fts_migration = importlib.import_module('posts.migrations.0019_post_fts')
+
+SCHEMA = '''
+CREATE TABLE posts_post (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    pub_date DATETIME NOT NULL
+);
+CREATE INDEX post_pub_date_id_idx ON posts_post (pub_date DESC, id DESC);
+'''
+LETTERS = 'абвгдежзиклмнопрстуфхцчшщэюя'
+
+
+def make_vocabulary(generator, size):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(
+            generator.choice(LETTERS)
+            for _ in range(generator.randint(3, 10))
+        ))
+    return sorted(words)
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск по LIKE и по индексу FTS5 на сгенерированной '
+        'базе, например --posts 1000000'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--words', type=int, default=20000,
+                            help='Размер словаря')
+        parser.add_argument('--queries', type=int, default=30,
+                            help='Запросов каждого вида')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', help='Файл для результатов')
+
+    def seed(self, connection, generator, vocabulary, posts):
+        # Частоты слов по закону Ципфа, как в живом тексте
+        cum_weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, len(vocabulary) + 1)
+        ))
+        start = datetime(2020, 1, 1)
+        rows = (
+            (
+                ' '.join(generator.choices(
+                    vocabulary,
+                    cum_weights=cum_weights,
+                    k=generator.randint(20, 60),
+                )),
+                (start + timedelta(minutes=number)).isoformat(' '),
+            )
+            for number in range(posts)
+        )
+        started = time.perf_counter()
+        with connection:
+            connection.executemany(
+                'INSERT INTO posts_post (text, pub_date) VALUES (?, ?)', rows
+            )
+        return time.perf_counter() - started
+
+    def timed(self, connection, sql, params):
+        started = time.perf_counter()
+        connection.execute(sql, params).fetchall()
+        return (time.perf_counter() - started) * 1000
+
+    def bench(self, connection, kind, words):
+        """Задержки страницы результатов: первые 10 постов и их число"""
+        like = []
+        fts = []
+        rank = search.RANK_SQL % '?'
+        table = search.FTS_TABLE
+        for query in words:
+            pattern = f'%{query}%'
+            like.append(
+                self.timed(
+                    connection,
+                    'SELECT id FROM posts_post WHERE text LIKE ? '
+                    'ORDER BY pub_date DESC, id DESC LIMIT 10',
+                    (pattern,),
+                )
+                + self.timed(
+                    connection,
+                    'SELECT COUNT(*) FROM posts_post WHERE text LIKE ?',
+                    (pattern,),
+                )
+            )
+            expression = search.match_expression(query)
+            fts.append(
+                self.timed(
+                    connection,
+                    f'SELECT posts_post.id, {rank} AS rank '
+                    f'FROM posts_post JOIN {table} '
+                    f'ON {table}.rowid = posts_post.id '
+                    f'WHERE {table} MATCH ? ORDER BY rank LIMIT 10',
+                    (settings.SEARCH_RECENCY_DAYS, expression),
+                )
+                + self.timed(
+                    connection,
+                    f'SELECT COUNT(*) FROM {table} WHERE {table} MATCH ?',
+                    (expression,),
+                )
+            )
+        return [
+            {
+                'query': kind,
+                'method': method,
+                'p50_ms': round(statistics.median(values), 2),
+                'p95_ms': round(percentile(values, 0.95), 2),
+            }
+            for method, values in (('like', like), ('fts5', fts))
+        ]
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        vocabulary = make_vocabulary(generator, options['words'])
+        with tempfile.TemporaryDirectory() as directory:
+            connection = sqlite3.connect(
+                os.path.join(directory, 'search.sqlite3')
+            )
+            connection.executescript(SCHEMA)
+            for sql in fts_migration.FORWARD:
+                connection.execute(sql)
+            elapsed = self.seed(
+                connection, generator, vocabulary, options['posts']
+            )
+            self.stdout.write(
+                f'Постов: {options["posts"]}, вставка с индексом: '
+                f'{round(options["posts"] / elapsed)} строк/с'
+            )
+            count = options['queries']
+            kinds = {
+                'common': vocabulary[:count],
+                'rare': generator.sample(vocabulary, count),
+                'two words': [
+                    ' '.join(generator.sample(vocabulary[:200], 2))
+                    for _ in range(count)
+                ],
+            }
+            results = []
+            for kind, words in kinds.items():
+                results.extend(self.bench(connection, kind, words))
+            connection.close()
+        self.stdout.write(
+            f'{"query":<10} {"method":<6} {"p50, ms":>9} {"p95, ms":>9}'
+        )
+        for result in results:
+            self.stdout.write(
+                f'{result["query"]:<10} {result["method"]:<6} '
+                f'{result["p50_ms"]:>9} {result["p95_ms"]:>9}'
+            )
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump(
+                    {'posts': options['posts'], 'results': results},
+                    file,
+                    indent=2,
+                )
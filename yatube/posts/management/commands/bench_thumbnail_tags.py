@@ -0,0 +1,134 @@
+import json
+import shutil
+import statistics
+import tempfile
+import time
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.template import Context, Template
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+
+from core import kvstore
+from core.kvstore import SQLiteKVStore
+from posts.models import Post, User
+
+from .bench_views import BENCH_CACHES, percentile
+
+# Тег так же, как в карточке поста
+TEMPLATE = Template(
+    '{% load thumbnail %}{% for post in posts %}'
+    '{% thumbnail post.image "960x339" crop="center" upscale=True as im %}'
+    '{{ im.url }}{% endthumbnail %}{% endfor %}'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет, сколько стоят теги {% thumbnail %} страницы ленты '
+        'с разными хранилищами метаданных sorl'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10,
+                            help='Картинок на странице')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--json', help='Файл для результатов')
+
+    def create_posts(self, count):
+        author = User.objects.create_user('bench_author')
+        for number in range(count):
+            content = BytesIO()
+            Image.new(
+                'RGB', (400, 300), color=(number % 256, number // 256, 0)
+            ).save(content, 'png')
+            post = Post(author=author, text=f'Пост {number}')
+            post.image.save(
+                f'{number}.png', ContentFile(content.getvalue()), save=False
+            )
+            post.save()
+        return list(Post.objects.all())
+
+    def measure(self, posts, store, options, cold=False, preload=False):
+        default.kvstore._wrapped = store
+        statements = []
+        if isinstance(store, SQLiteKVStore):
+            store._connection().set_trace_callback(statements.append)
+        timings = []
+        queries = 0
+        for _ in range(options['iterations']):
+            if cold:
+                cache.clear()
+            statements.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                if preload:
+                    with kvstore.preloaded(post.image for post in posts):
+                        TEMPLATE.render(Context({'posts': posts}))
+                else:
+                    TEMPLATE.render(Context({'posts': posts}))
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = len(captured) + len(statements)
+        if isinstance(store, SQLiteKVStore):
+            store._connection().set_trace_callback(None)
+        return {
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'queries': queries,
+        }
+
+    def bench(self, options):
+        posts = self.create_posts(options['posts'])
+        cached_db = KVStore()
+        sqlite = SQLiteKVStore()
+        # Первый проход готовит миниатюры и записи обоих хранилищ
+        for store in (cached_db, sqlite):
+            self.measure(posts, store, {'iterations': 1})
+        return [
+            {'store': 'cached_db, cold cache',
+             **self.measure(posts, cached_db, options, cold=True)},
+            {'store': 'cached_db, warm cache',
+             **self.measure(posts, cached_db, options)},
+            {'store': 'sqlite, per tag',
+             **self.measure(posts, sqlite, options)},
+            {'store': 'sqlite, preloaded',
+             **self.measure(posts, sqlite, options, preload=True)},
+        ]
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            with override_settings(
+                CACHES=BENCH_CACHES,
+                MEDIA_ROOT=directory,
+                THUMBNAIL_KVSTORE_PATH=f'{directory}/thumbnails.sqlite3',
+            ):
+                results = self.bench(options)
+        finally:
+            default.kvstore._setup()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(directory, ignore_errors=True)
+        self.stdout.write(
+            f'{"store":<22} {"p50, ms":>8} {"p95, ms":>8} {"queries":>8}'
+        )
+        for result in results:
+            self.stdout.write(
+                f'{result["store"]:<22} {result["p50_ms"]:>8} '
+                f'{result["p95_ms"]:>8} {result["queries"]:>8}'
+            )
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump(results, file, indent=2)
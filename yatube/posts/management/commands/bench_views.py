@@ -0,0 +1,212 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+
+from posts.models import Group, Post, User
+from posts.seeding import Seeder
+from posts.utils import encode_cursor
+
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench_views',
+    },
+}
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку, число запросов и память страниц на '
+        'сгенерированной тестовой базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=50000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--warm-cache',
+            action='store_true',
+            help='Не сбрасывать кэш между запросами',
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Оставить тестовую базу и не заполнять ее заново',
+        )
+        parser.add_argument('--json', help='Файл для результатов')
+
+    def seed(self, options):
+        if options['keepdb'] and Post.objects.exists():
+            return {}
+        seeder = Seeder(seed=options['seed'])
+        rows = seeder.run(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows=options['follows'],
+        )
+        for model, count in rows.items():
+            elapsed = seeder.elapsed[model]
+            self.stdout.write(
+                f'{model}: {count} строк, {round(count / elapsed)} строк/с'
+            )
+        return rows
+
+    def deep_page(self, number):
+        """
+        Адрес страницы number главной ленты по курсору, как по ссылкам
+        «Следующая»; None, если постов на столько страниц не хватает
+        """
+        offset = (number - 1) * settings.POSTS_PER_PAGE - 1
+        rows = list(Post.objects.order_by('-pub_date', '-pk').values_list(
+            'pub_date', 'pk'
+        )[offset:offset + 1])
+        if not rows:
+            return None
+        return reverse('posts:index') + '?after=' + encode_cursor(*rows[0])
+
+    def cases(self):
+        """(название, метод, адрес, данные) для каждой страницы"""
+        author = User.objects.annotate(
+            count=Count('posts')
+        ).order_by('-count').first()
+        post = Post.objects.annotate(
+            count=Count('comments')
+        ).order_by('-count').first()
+        group = Group.objects.annotate(
+            count=Count('posts')
+        ).order_by('-count').first()
+        deep_page = self.deep_page(50)
+        return [
+            ('index', 'get', reverse('posts:index'), None),
+            *([('index page 50', 'get', deep_page, None)] if deep_page
+              else []),
+            ('group_posts', 'get',
+             reverse('posts:group_list', kwargs={'slug': group.slug}), None),
+            ('profile', 'get',
+             reverse('posts:profile', kwargs={'username': author.username}),
+             None),
+            ('follow_index', 'get', reverse('posts:follow_index'), None),
+            ('post_detail', 'get',
+             reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+             None),
+            ('post_create', 'post', reverse('posts:post_create'),
+             {'text': 'Пост из замера'}),
+            ('add_comment', 'post',
+             reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+             {'text': 'Комментарий из замера'}),
+        ]
+
+    def viewer(self):
+        """Пользователь с самым большим числом подписок"""
+        return User.objects.annotate(
+            count=Count('follower')
+        ).order_by('-count').first()
+
+    def measure(self, client, method, url, data, options):
+        request = getattr(client, method)
+        for _ in range(options['warmup']):
+            request(url, data)
+        timings = []
+        queries = []
+        for _ in range(options['iterations']):
+            if not options['warm_cache']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                request(url, data)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+        # Память меряется отдельным запросом: tracemalloc искажает время
+        if not options['warm_cache']:
+            cache.clear()
+        tracemalloc.start()
+        request(url, data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'queries': max(queries),
+            'peak_kb': round(peak / 1024),
+        }
+
+    def bench(self, options):
+        client = Client()
+        client.force_login(self.viewer())
+        results = []
+        with override_settings(CACHES=BENCH_CACHES):
+            for name, method, url, data in self.cases():
+                result = {'view': name, 'url': url}
+                result.update(
+                    self.measure(client, method, url, data, options)
+                )
+                results.append(result)
+        return results
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"view":<15} {"p50, ms":>9} {"p95, ms":>9} '
+            f'{"queries":>8} {"peak, KB":>9}'
+        )
+        for result in results:
+            self.stdout.write(
+                f'{result["view"]:<15} {result["p50_ms"]:>9} '
+                f'{result["p95_ms"]:>9} {result["queries"]:>8} '
+                f'{result["peak_kb"]:>9}'
+            )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0,
+            autoclobber=True,
+            serialize=False,
+            keepdb=options['keepdb'],
+        )
+        try:
+            rows = self.seed(options)
+            results = self.bench(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+            teardown_test_environment()
+        self.report(results)
+        if options['json']:
+            config = {
+                key: options[key] for key in (
+                    'users', 'groups', 'posts', 'comments', 'follows',
+                    'seed', 'iterations', 'warm_cache',
+                )
+            }
+            with open(options['json'], 'w') as file:
+                json.dump(
+                    {'config': config, 'seeded': rows, 'results': results},
+                    file,
+                    indent=2,
+                )
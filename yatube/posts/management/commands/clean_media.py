@@ -0,0 +1,148 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts import media
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки постов, на которые никто не ссылается, '
+        'и устаревшие миниатюры'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=0,
+            help='Не больше стольких удалений в секунду, 0 без ограничения',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=0,
+            help='Остановиться после стольких удалений, 0 без ограничения',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=float,
+            default=settings.MEDIA_GC_MIN_AGE,
+            help='Не трогать файлы моложе стольких секунд',
+        )
+        parser.add_argument(
+            '--state',
+            default=settings.MEDIA_GC_STATE_PATH,
+            help='Файл, где хранится место остановки',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать обход сначала, а не с места остановки',
+        )
+
+    def load_cursor(self, path):
+        try:
+            with open(path) as file:
+                return json.load(file)['cursor']
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def save_cursor(self, path, cursor):
+        if cursor is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        # Замена файла целиком: прерванная запись не портит состояние
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump({'cursor': cursor}, file)
+        os.replace(f'{path}.tmp', path)
+
+    def throttle(self):
+        """Выдерживает паузу между удалениями по --rate"""
+        pause = self.next_delete - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+        self.next_delete = time.monotonic() + self.interval
+
+    def clean(self, batch, options, limit=0):
+        """
+        Удаляет мусор из batch, но не больше limit файлов (0 без
+        ограничения). Возвращает число файлов и байт и имя последнего
+        удаленного файла, если остановились на limit, иначе None
+        """
+        deleted = freed = 0
+        last = None
+        for name in media.find_garbage(batch, options['min_age']):
+            if limit and deleted >= limit:
+                return deleted, freed, last
+            try:
+                size = default_storage.size(name)
+            except FileNotFoundError:
+                continue
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                self.throttle()
+                if not media.delete_garbage(name):
+                    continue
+            deleted += 1
+            freed += size
+            last = name
+        return deleted, freed, None
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        cursor = None if options['restart'] else self.load_cursor(
+            options['state']
+        )
+        if cursor:
+            self.stdout.write(f'Продолжаем после {cursor}')
+        self.interval = 1 / options['rate'] if options['rate'] > 0 else 0
+        self.next_delete = time.monotonic()
+        scanned = deleted = freed = 0
+        finished = True
+        for batch in batches(media.walk(after=cursor), options['batch_size']):
+            scanned += len(batch)
+            limit = options['limit'] and options['limit'] - deleted
+            batch_deleted, batch_freed, stopped = self.clean(
+                batch, options, limit
+            )
+            deleted += batch_deleted
+            freed += batch_freed
+            # Остаток пакета после остановки смотрит следующий запуск
+            cursor = stopped or batch[-1][0]
+            if not dry_run:
+                self.save_cursor(options['state'], cursor)
+            if options['limit'] and deleted >= options['limit']:
+                finished = False
+                break
+        if finished and not dry_run:
+            self.save_cursor(options['state'], None)
+        verb = 'Будет удалено' if dry_run else 'Удалено'
+        self.stdout.write(
+            f'Просмотрено файлов: {scanned}. {verb} файлов: {deleted}, '
+            f'{freed / 2 ** 20:.1f} МБ'
+        )
+        if not finished:
+            self.stdout.write(f'Остановились после {cursor}')
@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Готовит миниатюры картинок постов из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.POST_THUMBNAIL_WORKERS,
+            help='Число процессов в пуле',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Пауза в секундах, когда очередь пуста',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Разобрать очередь и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        pool = None
+        if workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+        total = 0
+        try:
+            while True:
+                close_old_connections()
+                done = thumbnails.process_pending(pool=pool)
+                total += done
+                if done:
+                    self.stdout.write(f'Готово миниатюр: {done}')
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stdout.write(f'Всего готово миниатюр: {total}')
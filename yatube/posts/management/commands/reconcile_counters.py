@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики постов, комментариев и подписок'
+
+    def handle(self, *args, **options):
+        for model, fixed in counters.reconcile().items():
+            self.stdout.write(f'{model}: исправлено строк {fixed}')
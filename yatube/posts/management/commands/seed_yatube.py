@@ -0,0 +1,65 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.seeding import PASSWORD, Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу сгенерированными пользователями, группами, '
+        'постами, комментариями и подписками'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--comments', type=int, default=2000000)
+        parser.add_argument('--follows', type=int, default=200000)
+        parser.add_argument('--seed', type=int, default=1,
+                            help='Зерно генератора')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней разбросать даты')
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='SQLite: вставлять строки одним executemany',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            seeder = Seeder(
+                seed=options['seed'],
+                batch_size=options['batch_size'],
+                days=options['days'],
+                stream=options['stream'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        started = time.perf_counter()
+        rows = seeder.run(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows=options['follows'],
+        )
+        elapsed = time.perf_counter() - started
+        for model, count in rows.items():
+            self.stdout.write(
+                f'{model}: {count} строк, '
+                f'{round(count / seeder.elapsed[model])} строк/с'
+            )
+        total = sum(rows.values())
+        self.stdout.write(
+            f'Всего: {total} строк за {elapsed:.1f} с, '
+            f'{round(total / elapsed)} строк/с'
+        )
+        self.stdout.write(f'Пароль пользователей: {PASSWORD}')
+        if settings.FOLLOW_FEED_FANOUT:
+            self.stdout.write(
+                'Ленты подписок не заполнены: выполните rebuild_follow_feed'
+            )
@@ -0,0 +1,207 @@
+"""
+Удаление картинок постов, на которые больше никто не ссылается.
+
+Картинки хранятся по содержимому (posts.storage), поэтому один файл
+может принадлежать нескольким постам. На SQLite ссылки считают
+триггеры из миграции 0022_mediafile_triggers, на других базах ссылки
+ищутся в posts_post. Файл и его миниатюры удаляются после фиксации
+транзакции, которая убрала последнюю ссылку.
+
+Удаление файла и сохранение картинки с тем же содержимым берут
+блокировку lock, поэтому новый пост не сошлется на файл, который как раз
+удаляется: удаление либо дождется поста и оставит файл, либо закончится
+раньше, и хранилище запишет файл заново.
+
+Файлы, пропущенные этим путем (упавший процесс, правки в обход ORM,
+миниатюры брошенных задач), находит и удаляет команда clean_media.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from sorl.thumbnail import default as sorl
+from sorl.thumbnail import delete as delete_sorl_thumbnails
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .models import MediaFile, Post, Thumbnail
+from .thumbnails import EXTENSIONS, thumbnail_name
+
+# Каталоги MEDIA_ROOT с картинками постов и миниатюрами очереди
+ORIGINALS = Post._meta.get_field('image').upload_to.strip('/')
+DERIVATIVES = 'derivatives'
+
+
+def is_referenced(name):
+    """Ссылается ли на файл name хоть один пост"""
+    if connection.vendor == 'sqlite':
+        return MediaFile.objects.filter(
+            name=name, references_count__gt=0
+        ).exists()
+    return Post.objects.filter(image=name).exists()
+
+
+def lock(name):
+    """
+    Блокирует файл name до конца текущей транзакции.
+    Вне транзакции блокировка снимается сразу
+    """
+    # Запись, а не чтение: на SQLite первая запись транзакции берет
+    # блокировку базы, на других базах UPDATE блокирует строку
+    locked = MediaFile.objects.filter(name=name).update(
+        references_count=F('references_count')
+    )
+    if not locked:
+        MediaFile.objects.get_or_create(name=name)
+        MediaFile.objects.filter(name=name).update(
+            references_count=F('references_count')
+        )
+
+
+def derivative_names(name):
+    """Имена всех миниатюр, которые очередь могла подготовить для name"""
+    return [
+        thumbnail_name(name, geometry, format)
+        for geometry in settings.POST_THUMBNAIL_SIZES
+        for format in EXTENSIONS
+    ]
+
+
+def remove(name):
+    """
+    Удаляет файл name, его миниатюры и счетчик ссылок на него, если
+    на файл не ссылается ни один пост. Возвращает, был ли файл удален
+    """
+    # Ключи sorl зависят от хранилища, поэтому нужен файл из поля
+    image = Post(image=name).image
+    try:
+        image.path
+    except SuspiciousFileOperation:
+        # Путь вне MEDIA_ROOT, записанный в пост вручную: файл не наш
+        return False
+    with transaction.atomic():
+        lock(name)
+        # Пока проверяли ссылки, пост с такой же картинкой мог появиться
+        if Post.objects.filter(image=name).exists():
+            return False
+        MediaFile.objects.filter(name=name).delete()
+        for derivative in derivative_names(name):
+            default_storage.delete(derivative)
+        delete_sorl_thumbnails(image, delete_file=False)
+        image.storage.delete(name)
+    return True
+
+
+def release(name):
+    """
+    Удаляет файл name и его миниатюры, если на него больше не ссылается
+    ни один пост. Возвращает, был ли файл удален
+    """
+    if not name or is_referenced(name):
+        return False
+    return remove(name)
+
+
+def release_on_commit(name):
+    """Откладывает release(name) до фиксации текущей транзакции"""
+    if name:
+        transaction.on_commit(lambda: release(name))
+
+
+def walk(after=None):
+    """
+    Файлы картинок, миниатюр и миниатюр sorl в MEDIA_ROOT в порядке
+    возрастания имени: пары (имя, время изменения) после имени after.
+    В памяти держится по одному каталогу на уровень вложенности
+    """
+    roots = {ORIGINALS, DERIVATIVES, _sorl_root()}
+    yield from _walk(settings.MEDIA_ROOT, '', roots, after)
+
+
+def _sorl_root():
+    return sorl_settings.THUMBNAIL_PREFIX.strip('/')
+
+
+def _walk(path, prefix, roots, after):
+    try:
+        entries = list(os.scandir(path))
+    except FileNotFoundError:
+        return
+    # Каталог сортируется со слешем, чтобы порядок совпал с порядком
+    # полных имен: posts/a.png < posts/a/b.png
+    entries.sort(key=lambda entry: entry.name + (
+        '/' if entry.is_dir(follow_symlinks=False) else ''
+    ))
+    for entry in entries:
+        name = prefix + entry.name
+        if not prefix and name not in roots:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            directory = name + '/'
+            if after and directory < after and not after.startswith(
+                directory
+            ):
+                continue
+            yield from _walk(entry.path, directory, roots, after)
+        elif entry.is_file(follow_symlinks=False) and prefix:
+            if after and name <= after:
+                continue
+            yield name, entry.stat().st_mtime
+
+
+def _unreferenced_originals(names):
+    if connection.vendor == 'sqlite':
+        names = set(names) - set(MediaFile.objects.filter(
+            name__in=names, references_count__gt=0
+        ).values_list('name', flat=True))
+    # Решение об удалении принимается только по самим постам
+    return set(names) - set(Post.objects.filter(
+        image__in=names
+    ).values_list('image', flat=True))
+
+
+def _unreferenced_derivatives(names):
+    return set(names) - set(Thumbnail.objects.filter(
+        image__in=names
+    ).values_list('image', flat=True))
+
+
+def _unreferenced_sorl_thumbnails(names):
+    return {
+        name for name in names
+        if sorl.kvstore.get(ImageFile(name, sorl.storage)) is None
+    }
+
+
+def find_garbage(files, min_age):
+    """
+    Имена файлов из files (пары имя, время изменения), на которые
+    никто не ссылается. Файлы моложе min_age секунд не трогаются:
+    пост или задача миниатюры могут еще не записать ссылку на них
+    """
+    deadline = time.time() - min_age
+    by_root = {}
+    for name, modified in files:
+        if modified < deadline:
+            by_root.setdefault(name.split('/', 1)[0], []).append(name)
+    checks = {
+        ORIGINALS: _unreferenced_originals,
+        DERIVATIVES: _unreferenced_derivatives,
+        _sorl_root(): _unreferenced_sorl_thumbnails,
+    }
+    garbage = set()
+    for root, names in by_root.items():
+        garbage |= checks[root](names)
+    return sorted(garbage)
+
+
+def delete_garbage(name):
+    """Удаляет файл, найденный find_garbage"""
+    if name.startswith(ORIGINALS + '/'):
+        return remove(name)
+    default_storage.delete(name)
+    return True
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Thumbnail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=100, verbose_name='Исходная картинка')),
+                ('geometry', models.CharField(max_length=20, verbose_name='Размер')),
+                ('image', models.CharField(blank=True, max_length=255, verbose_name='Миниатюра')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('processing', 'Обрабатывается'), ('ready', 'Готова'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попытки')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('post', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='thumbnails', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Миниатюра',
+                'verbose_name_plural': 'Миниатюры',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='thumbnail',
+            index=models.Index(fields=['status', 'updated'], name='thumbnail_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='thumbnail',
+            constraint=models.UniqueConstraint(fields=('post', 'geometry'), name='unique_thumbnail'),
+        ),
+    ]
@@ -0,0 +1,149 @@
+from django.db import migrations
+
+# Триггеры держат счетчики в той же транзакции, что и изменение,
+# в том числе при bulk_create, каскадных удалениях и правках из админки
+TRIGGERS = {
+    'posts_post_stats_insert': '''
+        CREATE TRIGGER posts_post_stats_insert
+        AFTER INSERT ON posts_post
+        BEGIN
+            INSERT OR IGNORE INTO posts_authorstats
+                (user_id, posts_count, followers_count, following_count)
+                VALUES (NEW.author_id, 0, 0, 0);
+            UPDATE posts_authorstats SET posts_count = posts_count + 1
+                WHERE user_id = NEW.author_id;
+            INSERT OR IGNORE INTO posts_groupstats (group_id, posts_count)
+                SELECT NEW.group_id, 0 WHERE NEW.group_id IS NOT NULL;
+            UPDATE posts_groupstats SET posts_count = posts_count + 1
+                WHERE group_id = NEW.group_id;
+        END
+    ''',
+    'posts_post_stats_delete': '''
+        CREATE TRIGGER posts_post_stats_delete
+        AFTER DELETE ON posts_post
+        BEGIN
+            UPDATE posts_authorstats SET posts_count = posts_count - 1
+                WHERE user_id = OLD.author_id AND posts_count > 0;
+            UPDATE posts_groupstats SET posts_count = posts_count - 1
+                WHERE group_id = OLD.group_id AND posts_count > 0;
+        END
+    ''',
+    'posts_post_stats_group': '''
+        CREATE TRIGGER posts_post_stats_group
+        AFTER UPDATE OF group_id ON posts_post
+        WHEN OLD.group_id IS NOT NEW.group_id
+        BEGIN
+            UPDATE posts_groupstats SET posts_count = posts_count - 1
+                WHERE group_id = OLD.group_id AND posts_count > 0;
+            INSERT OR IGNORE INTO posts_groupstats (group_id, posts_count)
+                SELECT NEW.group_id, 0 WHERE NEW.group_id IS NOT NULL;
+            UPDATE posts_groupstats SET posts_count = posts_count + 1
+                WHERE group_id = NEW.group_id;
+        END
+    ''',
+    'posts_post_stats_author': '''
+        CREATE TRIGGER posts_post_stats_author
+        AFTER UPDATE OF author_id ON posts_post
+        WHEN OLD.author_id IS NOT NEW.author_id
+        BEGIN
+            UPDATE posts_authorstats SET posts_count = posts_count - 1
+                WHERE user_id = OLD.author_id AND posts_count > 0;
+            INSERT OR IGNORE INTO posts_authorstats
+                (user_id, posts_count, followers_count, following_count)
+                VALUES (NEW.author_id, 0, 0, 0);
+            UPDATE posts_authorstats SET posts_count = posts_count + 1
+                WHERE user_id = NEW.author_id;
+        END
+    ''',
+    'posts_comment_stats_insert': '''
+        CREATE TRIGGER posts_comment_stats_insert
+        AFTER INSERT ON posts_comment
+        BEGIN
+            INSERT OR IGNORE INTO posts_poststats (post_id, comments_count)
+                VALUES (NEW.post_id, 0);
+            UPDATE posts_poststats SET comments_count = comments_count + 1
+                WHERE post_id = NEW.post_id;
+        END
+    ''',
+    'posts_comment_stats_delete': '''
+        CREATE TRIGGER posts_comment_stats_delete
+        AFTER DELETE ON posts_comment
+        BEGIN
+            UPDATE posts_poststats SET comments_count = comments_count - 1
+                WHERE post_id = OLD.post_id AND comments_count > 0;
+        END
+    ''',
+    'posts_follow_stats_insert': '''
+        CREATE TRIGGER posts_follow_stats_insert
+        AFTER INSERT ON posts_follow
+        BEGIN
+            INSERT OR IGNORE INTO posts_authorstats
+                (user_id, posts_count, followers_count, following_count)
+                VALUES (NEW.author_id, 0, 0, 0), (NEW.user_id, 0, 0, 0);
+            UPDATE posts_authorstats
+                SET followers_count = followers_count + 1
+                WHERE user_id = NEW.author_id;
+            UPDATE posts_authorstats
+                SET following_count = following_count + 1
+                WHERE user_id = NEW.user_id;
+        END
+    ''',
+    'posts_follow_stats_delete': '''
+        CREATE TRIGGER posts_follow_stats_delete
+        AFTER DELETE ON posts_follow
+        BEGIN
+            UPDATE posts_authorstats
+                SET followers_count = followers_count - 1
+                WHERE user_id = OLD.author_id AND followers_count > 0;
+            UPDATE posts_authorstats
+                SET following_count = following_count - 1
+                WHERE user_id = OLD.user_id AND following_count > 0;
+        END
+    ''',
+}
+
+FILL_STATS = (
+    '''
+    INSERT INTO posts_authorstats
+        (user_id, posts_count, followers_count, following_count)
+    SELECT id,
+        (SELECT COUNT(*) FROM posts_post WHERE author_id = auth_user.id),
+        (SELECT COUNT(*) FROM posts_follow WHERE author_id = auth_user.id),
+        (SELECT COUNT(*) FROM posts_follow WHERE user_id = auth_user.id)
+    FROM auth_user
+    ''',
+    '''
+    INSERT INTO posts_groupstats (group_id, posts_count)
+    SELECT group_id, COUNT(*) FROM posts_post
+    WHERE group_id IS NOT NULL GROUP BY group_id
+    ''',
+    '''
+    INSERT INTO posts_poststats (post_id, comments_count)
+    SELECT post_id, COUNT(*) FROM posts_comment GROUP BY post_id
+    ''',
+)
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in FILL_STATS + tuple(TRIGGERS.values()):
+        schema_editor.execute(sql)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,72 @@
+from django.db import migrations
+
+# Внешнее содержимое: индекс FTS5 хранит только словарь и позиции,
+# текст постов читается из posts_post по rowid
+FORWARD = (
+    '''
+    CREATE VIRTUAL TABLE posts_post_fts USING fts5(
+        text,
+        content='posts_post',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    ''',
+    "INSERT INTO posts_post_fts (posts_post_fts) VALUES ('rebuild')",
+    '''
+    CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO posts_post_fts (rowid, text) VALUES (NEW.id, NEW.text);
+    END
+    ''',
+    '''
+    CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post
+    BEGIN
+        INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+            VALUES ('delete', OLD.id, OLD.text);
+    END
+    ''',
+    '''
+    CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text ON posts_post
+    BEGIN
+        INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+            VALUES ('delete', OLD.id, OLD.text);
+        INSERT INTO posts_post_fts (rowid, text) VALUES (NEW.id, NEW.text);
+    END
+    ''',
+)
+
+TRIGGERS = (
+    'posts_post_fts_insert',
+    'posts_post_fts_delete',
+    'posts_post_fts_update',
+)
+
+BACKWARD = (
+    *(f'DROP TRIGGER IF EXISTS {name}' for name in TRIGGERS),
+    'DROP TABLE IF EXISTS posts_post_fts',
+)
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in FORWARD:
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in BACKWARD:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_stats_triggers'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
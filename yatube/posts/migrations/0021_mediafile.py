@@ -0,0 +1,40 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:59
+
+from django.db import migrations, models
+import posts.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_thumbnail_format'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Файл')),
+                ('references_count', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        # Хранилище не меняет схему, а пересоздание posts_post на SQLite
+        # удалило бы триггеры счетчиков и поиска
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='post',
+                    name='image',
+                    field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='thumbnail',
+            index=models.Index(fields=['source'], name='thumbnail_source_idx'),
+        ),
+    ]
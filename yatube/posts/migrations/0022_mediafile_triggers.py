@@ -0,0 +1,74 @@
+from django.db import migrations
+
+# Триггеры считают ссылки постов на файл картинки в той же транзакции,
+# что и изменение поста, в том числе при каскадном удалении
+TRIGGERS = {
+    'posts_post_media_insert': '''
+        CREATE TRIGGER posts_post_media_insert
+        AFTER INSERT ON posts_post
+        WHEN NEW.image != ''
+        BEGIN
+            INSERT OR IGNORE INTO posts_mediafile (name, references_count)
+                VALUES (NEW.image, 0);
+            UPDATE posts_mediafile
+                SET references_count = references_count + 1
+                WHERE name = NEW.image;
+        END
+    ''',
+    'posts_post_media_delete': '''
+        CREATE TRIGGER posts_post_media_delete
+        AFTER DELETE ON posts_post
+        WHEN OLD.image != ''
+        BEGIN
+            UPDATE posts_mediafile
+                SET references_count = references_count - 1
+                WHERE name = OLD.image AND references_count > 0;
+        END
+    ''',
+    'posts_post_media_update': '''
+        CREATE TRIGGER posts_post_media_update
+        AFTER UPDATE OF image ON posts_post
+        WHEN OLD.image IS NOT NEW.image
+        BEGIN
+            UPDATE posts_mediafile
+                SET references_count = references_count - 1
+                WHERE name = OLD.image AND references_count > 0;
+            INSERT OR IGNORE INTO posts_mediafile (name, references_count)
+                SELECT NEW.image, 0 WHERE NEW.image != '';
+            UPDATE posts_mediafile
+                SET references_count = references_count + 1
+                WHERE name = NEW.image;
+        END
+    ''',
+}
+
+FILL_REFERENCES = '''
+    INSERT INTO posts_mediafile (name, references_count)
+    SELECT image, COUNT(*) FROM posts_post
+    WHERE image != '' GROUP BY image
+'''
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in (FILL_REFERENCES, *TRIGGERS.values()):
+        schema_editor.execute(sql)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_mediafile'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
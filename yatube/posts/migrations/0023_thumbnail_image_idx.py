@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_mediafile_triggers'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='thumbnail',
+            index=models.Index(fields=['image'], name='thumbnail_image_idx'),
+        ),
+    ]
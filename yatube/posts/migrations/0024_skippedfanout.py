@@ -0,0 +1,43 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def mark_popular_posts(apps, schema_editor):
+    # Неизвестно, какие посты нынешних популярных авторов уже разложены,
+    # поэтому при чтении подмешиваются все их посты
+    Post = apps.get_model('posts', 'Post')
+    SkippedFanout = apps.get_model('posts', 'SkippedFanout')
+    posts = Post.objects.filter(
+        author__stats__followers_count__gt=settings.FOLLOW_FEED_FANOUT_LIMIT
+    ).values_list('pk', 'author_id')
+    SkippedFanout.objects.bulk_create(
+        (SkippedFanout(post_id=pk, author_id=author_id)
+         for pk, author_id in posts.iterator()),
+        batch_size=settings.FOLLOW_FEED_BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0023_thumbnail_image_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkippedFanout',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='skipped_fanout', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='skipped_fanouts', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Пост без раскладки',
+                'verbose_name_plural': 'Посты без раскладки',
+            },
+        ),
+        migrations.RunPython(mark_popular_posts, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,10 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.db import models
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -14,6 +17,18 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Все, что нужно карточке поста, за постоянное число запросов"""
+        return self.select_related('author', 'group').prefetch_related(
+            'thumbnails'
+        )
+
+    def for_detail(self):
+        """Пост для страницы поста вместе со счетчиками"""
+        return self.for_feed().select_related('author__stats', 'stats')
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста',
@@ -28,6 +43,7 @@ class Post(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Автор',
         related_name='posts',
+        db_index=False,
     )
     group = models.ForeignKey(
         Group,
@@ -35,6 +51,7 @@ class Post(models.Model):
         blank=True,
         null=True,
         related_name='posts',
+        db_index=False,
         verbose_name='Группа',
         help_text='Выберите группу',
     )
@@ -42,13 +59,30 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True,
     )
 
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_id_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text[:settings.POST_STRINGER_LENGTH]
@@ -63,6 +97,7 @@ class Comment(models.Model):
         Post,
         on_delete=models.CASCADE,
         related_name='comments',
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
@@ -78,6 +113,12 @@ class Comment(models.Model):
         ordering = ['-created']
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_id_idx',
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -86,12 +127,14 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Подписчик',
         related_name='follower',
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         verbose_name='Автор',
         related_name='following',
+        db_index=False,
     )
 
     class Meta:
@@ -101,3 +144,204 @@ class Follow(models.Model):
                 name='unique_subscription'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx',
+            ),
+        ]
+
+
+class FeedEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed_entries',
+        db_index=False,
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='feed_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+',
+        db_index=False,
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_post_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx',
+            ),
+        ]
+
+
+class SkippedFanout(models.Model):
+    """
+    Пост, который не разложили по лентам подписчиков: у автора было
+    больше FOLLOW_FEED_FANOUT_LIMIT подписчиков. Ленты подмешивают
+    такие посты при чтении, даже когда подписчиков стало меньше
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='skipped_fanout',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='skipped_fanouts',
+        verbose_name='Автор',
+    )
+
+    class Meta:
+        verbose_name = 'Пост без раскладки'
+        verbose_name_plural = 'Посты без раскладки'
+
+
+class Thumbnail(models.Model):
+    """Заранее подготовленная миниатюра картинки поста"""
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'Обрабатывается'),
+        (READY, 'Готова'),
+        (FAILED, 'Ошибка'),
+    )
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='thumbnails',
+        db_index=False,
+    )
+    source = models.CharField('Исходная картинка', max_length=100)
+    geometry = models.CharField('Размер', max_length=20)
+    format = models.CharField('Формат', max_length=10, default='jpeg')
+    image = models.CharField('Миниатюра', max_length=255, blank=True)
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField('Попытки', default=0)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Миниатюра'
+        verbose_name_plural = 'Миниатюры'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'geometry', 'format'],
+                name='unique_thumbnail'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['status', 'updated'],
+                name='thumbnail_status_idx',
+            ),
+            models.Index(
+                fields=['source'],
+                name='thumbnail_source_idx',
+            ),
+            models.Index(
+                fields=['image'],
+                name='thumbnail_image_idx',
+            ),
+        ]
+
+    @property
+    def url(self):
+        return default_storage.url(self.image)
+
+
+class AuthorStats(models.Model):
+    """Счетчики пользователя, их поддерживают триггеры базы"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+
+class GroupStats(models.Model):
+    """Счетчики группы, их поддерживают триггеры базы"""
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Группа',
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+
+    class Meta:
+        verbose_name = 'Счетчики группы'
+        verbose_name_plural = 'Счетчики групп'
+
+
+class PostStats(models.Model):
+    """Счетчики поста, их поддерживают триггеры базы"""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пост',
+    )
+    comments_count = models.PositiveIntegerField('Комментариев', default=0)
+
+    class Meta:
+        verbose_name = 'Счетчики поста'
+        verbose_name_plural = 'Счетчики постов'
+
+
+class MediaFile(models.Model):
+    """
+    Число постов, ссылающихся на файл картинки.
+    Счетчик поддерживают триггеры базы
+    """
+    name = models.CharField('Файл', max_length=100, primary_key=True)
+    references_count = models.PositiveIntegerField('Ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
@@ -0,0 +1,55 @@
+"""
+Полнотекстовый поиск по постам.
+
+На SQLite запрос идет в индекс FTS5 posts_post_fts из миграции
+0019_post_fts, который триггеры обновляют вместе с posts_post.
+Релевантность bm25 делится на (1 + возраст / SEARCH_RECENCY_DAYS),
+поэтому при равной релевантности выше оказываются свежие посты.
+На других базах остается поиск подстроки.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+WORD = re.compile(r'\w+')
+
+RANK_SQL = (
+    f'bm25({FTS_TABLE}) / '
+    "(1 + (julianday('now') - julianday(posts_post.pub_date)) / %s)"
+)
+
+
+def match_expression(query):
+    """
+    Превращает ввод пользователя в запрос FTS5: каждое слово в кавычках,
+    последнее ищется по префиксу. None, если слов нет
+    """
+    words = WORD.findall(query.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_posts(query):
+    """Посты по запросу query, от самых подходящих к остальным"""
+    expression = match_expression(query)
+    if expression is None:
+        return Post.objects.none()
+    if connection.vendor != 'sqlite':
+        return Post.objects.filter(text__icontains=query)
+    return Post.objects.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = posts_post.id',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[expression],
+        select={'rank': RANK_SQL},
+        select_params=[settings.SEARCH_RECENCY_DAYS],
+    ).order_by('rank', '-pub_date')
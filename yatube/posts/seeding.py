@@ -0,0 +1,250 @@
+"""
+Генерация больших объемов данных для замеров и тестовых стендов.
+
+Все строки создаются через bulk_create пачками по batch_size, а на
+SQLite их можно передать потоком в один executemany (stream=True).
+Значения выбираются генератором со своим зерном, поэтому один и тот же
+набор параметров дает одну и ту же базу. Авторы и популярные авторы
+распределены по закону Ципфа, как в живой соцсети.
+"""
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Comment, Follow, Group, Post, User
+
+USERNAME = 'seed_user_{}'
+PASSWORD = 'seed-password'
+WORDS = (
+    'утро вечер город лес река море поезд книга письмо песня окно дом '
+    'дорога ветер снег дождь солнце друг кот собака чай кофе сад поле '
+    'гора мост небо звезда музыка картина работа отпуск праздник'
+).split()
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Отключает auto_now_add у fields, чтобы сохранить заданные даты"""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def zipf_weights(size):
+    """Накопленные веса для random.choices: k-й элемент в k раз реже"""
+    return list(itertools.accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def ids(model):
+    return list(model.objects.order_by('pk').values_list('pk', flat=True))
+
+
+def make_text(generator, low=5, high=40):
+    return ' '.join(generator.choices(WORDS, k=generator.randint(low, high)))
+
+
+class Seeder:
+    """
+    Заполняет базу пользователями, группами, постами, комментариями
+    и подписками. rows хранит число созданных строк каждой модели
+    """
+
+    def __init__(self, seed=1, batch_size=1000, days=365, stream=False):
+        if stream and connection.vendor != 'sqlite':
+            raise ValueError('Потоковая вставка работает только на SQLite')
+        self.generator = random.Random(seed)
+        self.batch_size = batch_size
+        self.stream = stream
+        self.now = timezone.now()
+        self.days = days
+        self.rows = {}
+        self.elapsed = {}
+
+    def random_date(self):
+        return self.now - timedelta(
+            seconds=self.generator.uniform(0, self.days * 24 * 60 * 60)
+        )
+
+    def executemany(self, model, objects):
+        """
+        Передает строки в sqlite3 одним executemany, минуя компилятор
+        запросов и курсор Django: тот в DEBUG запомнил бы все параметры.
+        В каждый INSERT попадает сразу пачка строк: FTS5 и триггеры
+        счетчиков обходятся намного дешевле, чем по INSERT на строку
+        """
+        fields = [
+            field for field in model._meta.concrete_fields
+            if not field.primary_key
+        ]
+        size = max(1, min(
+            self.batch_size,
+            connection.features.max_query_params // len(fields),
+        ))
+
+        def statement(rows):
+            return 'INSERT OR IGNORE INTO {} ({}) VALUES {}'.format(
+                model._meta.db_table,
+                ', '.join(field.column for field in fields),
+                ', '.join(
+                    ['({})'.format(', '.join('?' * len(fields)))] * rows
+                ),
+            )
+
+        values = (
+            [
+                field.get_db_prep_save(
+                    getattr(obj, field.attname), connection
+                )
+                for field in fields
+            ]
+            for obj in objects
+        )
+        state = {'rows': 0, 'tail': []}
+
+        def full_batches():
+            for batch in batched(values, size):
+                state['rows'] += len(batch)
+                if len(batch) < size:
+                    state['tail'] = batch
+                    return
+                yield list(itertools.chain.from_iterable(batch))
+
+        connection.ensure_connection()
+        connection.connection.executemany(statement(size), full_batches())
+        if state['tail']:
+            connection.connection.execute(
+                statement(len(state['tail'])),
+                list(itertools.chain.from_iterable(state['tail'])),
+            )
+        return state['rows']
+
+    def insert(self, model, objects):
+        """
+        Сохраняет объекты, возвращает число вставленных строк.
+        Повторы, которые отбросила вставка с ignore_conflicts, не
+        считаются: строки считаются через COUNT до и после вставки
+        """
+        before = model.objects.count()
+        started = time.perf_counter()
+        if self.stream:
+            self.executemany(model, objects)
+        else:
+            for batch in batched(objects, self.batch_size):
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+        elapsed = time.perf_counter() - started
+        count = model.objects.count() - before
+        name = model.__name__
+        self.rows[name] = self.rows.get(name, 0) + count
+        self.elapsed[name] = self.elapsed.get(name, 0) + elapsed
+        return count
+
+    def users(self, count):
+        # Хэш один на всех: пароль нужен, чтобы войти на стенд
+        password = make_password(PASSWORD)
+        start = User.objects.count()
+        self.insert(User, (
+            User(
+                username=USERNAME.format(start + number),
+                first_name=self.generator.choice(WORDS).title(),
+                password=password,
+            )
+            for number in range(count)
+        ))
+
+    def groups(self, count):
+        start = Group.objects.count()
+        self.insert(Group, (
+            Group(
+                title=f'Группа {start + number}',
+                slug=f'seed-group-{start + number}',
+                description=make_text(self.generator),
+            )
+            for number in range(count)
+        ))
+
+    def posts(self, count, group_share=0.7):
+        authors = ids(User)
+        groups = ids(Group)
+        weights = zipf_weights(len(authors))
+        generator = self.generator
+        with explicit_dates(Post._meta.get_field('pub_date')):
+            self.insert(Post, (
+                Post(
+                    author_id=generator.choices(
+                        authors, cum_weights=weights
+                    )[0],
+                    group_id=(
+                        generator.choice(groups)
+                        if groups and generator.random() < group_share
+                        else None
+                    ),
+                    text=make_text(generator),
+                    pub_date=self.random_date(),
+                )
+                for _ in range(count)
+            ))
+
+    def comments(self, count):
+        posts = ids(Post)
+        users = ids(User)
+        weights = zipf_weights(len(posts))
+        generator = self.generator
+        with explicit_dates(Comment._meta.get_field('created')):
+            self.insert(Comment, (
+                Comment(
+                    post_id=generator.choices(posts, cum_weights=weights)[0],
+                    author_id=generator.choice(users),
+                    text=make_text(generator, 1, 15),
+                    created=self.random_date(),
+                )
+                for _ in range(count)
+            ))
+
+    def follows(self, count):
+        """Подписки на популярных авторов; повторы отбрасываются"""
+        users = ids(User)
+        weights = zipf_weights(len(users))
+        generator = self.generator
+
+        def pairs():
+            seen = set()
+            for _ in range(count):
+                user = generator.choice(users)
+                author = generator.choices(users, cum_weights=weights)[0]
+                if user != author and (user, author) not in seen:
+                    seen.add((user, author))
+                    yield Follow(user_id=user, author_id=author)
+        self.insert(Follow, pairs())
+
+    def run(self, users=0, groups=0, posts=0, comments=0, follows=0):
+        with transaction.atomic():
+            if users:
+                self.users(users)
+            if groups:
+                self.groups(groups)
+            if posts:
+                self.posts(posts)
+            if comments:
+                self.comments(comments)
+            if follows:
+                self.follows(follows)
+        return self.rows
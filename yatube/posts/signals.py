@@ -0,0 +1,93 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import caching, media
+from .models import Comment, Follow, Group, Post, User
+
+# Поля пользователя, которые видны в карточке поста
+CARD_USER_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_state(sender, instance, **kwargs):
+    instance._previous_group_id = None
+    instance._previous_image = ''
+    if instance.pk is not None:
+        instance._previous_group_id, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group_id', 'image'
+            ).first() or (None, '')
+        )
+
+
+@receiver(post_save, sender=Post)
+def release_previous_image(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_image', '')
+    if previous != instance.image.name:
+        media.release_on_commit(previous)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    media.release_on_commit(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    caching.invalidate_card_for_write(instance)
+    group_ids = {
+        instance.group_id,
+        getattr(instance, '_previous_group_id', None),
+    } - {None}
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True
+    )
+    caching.bump_generation_for_write(
+        caching.INDEX_SCOPE,
+        caching.post_scope(instance.pk),
+        caching.author_scope(instance.author.username),
+        *(caching.group_scope(slug) for slug in slugs),
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comments(sender, instance, **kwargs):
+    caching.bump_generation_for_write(caching.post_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    """Профили обоих показывают счетчики подписок"""
+    caching.bump_generation_for_write(
+        caching.author_scope(instance.user.username),
+        caching.author_scope(instance.author.username),
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_group(sender, instance, created=False, **kwargs):
+    if created:
+        # Адрес новой группы раньше отвечал 404
+        caching.bump_generation_for_write(caching.group_scope(instance.slug))
+    else:
+        caching.invalidate_cards_for_write(instance.posts.all())
+        caching.bump_generation_for_write(caching.FEEDS_SCOPE)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields, **kwargs):
+    if created:
+        # Адрес профиля нового автора раньше отвечал 404
+        caching.bump_generation_for_write(
+            caching.author_scope(instance.username)
+        )
+        return
+    if update_fields and not CARD_USER_FIELDS & set(update_fields):
+        return
+    caching.invalidate_cards_for_write(instance.posts.all())
+    caching.bump_generation_for_write(caching.FEEDS_SCOPE)
@@ -0,0 +1,46 @@
+"""
+Хранилище картинок постов с именами по содержимому.
+
+Файл называется sha256 своего содержимого, поэтому одинаковые картинки
+хранятся одним файлом, а миниатюры, имена которых выводятся из имени
+исходной картинки, готовятся для них один раз.
+"""
+import hashlib
+import posixpath
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def hashed_name(self, name, content):
+        """posts/photo.JPG -> posts/ab/cd/abcd...ef.jpg"""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(
+            directory, digest[:2], digest[2:4], digest + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        # Удаление этого файла ждет конца транзакции, которая сохраняет
+        # ссылающийся на него пост (см. posts.media)
+        from .media import lock
+        lock(name)
+        if self.exists(name):
+            return name
+        saved = super().save(name, content, max_length)
+        if saved != name:
+            # Такой же файл успел сохранить параллельный запрос
+            self.delete(saved)
+        return name
@@ -0,0 +1,14 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts import caching
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts, show_author):
+    """Карточки постов страницы, собранные из кэша фрагментов"""
+    return [
+        mark_safe(card) for card in caching.render_cards(posts, show_author)
+    ]
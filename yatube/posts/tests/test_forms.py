@@ -1,11 +1,16 @@
+import hashlib
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
+from ..forms import PostForm
 from ..models import Comment, Group, Post, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -24,6 +29,8 @@ class CreateFormTests(TestCase):
             b'\x02\x00\x01\x00\x00\x02\x02\x0C'
             b'\x0A\x00\x3B'
         )
+        digest = hashlib.sha256(small_gif).hexdigest()
+        cls.image_name = f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
         cls.uploaded = SimpleUploadedFile(
             name='small.gif',
             content=small_gif,
@@ -71,7 +78,7 @@ class CreateFormTests(TestCase):
         self.assertEqual(Post.objects.count(), num_posts + 1)
         self.assertTrue(Post.objects.filter(
             text=form_data['text'],
-            image='posts/small.gif',
+            image=self.image_name,
         ).exists())
 
     def test_edit_post(self):
@@ -131,3 +138,71 @@ class CreateFormTests(TestCase):
             text=self.comment_data['text']
         ).exists())
         self.assertEqual(init_num_comments + 1, final_num_comments)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_MAX_SIDE=500)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='uploader')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def get_image(name, size, format, **options):
+        content = BytesIO()
+        Image.new('RGB', size, color=(0, 128, 255)).save(
+            content, format, **options
+        )
+        return SimpleUploadedFile(name, content.getvalue())
+
+    def save_post(self, image):
+        form = PostForm({'text': 'Пост с картинкой'}, {'image': image})
+        self.assertTrue(form.is_valid(), form.errors)
+        post = form.save(commit=False)
+        post.author = self.user
+        post.save()
+        return post
+
+    def test_large_image_is_downscaled_and_rotated(self):
+        """
+        Проверяем, что большая картинка уменьшается, поворачивается
+        по EXIF и сохраняется без метаданных
+        """
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        post = self.save_post(self.get_image(
+            'photo.jpg', (3000, 1000), 'JPEG', exif=exif.tobytes()
+        ))
+        self.assertRegex(
+            post.image.name, r'^posts/\w\w/\w\w/[0-9a-f]{64}\.jpg$'
+        )
+        with default_storage.open(post.image.name) as file:
+            stored = Image.open(file)
+            self.assertEqual(stored.size, (167, 500))
+            self.assertNotIn('exif', stored.info)
+
+    def test_small_image_without_metadata_is_kept(self):
+        """Проверяем, что подходящая картинка хранится как есть"""
+        image = self.get_image('small.png', (100, 50), 'PNG')
+        content = image.read()
+        image.seek(0)
+        post = self.save_post(image)
+        with default_storage.open(post.image.name) as file:
+            self.assertEqual(file.read(), content)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels(self):
+        """Проверяем, что картинка больше предела не принимается"""
+        form = PostForm(
+            {'text': 'Пост с картинкой'},
+            {'image': self.get_image('big.png', (100, 100), 'PNG')},
+        )
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code, 'too_many_pixels'
+        )
@@ -0,0 +1,222 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from PIL import Image
+
+from .. import media, thumbnails
+from ..models import MediaFile, Post, Thumbnail, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedMediaTests(TransactionTestCase):
+    """Файлы удаляются после фиксации транзакции"""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    @staticmethod
+    def get_image(name='meme.png', color=(255, 0, 0)):
+        content = BytesIO()
+        Image.new('RGB', (100, 50), color=color).save(content, 'png')
+        return SimpleUploadedFile(name, content.getvalue(), 'image/png')
+
+    def create_post(self, text, image):
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': text, 'image': image},
+        )
+        return Post.objects.get(text=text)
+
+    def references(self, name):
+        return MediaFile.objects.get(name=name).references_count
+
+    def test_same_content_is_stored_once(self):
+        """Проверяем, что одинаковые картинки хранятся одним файлом"""
+        first = self.create_post('Первый', self.get_image('first.png'))
+        second = self.create_post('Второй', self.get_image('second.png'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(default_storage.exists(first.image.name))
+        self.assertEqual(self.references(first.image.name), 2)
+
+    def test_file_removed_with_last_reference(self):
+        """Проверяем, что файл и миниатюры удаляются с последним постом"""
+        first = self.create_post('Первый', self.get_image())
+        second = self.create_post('Второй', self.get_image())
+        name = first.image.name
+        thumbnails.process_pending()
+        derivative = thumbnails.thumbnail_name(name, '960x339')
+        first.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(derivative))
+        second.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(derivative))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+
+    def test_edit_releases_previous_image(self):
+        """Проверяем, что после смены картинки старый файл удаляется"""
+        post = self.create_post('Пост', self.get_image())
+        previous = post.image.name
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={
+                'text': 'Пост',
+                'image': self.get_image(color=(0, 0, 255)),
+            },
+        )
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, previous)
+        self.assertFalse(default_storage.exists(previous))
+        self.assertTrue(default_storage.exists(post.image.name))
+        self.assertEqual(self.references(post.image.name), 1)
+
+    def test_remove_rechecks_references(self):
+        """
+        Проверяем, что файл не удаляется, если на него успел сослаться
+        новый пост, пока release проверял ссылки
+        """
+        post = self.create_post('Пост', self.get_image())
+        name = post.image.name
+        self.assertFalse(media.remove(name))
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(self.references(name), 1)
+
+    def test_ready_thumbnails_are_reused(self):
+        """Проверяем, что повтор картинки не ставит миниатюры в очередь"""
+        self.create_post('Первый', self.get_image())
+        thumbnails.process_pending()
+        second = self.create_post('Второй', self.get_image())
+        self.assertFalse(
+            second.thumbnails.exclude(status=Thumbnail.READY).exists()
+        )
+        self.assertEqual(thumbnails.process_pending(), 0)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CleanMediaTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.state = os.path.join(TEMP_MEDIA_ROOT, 'state.json')
+        self.post = Post.objects.create(author=self.user, text='Пост')
+        self.post.image.save('used.png', ContentFile(b'used'))
+        self.used = self.post.image.name
+        self.derivative = default_storage.save(
+            thumbnails.thumbnail_name(self.used, '960x339'),
+            ContentFile(b'derivative'),
+        )
+        Thumbnail.objects.create(
+            post=self.post,
+            source=self.used,
+            geometry='960x339',
+            image=self.derivative,
+            status=Thumbnail.READY,
+        )
+        self.orphans = [
+            Post.image.field.storage.save(
+                'posts/orphan.png', ContentFile(b'orphan')
+            ),
+            default_storage.save(
+                thumbnails.thumbnail_name('posts/gone.png', '960x339'),
+                ContentFile(b'stale'),
+            ),
+            default_storage.save(
+                'cache/ab/cd/stale.jpg', ContentFile(b'sorl'),
+            ),
+        ]
+
+    def tearDown(self):
+        for name in os.listdir(TEMP_MEDIA_ROOT):
+            shutil.rmtree(
+                os.path.join(TEMP_MEDIA_ROOT, name), ignore_errors=True
+            )
+
+    def clean_media(self, *args):
+        out = StringIO()
+        call_command(
+            'clean_media', '--min-age=0', f'--state={self.state}', *args,
+            stdout=out,
+        )
+        return out.getvalue()
+
+    def assertKept(self, *names):
+        for name in names:
+            with self.subTest(name=name):
+                self.assertTrue(default_storage.exists(name))
+
+    def test_dry_run(self):
+        """Проверяем, что пробный запуск только показывает файлы"""
+        output = self.clean_media('--dry-run')
+        for name in self.orphans:
+            with self.subTest(name=name):
+                self.assertIn(name, output)
+        self.assertKept(self.used, self.derivative, *self.orphans)
+
+    def test_deletes_only_unreferenced(self):
+        """Проверяем, что удаляются только файлы без ссылок"""
+        self.clean_media()
+        self.assertKept(self.used, self.derivative)
+        for name in self.orphans:
+            with self.subTest(name=name):
+                self.assertFalse(default_storage.exists(name))
+        self.assertFalse(os.path.exists(self.state))
+
+    def test_resume(self):
+        """Проверяем, что следующий запуск продолжает с места остановки"""
+        self.clean_media('--batch-size=1', '--limit=1')
+        self.assertTrue(os.path.exists(self.state))
+        remaining = [
+            name for name in self.orphans if default_storage.exists(name)
+        ]
+        self.assertEqual(len(remaining), len(self.orphans) - 1)
+        self.clean_media('--batch-size=1')
+        for name in self.orphans:
+            with self.subTest(name=name):
+                self.assertFalse(default_storage.exists(name))
+        self.assertFalse(os.path.exists(self.state))
+
+    def test_limit_inside_batch(self):
+        """
+        Проверяем, что --limit останавливает удаление посреди пакета,
+        а следующий запуск удаляет остаток этого пакета
+        """
+        self.clean_media('--limit=1')
+        remaining = [
+            name for name in self.orphans if default_storage.exists(name)
+        ]
+        self.assertEqual(len(remaining), len(self.orphans) - 1)
+        self.clean_media()
+        for name in self.orphans:
+            with self.subTest(name=name):
+                self.assertFalse(default_storage.exists(name))
+
+    def test_young_files_are_kept(self):
+        """Проверяем, что свежие файлы не удаляются"""
+        call_command(
+            'clean_media', f'--state={self.state}', stdout=StringIO()
+        )
+        self.assertKept(*self.orphans)
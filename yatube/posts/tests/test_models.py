@@ -1,7 +1,16 @@
+from unittest import mock
+
 from django.conf import settings
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Group, Post, User
+from .. import counters, feed
+from ..checks import check_triggers
+from ..models import (AuthorStats, Comment, Follow, Group, GroupStats, Post,
+                      PostStats, User)
+from ..seeding import Seeder
+from ..utils import encode_cursor, paginate_comments, paginate_feed
 
 
 class PostModelTest(TestCase):
@@ -58,3 +67,296 @@ class PostModelTest(TestCase):
                     self.post._meta.get_field(field).help_text,
                     help_text
                 )
+
+
+class QueryPlanTest(TestCase):
+    """Проверяем, что ленты читаются по индексам, без полных сканов"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='plan_user')
+        cls.group = Group.objects.create(
+            title='Группа для плана',
+            slug='plan-slug',
+            description='Описание группы для плана',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Пост для плана',
+            group=cls.group,
+        )
+
+    def assert_uses_indexes(self, queryset, allow_sort=False):
+        self.assert_plan(queryset.explain(), allow_sort)
+
+    def assert_plan(self, plan, allow_sort=False):
+        for line in plan.splitlines():
+            with self.subTest(line=line):
+                if ' SCAN ' in f' {line} ':
+                    self.assertIn('USING', line)
+        if not allow_sort:
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def issued_plans(self, load, table='posts_post'):
+        """Планы запросов к таблице table, которые выполнила load()"""
+        with CaptureQueriesContext(connection) as queries:
+            load()
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if f'FROM "{table}"' not in query['sql']:
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans.append('\n'.join(
+                    ' '.join(map(str, row)) for row in cursor.fetchall()
+                ))
+        self.assertTrue(plans)
+        return plans
+
+    def test_feeds_use_indexes(self):
+        """Проверяем планы запросов лент и комментариев"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('План проверяется только для SQLite')
+        querysets = {
+            'index': Post.objects.select_related('group', 'author'),
+            'group': self.group.posts.all(),
+            'profile': self.user.posts.all(),
+            'keyset': Post.objects.filter(
+                pub_date__lt=self.post.pub_date
+            ).order_by('-pub_date', '-pk'),
+            'comments': self.post.comments.all(),
+            'following': Follow.objects.filter(author=self.user),
+        }
+        for name, queryset in querysets.items():
+            with self.subTest(name=name):
+                self.assert_uses_indexes(queryset)
+
+    def test_feed_pages_read_in_index_order(self):
+        """
+        Проверяем запросы страниц лент, которые выполняют view:
+        for_feed() и KeysetPaginator читают индекс в его порядке
+        """
+        if connection.vendor != 'sqlite':
+            self.skipTest('План проверяется только для SQLite')
+        cursor = encode_cursor(self.post.pub_date, self.post.pk)
+        feeds = {
+            'index': (Post.objects.for_feed(), 'post_pub_date_id_idx'),
+            'group': (
+                self.group.posts.for_feed(), 'post_group_pub_date_id_idx'
+            ),
+            'profile': (
+                self.user.posts.for_feed(), 'post_author_pub_date_id_idx'
+            ),
+        }
+        for name, (post_list, index) in feeds.items():
+            for params in ({}, {'after': cursor}, {'before': cursor}):
+                with self.subTest(name=name, params=params):
+                    plans = self.issued_plans(
+                        lambda: paginate_feed(post_list, params)
+                    )
+                    for plan in plans:
+                        self.assert_plan(plan)
+                        self.assertIn(index, plan)
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий'
+        )
+        for after in (None, encode_cursor(comment.created, comment.pk)):
+            with self.subTest(name='comments', after=after):
+                plans = self.issued_plans(
+                    lambda: paginate_comments(
+                        self.post.comments.select_related('author'), after
+                    ),
+                    table='posts_comment',
+                )
+                for plan in plans:
+                    self.assert_plan(plan)
+                    self.assertIn('comment_post_created_id_idx', plan)
+
+    def test_follow_feed_uses_indexes(self):
+        """
+        Проверяем план ленты подписок: посты каждого автора читаются
+        по индексу, сортировка нужна только для слияния авторов
+        """
+        if connection.vendor != 'sqlite':
+            self.skipTest('План проверяется только для SQLite')
+        queryset = Post.objects.filter(author__following__user=self.user)
+        self.assert_uses_indexes(queryset, allow_sort=True)
+        self.assertIn('post_author_pub_date_id_idx', queryset.explain())
+
+    @override_settings(FOLLOW_FEED_FANOUT=True)
+    def test_fanout_feed_read_in_index_order(self):
+        """
+        Проверяем, что страницы разложенной ленты подписок читаются
+        по индексу FeedEntry в его порядке, без сортировки
+        """
+        if connection.vendor != 'sqlite':
+            self.skipTest('План проверяется только для SQLite')
+        reader = User.objects.create_user(username='plan_reader')
+        Follow.objects.create(user=reader, author=self.user)
+        feed.backfill(reader, self.user)
+        cursor = encode_cursor(self.post.pub_date, self.post.pk)
+        for params in ({}, {'after': cursor}, {'before': cursor}):
+            with self.subTest(params=params):
+                plans = self.issued_plans(lambda: paginate_feed(
+                    feed.follow_posts(reader).for_feed(),
+                    params,
+                    keys=feed.KEYS,
+                ))
+                for plan in plans:
+                    self.assert_plan(plan)
+                    self.assertIn('feed_user_pub_date_post_idx', plan)
+
+
+class CountersTest(TestCase):
+    """Проверяем денормализованные счетчики"""
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Счетчики ведут триггеры SQLite')
+        self.author = User.objects.create_user(username='counter_author')
+        self.reader = User.objects.create_user(username='counter_reader')
+        self.group = Group.objects.create(
+            title='Группа для счетчиков',
+            slug='counter-slug',
+            description='Описание группы для счетчиков',
+        )
+
+    def stats(self):
+        return (
+            counters.author_stats(User.objects.get(pk=self.author.pk)),
+            counters.author_stats(User.objects.get(pk=self.reader.pk)),
+        )
+
+    def test_post_counters(self):
+        """Счетчики постов следят за созданием, сменой группы и удалением"""
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group
+        )
+        Post.objects.bulk_create([
+            Post(author=self.author, text=f'Пост {i}', group=self.group)
+            for i in range(3)
+        ])
+        self.assertEqual(self.stats()[0].posts_count, 4)
+        self.assertEqual(GroupStats.objects.get(group=self.group)
+                         .posts_count, 4)
+        post.group = None
+        post.save()
+        self.assertEqual(GroupStats.objects.get(group=self.group)
+                         .posts_count, 3)
+        Post.objects.filter(author=self.author).delete()
+        self.assertEqual(self.stats()[0].posts_count, 0)
+        self.assertEqual(GroupStats.objects.get(group=self.group)
+                         .posts_count, 0)
+
+    def test_comment_and_follow_counters(self):
+        """Счетчики комментариев и подписок"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        Comment.objects.create(post=post, author=self.author, text='Нет')
+        self.assertEqual(PostStats.objects.get(post=post).comments_count, 2)
+        Comment.objects.filter(author=self.reader).delete()
+        self.assertEqual(PostStats.objects.get(post=post).comments_count, 1)
+        Follow.objects.create(user=self.reader, author=self.author)
+        author, reader = self.stats()
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(reader.following_count, 1)
+        self.reader.delete()
+        author = counters.author_stats(User.objects.get(pk=self.author.pk))
+        self.assertEqual(author.followers_count, 0)
+
+    def test_reconcile_fixes_drift(self):
+        """reconcile возвращает счетчикам значения из исходных таблиц"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        AuthorStats.objects.filter(user=self.author).update(posts_count=7)
+        PostStats.objects.all().delete()
+        fixed = counters.reconcile()
+        self.assertEqual(fixed['AuthorStats'], 1)
+        self.assertEqual(fixed['PostStats'], 1)
+        self.assertEqual(self.stats()[0].posts_count, 1)
+        self.assertEqual(PostStats.objects.get(post=post).comments_count, 1)
+        self.assertEqual(counters.reconcile()['AuthorStats'], 0)
+
+    def test_triggers_in_place(self):
+        """Проверка предупреждает, если миграция удалила триггеры"""
+        self.assertEqual(check_triggers(None), [])
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER posts_post_stats_insert')
+        warnings = check_triggers(None)
+        self.assertEqual([warning.id for warning in warnings], ['posts.W002'])
+        self.assertIn('posts_post_stats_insert', warnings[0].msg)
+
+    def test_count_without_triggers(self):
+        """Без триггеров счетчики страниц считаются по исходным таблицам"""
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group
+        )
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        Follow.objects.create(user=self.reader, author=self.author)
+        AuthorStats.objects.update(posts_count=7, followers_count=7)
+        GroupStats.objects.update(posts_count=7)
+        PostStats.objects.update(comments_count=7)
+        with mock.patch.object(counters, 'is_maintained', return_value=False):
+            author, reader = self.stats()
+            self.assertEqual(author.posts_count, 1)
+            self.assertEqual(author.followers_count, 1)
+            self.assertEqual(reader.following_count, 1)
+            self.assertEqual(
+                counters.group_stats(self.group).posts_count, 1
+            )
+            self.assertEqual(counters.post_stats(post).comments_count, 1)
+
+
+class SeederTest(TestCase):
+    """Проверяем генератор данных для замеров"""
+
+    def test_seed(self):
+        """Seeder создает строки с разными датами и верными счетчиками"""
+        rows = Seeder(seed=3, batch_size=7).run(
+            users=10, groups=2, posts=30, comments=40, follows=20
+        )
+        self.assertEqual(rows['Post'], Post.objects.count())
+        self.assertEqual(rows['Comment'], Comment.objects.count())
+        self.assertEqual(rows['Follow'], Follow.objects.count())
+        self.assertGreater(
+            Post.objects.values('pub_date').distinct().count(), 1
+        )
+        self.assertTrue(Post._meta.get_field('pub_date').auto_now_add)
+        if connection.vendor == 'sqlite':
+            self.assertFalse(any(counters.reconcile().values()))
+
+    def test_duplicates_not_counted(self):
+        """Повторы, отброшенные при вставке, не попадают в rows"""
+        streams = [False]
+        if connection.vendor == 'sqlite':
+            streams.append(True)
+        user = User.objects.create_user(username='seed_reader')
+        author = User.objects.create_user(username='seed_author')
+        for stream in streams:
+            with self.subTest(stream=stream):
+                Follow.objects.all().delete()
+                seeder = Seeder(stream=stream)
+                count = seeder.insert(Follow, [
+                    Follow(user=user, author=author),
+                    Follow(user=user, author=author),
+                ])
+                self.assertEqual(count, 1)
+                self.assertEqual(seeder.rows['Follow'], 1)
+
+    def test_seed_is_deterministic(self):
+        """Одно зерно дает те же данные и через bulk_create, и потоком"""
+        streams = [False]
+        if connection.vendor == 'sqlite':
+            streams.append(True)
+        snapshots = []
+        for stream in streams:
+            Seeder(seed=5, stream=stream).run(
+                users=5, groups=2, posts=20, comments=10, follows=10
+            )
+            snapshots.append(list(Post.objects.order_by('pk').values_list(
+                'author__username', 'group__slug', 'text'
+            )))
+            User.objects.all().delete()
+            Group.objects.all().delete()
+        self.assertEqual(len(snapshots[0]), 20)
+        for snapshot in snapshots[1:]:
+            self.assertEqual(snapshot, snapshots[0])
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+
+class QueryBudgetMixin:
+    """
+    Ограничивает число SQL-запросов на страницу: при N+1 число
+    запросов растет вместе с числом постов и вылетает за бюджет
+    """
+
+    def assert_query_budget(self, client, url, budget):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            '\n'.join(query['sql'] for query in queries.captured_queries),
+        )
+        return len(queries)
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Проверяем, что страницы с постами не делают N+1 запросов"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='budget_author')
+        cls.reader = User.objects.create_user(username='budget_reader')
+        cls.group = Group.objects.create(
+            title='Группа для бюджета',
+            slug='budget-slug',
+            description='Описание группы для бюджета',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Пост с комментариями',
+            group=cls.group,
+        )
+        commentators = [
+            User.objects.create_user(username=f'budget_commentator_{i}')
+            for i in range(5)
+        ]
+        Comment.objects.bulk_create([
+            Comment(post=cls.post, author=user, text=f'Комментарий {i}')
+            for i, user in enumerate(commentators)
+        ])
+        Post.objects.bulk_create([
+            Post(author=cls.author, text=f'Пост {i}', group=cls.group)
+            for i in range(settings.POSTS_PER_PAGE)
+        ])
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_pages_fit_budget(self):
+        """Проверяем число запросов на каждую страницу"""
+        # Две записи сверх запросов view: сессия и пользователь
+        budgets = {
+            reverse('posts:index'): 5,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}): 5,
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}): 6,
+            reverse('posts:follow_index'): 5,
+            reverse('posts:post_detail',
+                    kwargs={'post_id': self.post.pk}): 5,
+            reverse('posts:post_comments',
+                    kwargs={'post_id': self.post.pk}): 4,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url):
+                self.assert_query_budget(self.authorized_client, url, budget)
+
+    def test_queries_do_not_grow_with_posts(self):
+        """Число запросов не зависит от числа постов на странице"""
+        url = reverse('posts:index')
+        before = self.assert_query_budget(self.authorized_client, url, 5)
+        Post.objects.filter(pk__in=Post.objects.values('pk')[:5]).delete()
+        after = self.assert_query_budget(self.authorized_client, url, 5)
+        self.assertEqual(before, after)
@@ -0,0 +1,176 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .. import imaging, thumbnails
+from ..models import Post, Thumbnail, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailPipelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    @staticmethod
+    def get_image(name='image.png', size=(1200, 800)):
+        content = BytesIO()
+        Image.new('RGB', size, color=(255, 0, 0)).save(content, 'png')
+        return SimpleUploadedFile(name, content.getvalue(), 'image/png')
+
+    def create_post(self):
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': self.get_image()},
+        )
+        return Post.objects.get(text='Пост с картинкой')
+
+    def test_create_post_enqueues_thumbnails(self):
+        """Проверяем, что новая картинка ставится в очередь"""
+        post = self.create_post()
+        self.assertEqual(
+            set(post.thumbnails.values_list('geometry', 'format', 'status')),
+            {(geometry, format, Thumbnail.PENDING)
+             for geometry, format in thumbnails.variants()},
+        )
+
+    def test_variants_skip_unsupported_formats(self):
+        """Проверяем, что в очередь не попадают форматы без поддержки"""
+        with override_settings(
+            POST_THUMBNAIL_SIZES=['360x127', '960x339'],
+            POST_THUMBNAIL_FORMATS=['unknown', 'jpeg'],
+        ):
+            self.assertEqual(
+                thumbnails.variants(),
+                [('360x127', 'jpeg'), ('960x339', 'jpeg')],
+            )
+
+    def test_process_pending(self):
+        """Проверяем подготовку миниатюр всех размеров и форматов"""
+        post = self.create_post()
+        done = thumbnails.process_pending()
+        self.assertEqual(done, len(thumbnails.variants()))
+        for geometry, format in thumbnails.variants():
+            with self.subTest(geometry=geometry, format=format):
+                thumbnail = post.thumbnails.get(
+                    geometry=geometry, format=format
+                )
+                self.assertEqual(thumbnail.status, Thumbnail.READY)
+                with default_storage.open(thumbnail.image) as file:
+                    image = Image.open(file)
+                    self.assertEqual(
+                        image.size, imaging.parse_geometry(geometry)
+                    )
+                    self.assertEqual(
+                        image.format, imaging.SAVE_OPTIONS[format]['format']
+                    )
+        self.assertEqual(thumbnails.process_pending(), 0)
+
+    def test_render_derivatives(self):
+        """Проверяем, что все варианты готовятся из одной картинки"""
+        content = BytesIO()
+        Image.new('RGB', (1200, 800)).save(content, 'jpeg')
+        results = imaging.render_derivatives(
+            content.getvalue(), [('360x127', 'jpeg'), ('960x339', 'jpeg')]
+        )
+        self.assertEqual(
+            Image.open(BytesIO(results['360x127', 'jpeg'])).size, (360, 127)
+        )
+        self.assertEqual(
+            Image.open(BytesIO(results['960x339', 'jpeg'])).size, (960, 339)
+        )
+
+    def test_templates_use_ready_thumbnail(self):
+        """
+        Проверяем, что шаблоны берут готовую миниатюру,
+        а до ее готовности строят миниатюру через sorl
+        """
+        post = self.create_post()
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        )
+        name = thumbnails.thumbnail_name(post.image.name, '960x339')
+        for url in pages:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertNotContains(response, name)
+                self.assertContains(response, '<img class="card-img')
+        thumbnails.process_pending()
+        cache.clear()
+        for url in pages:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, name)
+                self.assertContains(response, '<picture>')
+
+    def test_picture_srcset(self):
+        """Проверяем srcset готовых миниатюр для <picture>"""
+        post = self.create_post()
+        thumbnails.process_pending()
+        post = Post.objects.prefetch_related('thumbnails').get(pk=post.pk)
+        picture = thumbnails.picture(post, '960x339')
+        self.assertEqual(
+            picture['src'],
+            default_storage.url(
+                thumbnails.thumbnail_name(post.image.name, '960x339')
+            ),
+        )
+        self.assertEqual(
+            picture['srcset'],
+            ', '.join(
+                '{} {}w'.format(
+                    default_storage.url(
+                        thumbnails.thumbnail_name(post.image.name, geometry)
+                    ),
+                    imaging.parse_geometry(geometry)[0],
+                )
+                for geometry in settings.POST_THUMBNAIL_SIZES
+            ),
+        )
+        self.assertEqual(
+            [source['type'] for source in picture['sources']],
+            [
+                thumbnails.MIME_TYPES[format]
+                for format in settings.POST_THUMBNAIL_FORMATS
+                if format != 'jpeg' and imaging.can_save(format)
+            ],
+        )
+
+    def test_edited_image_is_not_overwritten(self):
+        """
+        Проверяем, что миниатюра старой картинки не попадает в задачу,
+        если картинку сменили во время обработки
+        """
+        post = self.create_post()
+        claimed = thumbnails.claim(10)
+        post.image = self.get_image('another.png')
+        post.save()
+        thumbnails.enqueue(post)
+        for thumbnail in claimed:
+            with self.subTest(geometry=thumbnail.geometry):
+                self.assertEqual(thumbnails._finish(thumbnail, b''), 0)
+        self.assertFalse(
+            post.thumbnails.filter(status=Thumbnail.READY).exists()
+        )
@@ -1,16 +1,34 @@
+import html
+import re
 import shutil
 import tempfile
+import threading
 
 from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ..models import Comment, Follow, Group, Post, User
+from ..caching import (CARDS_SCOPE, INDEX_SCOPE, _feed_page_key,
+                       _get_or_render, card_key, get_generation, render_cards)
+from ..checks import check_shared_cache
+from ..models import Comment, FeedEntry, Follow, Group, Post, User
+from ..utils import encode_cursor
 from .data_tests import urls_names_templates_to_check
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+NEXT_LINK = re.compile(r'href="([^"]*)">Следующая<')
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -228,7 +246,7 @@ class ViewsTests(TestCase):
         response = self.guest_client.get(reverse(
             'posts:post_detail', kwargs={'post_id': post.id})
         )
-        comment_response = response.context['comments'].first()
+        comment_response = response.context['comments'][0]
         self.assertEqual(comment_response.text, comment.text)
         self.assertEqual(comment_response.author, comment.author)
 
@@ -349,3 +367,653 @@ class PaginatorViewTest(TestCase):
                                                  {'page': 2})
                 context = response.context['page_obj'].object_list
                 self.assertEqual(len(context), self.NUM_POSTS_2_PAGE)
+
+
+class CountersViewTest(TestCase):
+    """Проверяем, что счетчики на страницах берутся без COUNT(*)"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='counters_user')
+        cls.follower = User.objects.create_user(username='counters_reader')
+        Post.objects.bulk_create([
+            Post(author=cls.user, text=f'Пост со счетчиком {i}')
+            for i in range(3)
+        ])
+        cls.post = Post.objects.filter(author=cls.user).first()
+        Follow.objects.create(user=cls.follower, author=cls.user)
+        Comment.objects.create(
+            post=cls.post, author=cls.follower, text='Комментарий'
+        )
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Счетчики ведут триггеры SQLite')
+        self.guest_client = Client()
+
+    def get_without_count(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(url)
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+        return response
+
+    def test_profile_counters(self):
+        """Профиль показывает счетчики постов и подписчиков"""
+        response = self.get_without_count(
+            reverse('posts:profile', kwargs={'username': self.user.username})
+        )
+        self.assertEqual(response.context['page_obj'].paginator.count, 3)
+        self.assertEqual(response.context['stats'].followers_count, 1)
+
+    def test_post_detail_counters(self):
+        """Страница поста показывает счетчики автора и комментариев"""
+        response = self.get_without_count(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertEqual(response.context['author_stats'].posts_count, 3)
+        self.assertEqual(response.context['post_stats'].comments_count, 1)
+
+
+class KeysetPaginatorViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='keyset_user')
+        cls.group = Group.objects.create(
+            title='Группа для курсора',
+            slug='keyset-slug',
+            description='Описание группы для курсора',
+        )
+        cls.NUM_POSTS = settings.POSTS_PER_PAGE * 2 + 3
+        Post.objects.bulk_create([
+            Post(
+                author=cls.user,
+                text=f'Пост для курсора номер {i}',
+                group=cls.group,
+            ) for i in range(cls.NUM_POSTS)
+        ])
+        cls.expected_ids = list(
+            Post.objects.order_by('-pub_date', '-pk')
+            .values_list('pk', flat=True)
+        )
+        cls.pages_to_check = {
+            'posts:index': {},
+            'posts:group_list': {'slug': cls.group.slug},
+            'posts:profile': {'username': cls.user.username},
+        }
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def walk(self, url):
+        """
+        Проходим по ссылкам «Следующая» с первой страницы,
+        возвращаем страницы
+        """
+        pages = []
+        href = ''
+        while href is not None:
+            response = self.guest_client.get(url + href)
+            pages.append(response.context['page_obj'])
+            match = NEXT_LINK.search(response.content.decode())
+            href = html.unescape(match.group(1)) if match else None
+        return pages
+
+    def test_keyset_walk_forward(self):
+        """
+        Проверяем, что ссылки пагинатора с первой страницы ведут по курсору
+        через все посты без повторов
+        """
+        for name, kwarg in self.pages_to_check.items():
+            with self.subTest(name=name):
+                url = reverse(name, kwargs=kwarg)
+                pages = self.walk(url)
+                ids = [post.pk for page in pages for post in page]
+                self.assertEqual(ids, self.expected_ids)
+                self.assertEqual(len(pages), 3)
+                self.assertEqual(len(pages[0]), settings.POSTS_PER_PAGE)
+                self.assertFalse(pages[-1].has_next())
+
+    def test_first_page_links_by_cursor(self):
+        """Проверяем, что первая страница ведет дальше по курсору"""
+        response = self.guest_client.get(reverse('posts:index'))
+        last = response.context['page_obj'][-1]
+        self.assertEqual(
+            NEXT_LINK.search(response.content.decode()).group(1),
+            f'?after={encode_cursor(last.pub_date, last.pk)}',
+        )
+        self.assertNotIn('?page=', response.content.decode())
+
+    def test_keyset_walk_back(self):
+        """Проверяем возврат на предыдущую страницу по курсору"""
+        url = reverse('posts:index')
+        second, third = self.walk(url)[1:3]
+        response = self.guest_client.get(
+            url, {'before': third.previous_cursor}
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(
+            [post.pk for post in page_obj],
+            [post.pk for post in second],
+        )
+        self.assertTrue(page_obj.has_next())
+        self.assertTrue(page_obj.has_previous())
+
+    def test_keyset_no_count_no_offset(self):
+        """Проверяем, что страница по курсору не делает COUNT и OFFSET"""
+        post = Post.objects.order_by('-pub_date', '-pk')[15]
+        token = encode_cursor(post.pub_date, post.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(reverse('posts:index'), {'after': token})
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+            self.assertNotIn('OFFSET', query['sql'].upper())
+
+    def test_keyset_broken_token(self):
+        """Проверяем, что испорченный курсор ведет на первую страницу"""
+        response = self.guest_client.get(
+            reverse('posts:index'), {'after': 'broken!token'}
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj[0].pk, self.expected_ids[0])
+        self.assertFalse(page_obj.has_previous())
+
+
+@override_settings(FOLLOW_FEED_FANOUT=True)
+class FollowFeedFanoutTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='feed_author')
+        cls.reader = User.objects.create_user(username='feed_reader')
+        cls.old_post = Post.objects.create(
+            author=cls.author,
+            text='Пост до подписки',
+        )
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def follow_page_ids(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_fanout_lifecycle(self):
+        """
+        Проверяем, что подписка дозаполняет ленту, новый пост в нее
+        раскладывается, а отписка ее очищает
+        """
+        self.reader_client.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': self.author.username})
+        )
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.reader, post=self.old_post
+        ).exists())
+        self.author_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост после подписки'},
+        )
+        new_post = Post.objects.get(text='Пост после подписки')
+        self.assertEqual(self.follow_page_ids(),
+                         [new_post.pk, self.old_post.pk])
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': self.author.username})
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.follow_page_ids(), [])
+
+    @override_settings(FOLLOW_FEED_FANOUT_LIMIT=0)
+    def test_popular_author_read_on_fanout(self):
+        """Проверяем, что посты популярного автора подмешиваются при чтении"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.author_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост популярного автора'},
+        )
+        new_post = Post.objects.get(text='Пост популярного автора')
+        self.assertFalse(FeedEntry.objects.filter(post=new_post).exists())
+        self.assertEqual(self.follow_page_ids(),
+                         [new_post.pk, self.old_post.pk])
+
+    def test_formerly_popular_author_kept(self):
+        """
+        Проверяем, что пост, написанный автором в популярности, остается
+        в ленте, когда подписчиков у автора стало меньше
+        """
+        self.reader_client.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': self.author.username})
+        )
+        with override_settings(FOLLOW_FEED_FANOUT_LIMIT=0):
+            self.author_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Пост в популярности'},
+            )
+        new_post = Post.objects.get(text='Пост в популярности')
+        self.assertFalse(FeedEntry.objects.filter(post=new_post).exists())
+        self.assertEqual(self.follow_page_ids(),
+                         [new_post.pk, self.old_post.pk])
+
+
+class PostCardCacheTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='card_user')
+        self.group = Group.objects.create(
+            title='Группа карточек',
+            slug='card-slug',
+            description='Описание группы карточек',
+        )
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Пост в кэше карточек',
+            group=self.group,
+        )
+        self.url = reverse('posts:group_list', kwargs={'slug': 'card-slug'})
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def card_rendered(self):
+        response = self.guest_client.get(self.url)
+        return 'posts/includes/post.html' in (
+            template.name for template in response.templates
+        )
+
+    def test_card_rendered_once(self):
+        """Проверяем, что карточка берется из кэша при повторном запросе"""
+        self.assertTrue(self.card_rendered())
+        self.assertFalse(self.card_rendered())
+
+    def test_card_invalidated(self):
+        """Проверяем, что изменения поста, группы и автора сбрасывают кэш"""
+        changes = {
+            'post': lambda: self.authorized_client.post(
+                reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+                data={'text': 'Исправленный пост', 'group': self.group.pk},
+            ),
+            'group': lambda: Group.objects.get(pk=self.group.pk).save(),
+            'author': lambda: User.objects.get(pk=self.user.pk).save(
+                update_fields=['first_name']
+            ),
+        }
+        for name, change in changes.items():
+            with self.subTest(name=name):
+                self.card_rendered()
+                change()
+                self.assertTrue(self.card_rendered())
+
+    @override_settings(CACHES=LOCMEM_CACHES, FEED_CACHE_LOCAL_TIMEOUT=0)
+    def test_card_local_cache_short_timeout(self):
+        """
+        Проверяем, что с кэшем одного процесса карточка живет
+        FEED_CACHE_LOCAL_TIMEOUT
+        """
+        render_cards([self.post], show_author=True)
+        key = card_key(self.post.pk, self.post.pub_date, True,
+                       get_generation(CARDS_SCOPE))
+        self.assertIsNone(cache.get(key))
+
+    def test_card_kept_on_login(self):
+        """Проверяем, что вход автора не сбрасывает кэш карточек"""
+        self.card_rendered()
+        user = User.objects.get(pk=self.user.pk)
+        user.save(update_fields=['last_login'])
+        self.assertFalse(self.card_rendered())
+
+
+class FeedPageCacheTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='feed_cache_user')
+        self.group = Group.objects.create(
+            title='Группа кэша лент',
+            slug='feed-cache-slug',
+            description='Описание группы кэша лент',
+        )
+        self.pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+        )
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def test_page_cached_until_post_changes(self):
+        """Проверяем, что новый пост сразу сбрасывает кэш лент"""
+        for url in self.pages:
+            with self.subTest(url=url):
+                self.assertIsNotNone(self.guest_client.get(url).context)
+                self.assertIsNone(self.guest_client.get(url).context)
+                post = Post.objects.create(
+                    author=self.user,
+                    text=f'Новый пост для {url}',
+                    group=self.group,
+                )
+                response = self.guest_client.get(url)
+                self.assertContains(response, post.text)
+
+    def test_page_rendered_before_commit(self):
+        """
+        Проверяем, что страница, которую параллельный запрос собрал
+        до фиксации нового поста, не отдается после фиксации
+        """
+        request = RequestFactory().get(self.pages[0])
+        request.user = AnonymousUser()
+        with transaction.atomic():
+            post = Post.objects.create(author=self.user, text='Новый пост')
+            # Параллельный запрос еще не видит пост и кэширует ленту
+            cache.set(_feed_page_key(request, INDEX_SCOPE), b'stale page')
+        response = self.guest_client.get(self.pages[0])
+        self.assertContains(response, post.text)
+
+    def test_page_cached_per_user(self):
+        """Проверяем, что гость не получает страницу пользователя"""
+        for url in self.pages:
+            with self.subTest(url=url):
+                self.authorized_client.get(url)
+                response = self.guest_client.get(url)
+                self.assertNotContains(response, self.user.username)
+
+    @override_settings(CACHES=LOCMEM_CACHES, FEED_CACHE_LOCAL_TIMEOUT=0)
+    def test_local_cache_short_timeout(self):
+        """
+        Проверяем, что с кэшем одного процесса страница живет
+        FEED_CACHE_LOCAL_TIMEOUT, а проверка развертывания предупреждает
+        """
+        self.assertIsNotNone(self.guest_client.get(self.pages[0]).context)
+        self.assertIsNotNone(self.guest_client.get(self.pages[0]).context)
+        self.assertEqual(
+            [error.id for error in check_shared_cache(None)], ['posts.W001']
+        )
+
+    def test_shared_cache_check(self):
+        """Проверяем, что общий кэш проходит проверку развертывания"""
+        self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(FEED_CACHE_LOCK_TIMEOUT=5)
+    def test_page_rebuilt_by_one_worker(self):
+        """
+        Проверяем, что пока страницу собирает другой обработчик,
+        запрос дожидается его результата
+        """
+        request = RequestFactory().get(self.pages[0])
+        request.user = AnonymousUser()
+        key = _feed_page_key(request, INDEX_SCOPE)
+        cache.add(f'{key}:lock', 1)
+        worker = threading.Timer(
+            0.2, cache.set, (key, b'page from another worker')
+        )
+        worker.start()
+        response = self.guest_client.get(self.pages[0])
+        worker.join()
+        self.assertEqual(response.content, b'page from another worker')
+
+    def test_expired_lock_left_to_new_owner(self):
+        """
+        Проверяем, что обработчик, чья блокировка истекла за время
+        сборки, не снимает блокировку следующего обработчика
+        """
+        lock = 'feed_page:test:lock'
+
+        def render():
+            # Блокировка истекла, и ее взял другой обработчик
+            cache.set(lock, 'other worker')
+            return HttpResponse(b'page')
+
+        _get_or_render('feed_page:test', render)
+        self.assertEqual(cache.get(lock), 'other worker')
+
+
+class PostSearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='search_user')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Ранний пост про тюльпаны'
+        )
+        cls.other = Post.objects.create(
+            author=cls.user,
+            text='Тюльпаны, тюльпаны и еще раз тюльпаны в саду',
+        )
+        Post.objects.create(author=cls.user, text='Пост про розы')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query, **params):
+        response = self.guest_client.get(
+            reverse('posts:post_search'), {'q': query, **params}
+        )
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_search_ranks_by_relevance(self):
+        """Посты с совпадениями, сначала самые подходящие"""
+        self.assertEqual(self.search('тюльпаны'),
+                         [self.other.pk, self.post.pk])
+        self.assertEqual(self.search('ТЮЛЬПАН'),
+                         [self.other.pk, self.post.pk])
+        self.assertEqual(self.search('ранний тюльпаны'), [self.post.pk])
+        self.assertEqual(self.search(''), [])
+        self.assertEqual(self.search('"*'), [])
+
+    def test_search_follows_changes(self):
+        """Индекс следует за правкой и удалением постов"""
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Пост про нарциссы'
+        post.save()
+        self.assertEqual(self.search('тюльпаны'), [self.other.pk])
+        self.assertEqual(self.search('нарциссы'), [self.post.pk])
+        Post.objects.filter(pk=self.other.pk).delete()
+        self.assertEqual(self.search('тюльпаны'), [])
+
+    def test_search_pages_keep_query(self):
+        """Ссылки паджинатора сохраняют запрос"""
+        Post.objects.bulk_create([
+            Post(author=self.user, text=f'Розы номер {i}')
+            for i in range(settings.POSTS_PER_PAGE)
+        ])
+        response = self.guest_client.get(
+            reverse('posts:post_search'), {'q': 'розы'}
+        )
+        self.assertContains(
+            response, '?q=%D1%80%D0%BE%D0%B7%D1%8B&amp;page=2'
+        )
+        self.assertEqual(len(self.search('розы', page=2)), 1)
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class CommentBatchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='batch_user')
+        cls.post = Post.objects.create(author=cls.user, text='Вирусный пост')
+        Comment.objects.bulk_create([
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(7)
+        ])
+        cls.comments = list(cls.post.comments.order_by('-created', '-pk'))
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def test_post_detail_shows_first_batch(self):
+        """На странице поста только первая пачка комментариев"""
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertEqual(list(response.context['comments']),
+                         self.comments[:3])
+        self.assertContains(response, 'data-url=')
+
+    def test_load_more(self):
+        """Кнопка отдает следующие пачки, пока комментарии не кончатся"""
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        loaded = []
+        after = encode_cursor(self.comments[2].created, self.comments[2].pk)
+        while after:
+            response = self.guest_client.get(url, {'after': after})
+            self.assertTemplateUsed(response, 'posts/includes/comments.html')
+            page = response.context['comments']
+            loaded.extend(page)
+            after = page.next_cursor
+        self.assertEqual(loaded, self.comments[3:])
+        self.assertNotContains(response, 'data-url=')
+
+    def test_load_more_unknown_post(self):
+        """Для несуществующего поста кнопка отдает 404"""
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 10 ** 6})
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalPagesTest(TransactionTestCase):
+    """Проверяем ответы 304 для профиля и группы"""
+    def setUp(self):
+        self.user = User.objects.create_user(username='etag_author')
+        self.reader = User.objects.create_user(username='etag_reader')
+        self.group = Group.objects.create(
+            title='Группа с ETag',
+            slug='etag-slug',
+            description='Описание группы с ETag',
+        )
+        Post.objects.create(author=self.user, text='Пост', group=self.group)
+        self.pages = (
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+        )
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+        cache.clear()
+
+    def revalidate(self, client, url, etag):
+        return client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_not_modified_without_queries(self):
+        """Неизмененная страница отдает 304 без запросов и шаблонов"""
+        for url in self.pages:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertIn('Last-Modified', response)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.revalidate(
+                        self.guest_client, url, response['ETag']
+                    )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(len(queries), 0)
+                self.assertEqual(response.templates, [])
+
+    def test_new_post_changes_etag(self):
+        """Новый пост автора в группе меняет ETag обеих страниц"""
+        etags = [self.guest_client.get(url)['ETag'] for url in self.pages]
+        Post.objects.create(author=self.user, text='Еще', group=self.group)
+        for url, etag in zip(self.pages, etags):
+            with self.subTest(url=url):
+                response = self.revalidate(self.guest_client, url, etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_etag_issued_before_commit(self):
+        """
+        Проверяем, что ETag, выданный до фиксации нового поста,
+        после фиксации не дает 304
+        """
+        with transaction.atomic():
+            Post.objects.create(author=self.user, text='Еще', group=self.group)
+            # Запрос между записью и фиксацией получает ETag
+            etags = [self.guest_client.get(url)['ETag'] for url in self.pages]
+        for url, etag in zip(self.pages, etags):
+            with self.subTest(url=url):
+                response = self.revalidate(self.guest_client, url, etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_follow_changes_profile_etag(self):
+        """Подписка меняет кнопку и счетчик в профиле"""
+        url = self.pages[0]
+        etag = self.authorized_client.get(url)['ETag']
+        self.authorized_client.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.user.username})
+        )
+        response = self.revalidate(self.authorized_client, url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['following'])
+
+    def test_etag_per_user(self):
+        """Гость не получает 304 по ETag страницы пользователя"""
+        for url in self.pages:
+            with self.subTest(url=url):
+                etag = self.authorized_client.get(url)['ETag']
+                response = self.revalidate(self.guest_client, url, etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Cookie', response['Vary'])
+
+    def test_not_found_without_etag(self):
+        """
+        Проверяем, что 404 не получает ETag, а появившийся автор
+        сразу виден по своему адресу
+        """
+        url = reverse('posts:profile', kwargs={'username': 'etag_newcomer'})
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+        User.objects.create_user(username='etag_newcomer')
+        self.assertEqual(self.guest_client.get(url).status_code, 200)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_local_cache_without_etag(self):
+        """Проверяем, что с кэшем одного процесса ETag не выдается"""
+        for url in self.pages:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('ETag', response)
+
+
+@override_settings(PARALLEL_QUERIES=True)
+class ParallelProfileTest(TransactionTestCase):
+    """Проверка подписки и страница постов профиля идут в разных потоках"""
+    def setUp(self):
+        self.user = User.objects.create_user(username='parallel_author')
+        self.reader = User.objects.create_user(username='parallel_reader')
+        Post.objects.create(author=self.user, text='Пост в профиле')
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_profile(self):
+        threads = {}
+
+        def record_thread(execute, sql, params, many, context):
+            for table in ('posts_post', 'posts_follow'):
+                if f'FROM "{table}"' in sql:
+                    threads[table] = threading.current_thread().name
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record_thread):
+            response = self.authorized_client.get(reverse(
+                'posts:profile', kwargs={'username': self.user.username}
+            ))
+        self.assertEqual(
+            threads['posts_follow'], threading.current_thread().name
+        )
+        self.assertTrue(threads['posts_post'].startswith('queries'))
+        self.assertTrue(response.context['following'])
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['Пост в профиле'],
+        )
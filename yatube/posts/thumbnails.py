@@ -0,0 +1,257 @@
+"""
+Фоновая подготовка миниатюр картинок постов.
+
+После сохранения картинки пост ставится в очередь (таблица Thumbnail):
+каждый размер из POST_THUMBNAIL_SIZES в каждом формате из
+POST_THUMBNAIL_FORMATS, который умеет сохранять Pillow. Команда
+process_thumbnails разбирает очередь пулом процессов и готовит все
+варианты одной картинки за одно ее декодирование. Картинка, которая
+уже есть у другого поста, сразу получает его готовые миниатюры.
+Шаблоны отдают готовые варианты через <picture> и srcset, а пока их
+нет, строят миниатюру через sorl, как раньше.
+"""
+import hashlib
+from collections import defaultdict
+from concurrent.futures import Future
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import caching
+from .imaging import can_save, parse_geometry, render_derivatives
+from .models import Post, Thumbnail
+
+
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp', 'avif': 'avif'}
+MIME_TYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'avif': 'image/avif'}
+
+
+def thumbnail_name(source, geometry, format='jpeg'):
+    """Имя файла миниатюры зависит только от исходной картинки"""
+    digest = hashlib.sha1(source.encode()).hexdigest()
+    return (
+        f'derivatives/{digest[:2]}/{digest[2:4]}/'
+        f'{digest}_{geometry}.{EXTENSIONS[format]}'
+    )
+
+
+def variants():
+    """Пары (размер, формат), которые готовит очередь"""
+    return [
+        (geometry, format)
+        for geometry in settings.POST_THUMBNAIL_SIZES
+        for format in settings.POST_THUMBNAIL_FORMATS
+        if can_save(format)
+    ]
+
+
+def enqueue(post):
+    """Ставит все варианты картинки поста в очередь"""
+    if not post.image:
+        Thumbnail.objects.filter(post=post).delete()
+        return
+    wanted = variants()
+    for thumbnail in Thumbnail.objects.filter(post=post):
+        if (thumbnail.geometry, thumbnail.format) not in wanted:
+            thumbnail.delete()
+    # Та же картинка уже есть у другого поста: ее миниатюры готовы
+    ready = {
+        (geometry, format): image
+        for geometry, format, image in Thumbnail.objects.filter(
+            source=post.image.name,
+            status=Thumbnail.READY,
+        ).values_list('geometry', 'format', 'image')
+    }
+    for geometry, format in wanted:
+        image = ready.get((geometry, format), '')
+        Thumbnail.objects.update_or_create(
+            post=post,
+            geometry=geometry,
+            format=format,
+            defaults={
+                'source': post.image.name,
+                'image': image,
+                'status': Thumbnail.READY if image else Thumbnail.PENDING,
+                'attempts': 0,
+            },
+        )
+
+
+def _ready(post):
+    if not post.image:
+        return []
+    return [
+        thumbnail for thumbnail in post.thumbnails.all()
+        if thumbnail.status == Thumbnail.READY
+        and thumbnail.source == post.image.name
+    ]
+
+
+def ready_url(post, geometry, format='jpeg'):
+    """
+    Возвращает адрес готовой миниатюры или пустую строку.
+    Миниатюры поста стоит заранее загрузить через prefetch_related
+    """
+    for thumbnail in _ready(post):
+        if thumbnail.geometry == geometry and thumbnail.format == format:
+            return thumbnail.url
+    return ''
+
+
+def picture(post, geometry):
+    """
+    Данные для <picture>: src готовой JPEG-миниатюры geometry, srcset
+    JPEG и источники в остальных форматах, от более легких к JPEG.
+    None, пока JPEG geometry не готова
+    """
+    src = ready_url(post, geometry)
+    if not src:
+        return None
+    srcsets = defaultdict(list)
+    for thumbnail in _ready(post):
+        width, _ = parse_geometry(thumbnail.geometry)
+        srcsets[thumbnail.format].append((width, thumbnail.url))
+    srcset = {
+        format: ', '.join(
+            f'{url} {width}w' for width, url in sorted(srcsets[format])
+        )
+        for format in srcsets
+    }
+    return {
+        'src': src,
+        'srcset': srcset.pop('jpeg'),
+        'sources': [
+            {'type': MIME_TYPES[format], 'srcset': srcset[format]}
+            for format in settings.POST_THUMBNAIL_FORMATS
+            if format in srcset
+        ],
+    }
+
+
+def _queued():
+    """Задачи в очереди и задачи, брошенные упавшим обработчиком"""
+    stale = timezone.now() - timedelta(
+        seconds=settings.POST_THUMBNAIL_PROCESSING_TIMEOUT
+    )
+    return Thumbnail.objects.filter(
+        Q(status=Thumbnail.PENDING)
+        | Q(status=Thumbnail.PROCESSING, updated__lt=stale),
+        attempts__lt=settings.POST_THUMBNAIL_MAX_ATTEMPTS,
+    )
+
+
+def claim(limit):
+    """Забирает из очереди до limit задач так, чтобы их не взял другой"""
+    claimed = []
+    for thumbnail in _queued().order_by('updated')[:limit]:
+        taken = _queued().filter(
+            pk=thumbnail.pk,
+            status=thumbnail.status,
+            updated=thumbnail.updated,
+        ).update(
+            status=Thumbnail.PROCESSING,
+            attempts=F('attempts') + 1,
+            updated=timezone.now(),
+        )
+        if taken:
+            claimed.append(thumbnail.pk)
+    return list(Thumbnail.objects.filter(pk__in=claimed))
+
+
+def _claimed(thumbnail):
+    """Задача, если ее картинку не сменили, пока шла обработка"""
+    return Thumbnail.objects.filter(
+        pk=thumbnail.pk,
+        source=thumbnail.source,
+        status=Thumbnail.PROCESSING,
+    )
+
+
+def _submit(pool, source, variants):
+    if pool is not None:
+        return pool.submit(render_derivatives, source, variants)
+    future = Future()
+    try:
+        future.set_result(render_derivatives(source, variants))
+    except Exception as error:
+        future.set_exception(error)
+    return future
+
+
+def _finish(thumbnail, content):
+    name = thumbnail_name(
+        thumbnail.source, thumbnail.geometry, thumbnail.format
+    )
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    name = default_storage.save(name, ContentFile(content))
+    done = _claimed(thumbnail).update(
+        image=name,
+        status=Thumbnail.READY,
+        updated=timezone.now(),
+    )
+    if done:
+        caching.invalidate_cards(Post.objects.filter(pk=thumbnail.post_id))
+    return done
+
+
+def _fail(thumbnail):
+    if thumbnail.attempts < settings.POST_THUMBNAIL_MAX_ATTEMPTS:
+        status = Thumbnail.PENDING
+    else:
+        status = Thumbnail.FAILED
+    _claimed(thumbnail).update(status=status, updated=timezone.now())
+
+
+def _start(pool, source, claimed):
+    """Отдает в пул все задачи картинки source, None если ее не прочесть"""
+    try:
+        with default_storage.open(source) as file:
+            content = file.read()
+    except OSError:
+        for thumbnail in claimed:
+            _fail(thumbnail)
+        return None
+    return _submit(
+        pool,
+        content,
+        [(thumbnail.geometry, thumbnail.format) for thumbnail in claimed],
+    )
+
+
+def _collect(claimed, future):
+    """Сохраняет готовые варианты, возвращает их число"""
+    try:
+        results = future.result()
+    except Exception:
+        for thumbnail in claimed:
+            _fail(thumbnail)
+        return 0
+    return sum(
+        _finish(thumbnail, results[thumbnail.geometry, thumbnail.format])
+        for thumbnail in claimed
+    )
+
+
+def process_pending(limit=None, pool=None):
+    """
+    Разбирает очередь в пуле процессов pool (или в текущем процессе),
+    возвращает число готовых миниатюр. Все задачи одной картинки
+    выполняются за одно ее декодирование
+    """
+    by_source = defaultdict(list)
+    for thumbnail in claim(limit or settings.POST_THUMBNAIL_BATCH_SIZE):
+        by_source[thumbnail.source].append(thumbnail)
+    futures = [
+        (claimed, _start(pool, source, claimed))
+        for source, claimed in by_source.items()
+    ]
+    return sum(
+        _collect(claimed, future)
+        for claimed, future in futures
+        if future is not None
+    )
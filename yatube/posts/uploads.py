@@ -0,0 +1,55 @@
+"""
+Подготовка загруженных картинок постов перед сохранением.
+
+Большие картинки уменьшаются до POST_IMAGE_MAX_SIDE уже при
+декодировании, метаданные (EXIF с координатами съемки и т.п.)
+удаляются. Результат пишется во временный файл, из которого хранилище
+копирует его кусками, не читая в память целиком.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+
+from . import imaging
+
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png'}
+
+
+def exceeds_pixels(upload):
+    """
+    Больше ли в картинке пикселей, чем POST_IMAGE_MAX_PIXELS.
+    Размер берется из заголовка, картинка не декодируется
+    """
+    width, height = upload.image.size
+    return width * height > settings.POST_IMAGE_MAX_PIXELS
+
+
+def normalize(upload):
+    """
+    Возвращает загруженную картинку, готовую к хранению,
+    или саму upload, если ее можно хранить как есть
+    """
+    upload.seek(0)
+    # Файл без имени на диске удалится сам, даже если форма не сохранится
+    output = tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR)
+    try:
+        format = imaging.normalize(
+            upload, output, settings.POST_IMAGE_MAX_SIDE
+        )
+    except BaseException:
+        output.close()
+        raise
+    upload.seek(0)
+    if format is None:
+        output.close()
+        return upload
+    name, content_type = upload.name, upload.content_type
+    if format != upload.image.format:
+        name = os.path.splitext(name)[0] + EXTENSIONS[format]
+        content_type = Image.MIME[format]
+    size = output.tell()
+    output.seek(0)
+    return UploadedFile(output, name, content_type, size)
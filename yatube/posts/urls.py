@@ -8,12 +8,18 @@ urlpatterns = [
     path('create/', views.post_create, name='post_create'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.post_search, name='post_search'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment,
         name='add_comment'
     ),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path(
         'profile/<str:username>/follow/',
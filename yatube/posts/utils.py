@@ -1,7 +1,207 @@
+import base64
+import binascii
+from collections.abc import Sequence
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+# Fields a feed is ordered and walked by cursor on, newest first
+FEED_KEYS = ('pub_date', 'pk')
+
+
+def paginate(post_list, page_number, after=None, before=None, count=None,
+             keyset=False, keys=FEED_KEYS):
+    """
+    Returns page for paginator based on list of posts and page number.
+    If one of the cursor tokens `after`/`before` is given, returns
+    a keyset page instead, which costs the same for any depth.
+    With `keyset` and no token returns the first page linking to the next
+    one by cursor. Known `count` of posts saves the COUNT query.
+    Keyset pages are ordered by the (date, pk) field pair `keys`
+    """
+    if keyset and not (after or before):
+        return first_page(post_list, count, keys)
+    if after or before:
+        paginator = KeysetPaginator(
+            post_list, settings.POSTS_PER_PAGE, *keys
+        )
+        if count is not None:
+            paginator.count = count
+        return paginator.page(after=after, before=before)
+    paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
+    if count is not None:
+        paginator.count = count
+    return paginator.get_page(page_number)
+
+
+def paginate_feed(post_list, params, count=None, keys=FEED_KEYS):
+    """
+    Returns page of a feed for query `params`. A feed is walked by cursor
+    tokens `after`/`before` from its first page on, so no page of it
+    runs COUNT or OFFSET. Numbered `page` is only kept for old links
+    """
+    after = params.get('after')
+    before = params.get('before')
+    if after or before or not params.get('page'):
+        return paginate(post_list, None, after=after, before=before,
+                        count=count, keyset=True, keys=keys)
+    return paginate(post_list, params.get('page'), count=count)
+
+
+def paginate_comments(comment_list, after=None):
+    """
+    Returns keyset page of comments following `after` token,
+    from the newest comment to the oldest one
+    """
+    return KeysetPaginator(
+        comment_list,
+        settings.COMMENTS_PER_PAGE,
+        date_field='created',
+    ).page(after=after)
+
+
+def first_page(post_list, count=None, keys=FEED_KEYS):
+    """
+    Returns the first page of a keyset feed as a regular Page,
+    with the cursor of its last row as `next_cursor`
+    """
+    paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
+    if count is not None:
+        paginator.count = count
+    keyset_page = KeysetPaginator(
+        post_list, settings.POSTS_PER_PAGE, *keys
+    ).page()
+    page = Page(keyset_page.object_list, 1, paginator)
+    page.is_keyset = True
+    page.next_cursor = keyset_page.next_cursor
+    page.previous_cursor = None
+    return page
+
+
+def encode_cursor(date, pk):
+    """Packs (date, pk) of a row into opaque url-safe token"""
+    raw = f'{date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Unpacks token into (date, pk), returns None for malformed token"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        date, pk = raw.decode().split('|')
+        date = parse_datetime(date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if date is None:
+        return None
+    return date, pk
+
+
+class KeysetPaginator:
+    """
+    Paginator over (date_field, pk_field) without COUNT and OFFSET queries.
+    Rows are ordered from the newest to the oldest one
+    """
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 pk_field='pk'):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.date_field = date_field
+        self.pk_field = pk_field
+
+    @cached_property
+    def count(self):
+        """Total number of rows, only evaluated when asked for"""
+        return self.object_list.count()
+
+    def page(self, after=None, before=None):
+        """Returns page following `after` token or preceding `before` one"""
+        field, pk_field = self.date_field, self.pk_field
+        cursor = decode_cursor(after) if after else None
+        if cursor is not None:
+            date, pk = cursor
+            queryset = self.object_list.filter(
+                Q(**{f'{field}__lt': date})
+                | Q(**{field: date, f'{pk_field}__lt': pk})
+            ).order_by(f'-{field}', f'-{pk_field}')
+            rows = list(queryset[:self.per_page + 1])
+            return KeysetPage(
+                rows[:self.per_page],
+                self,
+                has_next=len(rows) > self.per_page,
+                has_previous=True,
+            )
+        cursor = decode_cursor(before) if before else None
+        if cursor is not None:
+            date, pk = cursor
+            queryset = self.object_list.filter(
+                Q(**{f'{field}__gt': date})
+                | Q(**{field: date, f'{pk_field}__gt': pk})
+            ).order_by(field, pk_field)
+            rows = list(queryset[:self.per_page + 1])
+            return KeysetPage(
+                rows[:self.per_page][::-1],
+                self,
+                has_next=True,
+                has_previous=len(rows) > self.per_page,
+            )
+        queryset = self.object_list.order_by(f'-{field}', f'-{pk_field}')
+        rows = list(queryset[:self.per_page + 1])
+        return KeysetPage(
+            rows[:self.per_page],
+            self,
+            has_next=len(rows) > self.per_page,
+            has_previous=False,
+        )
+
+
+class KeysetPage(Sequence):
+    """Page of KeysetPaginator, compatible with includes/paginator.html"""
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Keyset page of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def _cursor(self, obj):
+        return encode_cursor(
+            getattr(obj, self.paginator.date_field),
+            getattr(obj, self.paginator.pk_field),
+        )
 
+    @property
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return self._cursor(self.object_list[-1])
 
-def paginate(post_list, page_number):
-    """Returns page for paginator based on list of posts and page number"""
-    return Paginator(post_list, settings.POSTS_PER_PAGE).get_page(page_number)
+    @property
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        return self._cursor(self.object_list[0])
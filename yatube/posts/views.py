@@ -1,27 +1,40 @@
-from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.utils.http import urlencode
 
+from core import parallel
+
+from . import counters, feed, search, thumbnails
+from .caching import (INDEX_SCOPE, author_scope, cache_feed, conditional,
+                      group_scope)
 from .forms import PostForm, CommentForm
-from .models import Follow, Group, Post, User
-from .utils import paginate
+from .models import Comment, Follow, Group, Post, User
+from .utils import paginate, paginate_comments, paginate_feed
 
 
-@cache_page(settings.CACHE_TIMEOUT, key_prefix='index_page')
+@cache_feed(lambda: INDEX_SCOPE)
 def index(request):
-    post_list = Post.objects.select_related('group', 'author')
-    page_obj = paginate(post_list, request.GET.get('page'))
+    post_list = Post.objects.for_feed()
+    page_obj = paginate_feed(post_list, request.GET)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional(lambda slug: [group_scope(slug)])
+@cache_feed(group_scope)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    page_obj = paginate(post_list, request.GET.get('page'))
+    group = get_object_or_404(Group.objects.select_related('stats'),
+                              slug=slug)
+    post_list = group.posts.for_feed()
+    page_obj = paginate_feed(
+        post_list,
+        request.GET,
+        count=counters.group_stats(group).posts_count,
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -29,18 +42,31 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional(lambda username: [author_scope(username)])
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    if not request.user.is_authenticated:
-        following = False
-    else:
-        following = Follow.objects.filter(
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
+    stats = counters.author_stats(author)
+    post_list = author.posts.for_feed()
+
+    def is_following():
+        return request.user.is_authenticated and Follow.objects.filter(
             user=request.user,
             author=author).exists()
-    post_list = author.posts.all()
-    page_obj = paginate(post_list, request.GET.get('page'))
+
+    def load_page():
+        page = paginate_feed(
+            post_list,
+            request.GET,
+            count=stats.posts_count,
+        )
+        page.object_list = list(page.object_list)
+        return page
+
+    following, page_obj = parallel.run(is_following, load_page)
     context = {
         'author': author,
+        'stats': stats,
         'page_obj': page_obj,
         'following': following,
     }
@@ -48,17 +74,53 @@ def profile(request, username):
 
 
 def post_detail(request, post_id):
-    post = get_object_or_404(Post.objects.select_related(), pk=post_id)
-    comment_list = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.for_detail(),
+        pk=post_id,
+    )
+    comments = paginate_comments(
+        post.comments.select_related('author'),
+        request.GET.get('comments_after'),
+    )
     form = CommentForm()
     context = {
         'post': post,
+        'author_stats': counters.author_stats(post.author),
+        'post_stats': counters.post_stats(post),
         'form': form,
-        'comments': comment_list,
+        'comments': comments,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующая пачка комментариев поста для кнопки «Показать еще»"""
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404('Пост не найден')
+    comments = paginate_comments(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        request.GET.get('after'),
+    )
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def post_search(request):
+    """Найти посты по словам из текста"""
+    query = request.GET.get('q', '').strip()
+    post_list = search.search_posts(query).for_feed()
+    page_obj = paginate(post_list, request.GET.get('page'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'query_prefix': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post.objects.select_related(), pk=post_id)
@@ -68,7 +130,11 @@ def post_edit(request, post_id):
                     files=request.FILES or None,
                     instance=post)
     if form.is_valid():
-        form.save()
+        # Картинка и ссылка на нее сохраняются под одной блокировкой
+        with transaction.atomic():
+            form.save()
+            if 'image' in form.changed_data:
+                thumbnails.enqueue(post)
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'post': post,
@@ -85,7 +151,12 @@ def post_create(request):
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        with transaction.atomic():
+            post.save()
+            if post.image:
+                thumbnails.enqueue(post)
+            if feed.is_enabled():
+                feed.fan_out(post)
         return redirect(f'/profile/{str(post.author)}/')
     context = {
         'form': form,
@@ -108,8 +179,8 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     """Вывести посты авторов из подписки"""
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginate(post_list, request.GET.get('page'))
+    post_list = feed.follow_posts(request.user).for_feed()
+    page_obj = paginate_feed(post_list, request.GET, keys=feed.KEYS)
     context = {
         'page_obj': page_obj,
     }
@@ -122,10 +193,13 @@ def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user == author:
         return redirect('posts:follow_index')
-    Follow.objects.get_or_create(
-        user=request.user,
-        author=author,
-    )
+    with transaction.atomic():
+        _, created = Follow.objects.get_or_create(
+            user=request.user,
+            author=author,
+        )
+        if created and feed.is_enabled():
+            feed.backfill(request.user, author)
     return redirect('posts:follow_index')
 
 
@@ -137,6 +211,8 @@ def profile_unfollow(request, username):
         user=request.user,
         author=author,
     )
-    if to_unsubscribe_author.exists():
-        to_unsubscribe_author.delete()
+    with transaction.atomic():
+        deleted, _ = to_unsubscribe_author.delete()
+        if deleted and feed.is_enabled():
+            feed.trim(request.user, author)
     return redirect('posts:follow_index')
@@ -0,0 +1,23 @@
+// Кнопка «Показать еще» подгружает следующую пачку комментариев
+// на место себя, без перезагрузки страницы
+document.addEventListener('click', function (event) {
+  var button = event.target.closest('.js-load-comments');
+  if (!button) {
+    return;
+  }
+  event.preventDefault();
+  fetch(button.dataset.url)
+    .then(function (response) {
+      if (!response.ok) {
+        throw new Error(response.status);
+      }
+      return response.text();
+    })
+    .then(function (html) {
+      button.insertAdjacentHTML('afterend', html);
+      button.remove();
+    })
+    .catch(function () {
+      window.location = button.href;
+    });
+});
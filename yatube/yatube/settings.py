@@ -35,10 +35,14 @@ INSTALLED_APPS = [
     'posts.apps.PostsConfig',
     'users.apps.UsersConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.SlowQueryLogMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,13 +78,81 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# production keeps connections open between requests and lets readers
+# work during writes, PRAGMAS are applied by core.sqlite
+DATABASE_PROFILE = os.environ.get('YATUBE_DATABASE_PROFILE', 'default')
+
+DATABASE_PROFILES = {
+    'default': {},
+    'production': {
+        'ENGINE': 'core.backends.sqlite3',
+        'CONN_MAX_AGE': 600,
+        # Writers queue for the lock instead of failing, see core.backends
+        'TRANSACTION_MODE': 'IMMEDIATE',
+        'OPTIONS': {
+            # Seconds a writer waits for the lock before "database is locked"
+            'timeout': 20,
+        },
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            # Negative size is in KiB
+            'cache_size': -64 * 1024,
+            'temp_store': 'MEMORY',
+        },
+    },
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        **DATABASE_PROFILES[DATABASE_PROFILE],
     }
 }
 
+# Read-only copies of the database, comma separated paths. Views from
+# REPLICA_VIEWS read models of REPLICA_APPS from them, see core.routers
+DATABASE_REPLICAS = [
+    path for path in os.environ.get('YATUBE_DATABASE_REPLICAS', '').split(',')
+    if path
+]
+
+DATABASES.update({
+    f'replica_{number}': {
+        **DATABASES['default'],
+        'NAME': path,
+        'TEST': {'MIRROR': 'default'},
+    }
+    for number, path in enumerate(DATABASE_REPLICAS)
+})
+
+REPLICA_DATABASES = [
+    f'replica_{number}' for number in range(len(DATABASE_REPLICAS))
+]
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+REPLICA_APPS = {'posts'}
+
+REPLICA_VIEWS = {
+    'posts:index',
+    'posts:group_list',
+    'posts:profile',
+    'posts:post_detail',
+    'posts:post_comments',
+    'posts:post_search',
+    'api:index',
+    'api:group_list',
+    'api:profile',
+    'api:post_detail',
+}
+
+# Seconds a client reads from the primary after its own write,
+# should exceed the replication lag
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -126,21 +198,173 @@ LOGIN_REDIRECT_URL = 'posts:index'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Larger uploads are streamed to a temporary file instead of memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+
+# Where clean_media keeps its position between runs
+MEDIA_GC_STATE_PATH = os.path.join(BASE_DIR, 'media_gc.json')
+
+# clean_media leaves younger files alone: their posts or thumbnail
+# tasks may not have saved a reference to them yet
+MEDIA_GC_MIN_AGE = 60 * 60
+
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 # Number of posts per page
 POSTS_PER_PAGE = 10
 
+# Number of comments shown on a post page and loaded by "show more"
+COMMENTS_PER_PAGE = 20
+
+# Keep materialized follow feeds (fan-out on write) for follow_index
+FOLLOW_FEED_FANOUT = False
+
+# Posts of authors with more followers are merged into feeds on read
+FOLLOW_FEED_FANOUT_LIMIT = 10000
+
+# Number of feed entries inserted by one query
+FOLLOW_FEED_BATCH_SIZE = 1000
+
+# Longest side of stored post images; larger uploads are downscaled
+POST_IMAGE_MAX_SIDE = 2048
+
+# Uploads with more pixels are rejected before decoding
+POST_IMAGE_MAX_PIXELS = 50 * 10 ** 6
+
+# Sizes of post images prepared by the process_thumbnails worker,
+# offered to browsers through srcset
+POST_THUMBNAIL_SIZES = ['360x127', '720x254', '960x339']
+
+# Formats of post images, lightest first; formats the installed Pillow
+# cannot save are skipped, JPEG is always kept as the fallback
+POST_THUMBNAIL_FORMATS = ['avif', 'webp', 'jpeg']
+
+# Processes in the thumbnail worker pool
+POST_THUMBNAIL_WORKERS = os.cpu_count() or 1
+
+# Thumbnails taken from the queue at once
+POST_THUMBNAIL_BATCH_SIZE = 20
+
+# Attempts before a thumbnail is marked as failed
+POST_THUMBNAIL_MAX_ATTEMPTS = 3
+
+# Seconds after which a thumbnail left in processing is queued again
+POST_THUMBNAIL_PROCESSING_TIMEOUT = 300
+
 # Length of returned string with __str__ method for posts
 POST_STRINGER_LENGTH = 15
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
-CACHES = {
-    'default': {
+# locmem keeps a separate cache in every process, sqlite shares one
+# cache file between all processes of the host. Run several workers
+# only with a shared cache: see the posts.W001 deploy check
+CACHE_BACKEND = os.environ.get('YATUBE_CACHE_BACKEND', 'locmem')
+
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'sqlite': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
 
-CACHE_TIMEOUT = 20
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+
+# sorl keeps thumbnail metadata in a SQLite file shared by all processes,
+# so a new worker does not start with an empty store
+THUMBNAIL_KVSTORE = 'core.kvstore.SQLiteKVStore'
+
+THUMBNAIL_KVSTORE_PATH = os.path.join(BASE_DIR, 'thumbnails.sqlite3')
+
+THUMBNAIL_KVSTORE_BUSY_TIMEOUT = 5.0
+
+# Tests keep the sorl store above and the shared cache in a temporary
+# directory
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+# Feed pages are cached until a post in them changes
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+
+# With a per-process cache (locmem) other workers never see the change,
+# so feed pages and post cards expire after this many seconds instead
+FEED_CACHE_LOCAL_TIMEOUT = 20
+
+# Seconds other workers wait for the one rebuilding a feed page
+FEED_CACHE_LOCK_TIMEOUT = 10
+
+FEED_CACHE_POLL_INTERVAL = 0.05
+
+# Rendered post cards live in the cache until their post changes
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Search relevance of a post halves when it is this many days old
+SEARCH_RECENCY_DAYS = 30
+
+# Threads running Django under yatube.asgi, None picks the
+# ThreadPoolExecutor default
+ASGI_THREADS = int(os.environ.get('YATUBE_ASGI_THREADS', 0)) or None
+
+# Independent queries of one view run in parallel threads, see core.parallel
+PARALLEL_QUERIES = os.environ.get('YATUBE_PARALLEL_QUERIES') == '1'
+
+PARALLEL_QUERY_WORKERS = 8
+
+# Share of requests profiled by core.middleware.ProfilingMiddleware,
+# 0 turns profiling off
+PROFILING_SAMPLE_RATE = float(os.environ.get('YATUBE_PROFILING_RATE', 0))
+
+# Profiled requests are also written here, the file rotates at 10 MB
+PROFILING_LOG_FILE = os.environ.get('YATUBE_PROFILING_LOG')
+
+# Queries slower than this many milliseconds are logged with their plan,
+# None turns the log off
+SLOW_QUERY_THRESHOLD_MS = (
+    float(os.environ['YATUBE_SLOW_QUERY_MS'])
+    if os.environ.get('YATUBE_SLOW_QUERY_MS') else None
+)
+
+# Slow queries are written here, the file rotates at 10 MB
+SLOW_QUERY_LOG_FILE = os.environ.get('YATUBE_SLOW_QUERY_LOG')
+
+
+def rotating_file_handler(filename):
+    if not filename:
+        return {'class': 'logging.NullHandler'}
+    return {
+        'class': 'logging.handlers.RotatingFileHandler',
+        'filename': filename,
+        'maxBytes': 10 * 1024 * 1024,
+        'backupCount': 5,
+        'encoding': 'utf-8',
+    }
+
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'profiling': rotating_file_handler(PROFILING_LOG_FILE),
+        'slow_queries': rotating_file_handler(SLOW_QUERY_LOG_FILE),
+    },
+    'loggers': {
+        'yatube.profiling': {
+            'handlers': ['profiling'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'yatube.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}